@@ -9,6 +9,7 @@ from io import BytesIO
 from PIL import Image
 
 from user import user
+from utils import db, drawing_ids, drawing_index, pagination, view_counter
 
 
 def create_drawing(requester):
@@ -51,72 +52,109 @@ def create_drawing(requester):
 
     # Generate unique id for drawing by converting bit string to hexadecimal
     drawing_id = int(bit_string, 2).__format__('016x')
+    stored_id = drawing_ids.to_db(drawing_id)
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor()
 
-    # Check if drawing_id already exists in database (i.e., if user is
-    # submitting a duplicate drawing)
-    cursor.execute(
-        """
-        SELECT EXISTS (
-                       SELECT 1
-                         FROM drawing
-                        WHERE drawing_id = %(drawing_id)s
-                        LIMIT 1
-        );
-        """,
-        {'drawing_id': drawing_id}
-        )
+    # Return error if drawing's hash is within the configured number of bits
+    # of an existing drawing's hash (i.e., if user is submitting a slightly
+    # altered copy of a drawing)
+    threshold = int(os.environ.get('DRAWING_SIMILARITY_THRESHOLD', 0))
 
-    if cursor.fetchone()[0]:
-        cursor.close()
-        conn.close()
+    if threshold:
+        matches = drawing_index.find_similar(cursor, stored_id, threshold)
 
-        return make_response('Drawing already exists', 409)
+        if matches:
+            cursor.close()
+            db.put_conn(conn)
 
-    # Upload drawing to S3 bucket
-    s3 = boto3.resource('s3')
-    bucket_name = os.environ['S3_BUCKET']
-    bucket = s3.Bucket(bucket_name)
-    bucket_folder = os.environ['S3_CANVASHARE_DIR']
+            if matches[0][0] == 0:
+                return make_response('Drawing already exists', 409)
 
-    drawing_name = drawing_id + '.png'
+            return make_response('Similar drawing already exists', 409)
 
-    bucket.put_object(
-        Key=bucket_folder + drawing_name,
-        Body=drawing
-        )
+    bucket_folder = os.environ['S3_CANVASHARE_DIR']
+    drawing_name = drawing_id + '.png'
 
-    # Add drawing to database
+    # Add drawing to database unless drawing_id already exists (i.e., if user
+    # is submitting a duplicate drawing)
     cursor.execute(
         """
         INSERT INTO drawing (drawing_id, member_id, title, url)
-             VALUES (%(drawing_id)s,
-                    (SELECT member_id
-                       FROM cp_user
-                      WHERE LOWER(username) = %(username)s),
-                    %(title)s, %(url)s);
+             VALUES (%(drawing_id)s, %(member_id)s, %(title)s, %(url)s)
+        ON CONFLICT (drawing_id) DO NOTHING
+          RETURNING drawing_id;
         """,
-        {'drawing_id': drawing_id,
-        'username': requester.lower(),
+        {'drawing_id': stored_id,
+        'member_id': user.read_member_id(cursor, requester),
         'title': data['title'].strip(),
         'url': os.environ['S3_URL'] + bucket_folder + drawing_name}
         )
 
+    if not cursor.fetchone():
+        cursor.close()
+        db.put_conn(conn)
+
+        return make_response('Drawing already exists', 409)
+
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
+
+    # Upload drawing to S3 bucket once the connection is returned to pool, so
+    # that no connection or row lock is held during the upload; the drawing is
+    # uploaded after it is saved so that a duplicate drawing never overwrites
+    # the existing drawing's file
+    s3 = boto3.resource('s3')
+    bucket_name = os.environ['S3_BUCKET']
+    bucket = s3.Bucket(bucket_name)
+
+    try:
+        bucket.put_object(
+            Key=bucket_folder + drawing_name,
+            Body=drawing
+            )
+
+    # Remove saved drawing if upload fails
+    except Exception:
+        conn = db.get_conn()
+
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            DELETE FROM drawing
+                  WHERE drawing_id = %(drawing_id)s;
+            """,
+            {'drawing_id': stored_id}
+            )
+
+        conn.commit()
+
+        cursor.close()
+        db.put_conn(conn)
+
+        raise
+
+    # Add drawing to index used for finding similar drawings
+    drawing_index.add(stored_id)
 
     return make_response(drawing_id, 201)
 
 
 def read_drawing(drawing_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Return error if drawing id is not a 64-bit hexadecimal number
+    stored_id = drawing_ids.to_db(drawing_id)
+
+    if stored_id is None:
+        return make_response('Not found', 404)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
@@ -124,24 +162,30 @@ def read_drawing(drawing_id):
     cursor.execute(
         """
         SELECT drawing.created, drawing.drawing_id, drawing.title, drawing.url,
-               drawing.views, cp_user.username
+               drawing.views, drawing.like_count, cp_user.username
           FROM drawing, cp_user
          WHERE drawing_id = %(drawing_id)s
                AND drawing.member_id = cp_user.member_id;
         """,
-        {'drawing_id': drawing_id}
+        {'drawing_id': stored_id}
         )
 
     drawing_data = cursor.fetchone()
 
     # Return error if drawing not found
     if not drawing_data:
+        cursor.close()
+        db.put_conn(conn)
+
         return make_response('Not found', 404)
 
-    # Otherwise, convert drawing data to dictionary
+    # Otherwise, convert drawing data to dictionary and include views not yet
+    # flushed to database
     drawing_data = dict(drawing_data)
+    drawing_data['drawing_id'] = drawing_ids.to_api(stored_id)
+    drawing_data['views'] += view_counter.pending_views(stored_id)
 
-    # Get drawing's likers and like count from database
+    # Get drawing's likers from database
     cursor.execute(
         """
         SELECT drawing_like.drawing_like_id, cp_user.username
@@ -149,7 +193,7 @@ def read_drawing(drawing_id):
          WHERE drawing_id = %(drawing_id)s
                AND drawing_like.member_id = cp_user.member_id;
         """,
-        {'drawing_id': drawing_id}
+        {'drawing_id': stored_id}
         )
 
     drawing_data['likers'] = []
@@ -157,145 +201,301 @@ def read_drawing(drawing_id):
     for row in cursor.fetchall():
         drawing_data['likers'].append(dict(row))
 
-    drawing_data['like_count'] = len(drawing_data['likers'])
-
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     # Return drawing data to client
     return jsonify(drawing_data)
 
 
 def update_drawing(drawing_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Return error if drawing id is not a 64-bit hexadecimal number
+    stored_id = drawing_ids.to_db(drawing_id)
+
+    if stored_id is None:
+        return make_response('Not found', 404)
+
+    # Check that drawing exists unless this worker has already seen it
+    if not view_counter.is_known(stored_id):
+        # Borrow database connection from pool
+        conn = db.get_conn()
+
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT EXISTS (
+                           SELECT 1
+                             FROM drawing
+                            WHERE drawing_id = %(drawing_id)s
+                            LIMIT 1
+            );
+            """,
+            {'drawing_id': stored_id}
+            )
+
+        drawing = cursor.fetchone()[0]
+
+        cursor.close()
+        db.put_conn(conn)
+
+        # Return error if drawing not found
+        if not drawing:
+            return make_response('Not found', 404)
+
+    # Buffer view in memory; buffered views are added to the drawing's views in
+    # the database in periodic batches
+    view_counter.record_view(stored_id)
+
+    return make_response('Success', 200)
+
+
+def delete_drawing(requester, drawing_id):
+    # Return error if drawing id is not a 64-bit hexadecimal number
+    stored_id = drawing_ids.to_db(drawing_id)
+
+    if stored_id is None:
+        return make_response('Not found', 404)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor()
 
-    # Retrieve current drawing views from database
+    # Delete drawing from database if requester is the artist, getting whether
+    # drawing exists and requester is the artist
     cursor.execute(
         """
-        SELECT views
-          FROM drawing
-         WHERE drawing_id = %(drawing_id)s;
+          WITH target AS (
+                          SELECT drawing.drawing_id,
+                                 LOWER(cp_user.username) = %(username)s
+                                     AS is_artist
+                            FROM drawing, cp_user
+                           WHERE drawing.drawing_id = %(drawing_id)s
+                                 AND drawing.member_id = cp_user.member_id
+               ),
+               deleted AS (
+                           DELETE FROM drawing
+                                 USING target
+                                 WHERE drawing.drawing_id = target.drawing_id
+                                       AND target.is_artist
+               )
+        SELECT is_artist
+          FROM target;
         """,
-        {'drawing_id': drawing_id}
+        {'drawing_id': stored_id,
+        'username': requester.lower()}
         )
 
-    drawing_views = cursor.fetchone()
+    drawing = cursor.fetchone()
 
     # Return error if drawing not found
-    if not drawing_views:
+    if not drawing:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
-    # Increment views for drawing in database
-    cursor.execute(
-        """
-        UPDATE drawing
-           SET views = %(views)s
-         WHERE drawing_id = %(drawing_id)s;
-        """,
-        {'views': drawing_views[0] + 1,
-        'drawing_id': drawing_id}
-        )
+    # Return error if requester is not the artist
+    if not drawing[0]:
+        cursor.close()
+        db.put_conn(conn)
+
+        return make_response('Unauthorized', 401)
 
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
+
+    delete_drawing_files([stored_id])
 
     return make_response('Success', 200)
 
 
-def delete_drawing(requester, drawing_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+def delete_drawing_files(stored_ids):
+    # Clean up after drawings whose rows were deleted from the database; called
+    # after the deleting connection is returned to pool, so that no connection
+    # is held while S3 is called
+    s3 = boto3.resource('s3')
+    bucket_name = os.environ['S3_BUCKET']
+    bucket_folder = os.environ['S3_CANVASHARE_DIR']
+
+    for stored_id in stored_ids:
+        # Discard views buffered for drawing and remove drawing from index
+        # used for finding similar drawings
+        view_counter.forget(stored_id)
+        drawing_index.remove(stored_id)
+
+        # Remove drawing from S3 bucket
+        drawing_name = drawing_ids.to_api(stored_id) + '.png'
+
+        s3.Object(bucket_name, bucket_folder + drawing_name).delete()
+
+
+def read_similar_drawings(drawing_id):
+    # Return error if drawing id is not a 64-bit hexadecimal number
+    stored_id = drawing_ids.to_db(drawing_id)
+
+    if stored_id is None:
+        return make_response('Not found', 404)
+
+    # Get requested page of similar drawings from query parameters
+    page, error = pagination.read_page(10, 'int', 'hex')
+
+    if error:
+        return error
+
+    # Get maximum number of bits that similar drawings' hashes can differ by
+    # from query parameters, returning error if distance query parameter is
+    # not an integer or is out of range
+    try:
+        max_distance = int(request.args.get(
+            'distance', os.environ.get('DRAWING_SIMILAR_DISTANCE', 10)
+            ))
+    except ValueError:
+        return make_response('Distance param must be between 0 and 64', 400)
+
+    if max_distance < 0 or max_distance > 64:
+        return make_response('Distance param must be between 0 and 64', 400)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Get drawing from database
+    # Verify that drawing exists
     cursor.execute(
         """
-        SELECT drawing.*, cp_user.username
-          FROM drawing, cp_user
-         WHERE drawing_id = %(drawing_id)s
-               AND drawing.member_id = cp_user.member_id;
+        SELECT EXISTS (
+                       SELECT 1
+                         FROM drawing
+                        WHERE drawing_id = %(drawing_id)s
+                        LIMIT 1
+        );
         """,
-        {'drawing_id': drawing_id}
+        {'drawing_id': stored_id}
         )
 
-    drawing = cursor.fetchone()
+    drawing = cursor.fetchone()[0]
 
     # Return error if drawing not found
     if not drawing:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
-    # Otherwise, convert drawing to dictionary
-    drawing = dict(drawing)
+    # Get other drawings within distance, ordered by distance and then by
+    # drawing id
+    matches = []
 
-    # Return error if requester is not the artist
-    if requester.lower() != drawing['username'].lower():
-        cursor.close()
-        conn.close()
+    similar = drawing_index.find_similar(cursor, stored_id, max_distance)
 
-        return make_response('Unauthorized', 401)
+    for match_distance, match_id in similar:
+        if match_id != stored_id:
+            matches.append(
+                (match_distance, drawing_ids.to_api(match_id), match_id)
+                )
+
+    matches.sort()
+
+    # Skip matches up to and including last match on previous page
+    if page['after_id'] is not None:
+        matches = [match for match in matches
+            if match[:2] > (page['after_key'], page['after_id'])]
 
-    # Delete drawing from database
+    matches = matches[page['offset']:page['offset'] + page['limit']]
+
+    # Retrieve matched drawings with each drawing's likers from database
     cursor.execute(
         """
-        DELETE FROM drawing
-              WHERE drawing_id = %(drawing_id)s;
+        SELECT drawing.created, drawing.drawing_id, drawing.title, drawing.url,
+               drawing.views, drawing.like_count, cp_user.username,
+               COALESCE((
+                        SELECT json_agg(json_build_object(
+                                   'drawing_like_id',
+                                   drawing_like.drawing_like_id,
+                                   'username', liker.username
+                                   ) ORDER BY drawing_like.drawing_like_id)
+                          FROM drawing_like, cp_user AS liker
+                         WHERE drawing_like.drawing_id = drawing.drawing_id
+                               AND drawing_like.member_id = liker.member_id
+               ), '[]') AS likers
+          FROM drawing, cp_user
+         WHERE drawing.drawing_id = ANY(%(drawing_ids)s)
+               AND drawing.member_id = cp_user.member_id;
         """,
-        {'drawing_id': drawing_id}
+        {'drawing_ids': [match[2] for match in matches]}
         )
 
-    conn.commit()
+    drawings_by_id = {}
+
+    for row in cursor.fetchall():
+        drawings_by_id[row['drawing_id']] = dict(row)
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    # Remove drawing from S3 bucket
-    s3 = boto3.resource('s3')
-    bucket_name = os.environ['S3_BUCKET']
-    bucket_folder = os.environ['S3_CANVASHARE_DIR']
+    # Order drawings by distance, including each drawing's distance and views
+    # not yet flushed to database
+    drawings = []
 
-    drawing_name = str(drawing_id) + '.png'
+    for match_distance, match_hex_id, match_id in matches:
+        if match_id in drawings_by_id:
+            drawing = drawings_by_id[match_id]
+            drawing['distance'] = match_distance
+            drawing['drawing_id'] = match_hex_id
+            drawing['views'] += view_counter.pending_views(match_id)
 
-    s3.Object(bucket_name, bucket_folder + drawing_name).delete()
+            drawings.append(drawing)
 
-    return make_response('Success', 200)
+    drawings, next_cursor = pagination.split_page(
+        drawings, page, 'distance', 'drawing_id'
+        )
+
+    return pagination.page_response(drawings, page, next_cursor)
 
 
 def read_drawings():
-    # Get number of requested drawings from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of drawings from query parameters
+    page, error = pagination.read_page(10)
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    if error:
+        return error
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve drawings from database
+    # Retrieve requested page of drawings with each drawing's likers from
+    # database
     cursor.execute(
         """
           SELECT drawing.created, drawing.drawing_id, drawing.title,
-                 drawing.url, drawing.views, cp_user.username
+                 drawing.url, drawing.views, drawing.like_count,
+                 cp_user.username,
+                 COALESCE((
+                          SELECT json_agg(json_build_object(
+                                     'drawing_like_id',
+                                     drawing_like.drawing_like_id,
+                                     'username', liker.username
+                                     ) ORDER BY drawing_like.drawing_like_id)
+                            FROM drawing_like, cp_user AS liker
+                           WHERE drawing_like.drawing_id = drawing.drawing_id
+                                 AND drawing_like.member_id = liker.member_id
+                 ), '[]') AS likers
             FROM drawing, cp_user
            WHERE drawing.member_id = cp_user.member_id
-        ORDER BY created DESC;
-        """
+                 AND (%(after_id)s IS NULL
+                      OR (drawing.created, drawing.drawing_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY drawing.created DESC, drawing.drawing_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
+        """,
+        page
         )
 
     drawings = []
@@ -303,57 +503,62 @@ def read_drawings():
     for row in cursor.fetchall():
         drawings.append(dict(row))
 
-    # Get each drawing's likers and like count from database
-    for drawing in drawings:
-        cursor.execute(
-            """
-            SELECT drawing_like.drawing_like_id, cp_user.username
-              FROM drawing_like, cp_user
-             WHERE drawing_id = %(drawing_id)s
-                   AND drawing_like.member_id = cp_user.member_id;
-            """,
-            {'drawing_id': drawing['drawing_id']}
-            )
-
-        drawing['likers'] = []
-
-        for row in cursor.fetchall():
-            drawing['likers'].append(dict(row))
+    drawings, next_cursor = pagination.split_page(
+        drawings, page, 'created', 'drawing_id'
+        )
 
-        drawing['like_count'] = len(drawing['likers'])
+    # Include views not yet flushed to database and convert drawing ids to
+    # hexadecimal
+    for drawing in drawings:
+        drawing['views'] += view_counter.pending_views(drawing['drawing_id'])
+        drawing['drawing_id'] = drawing_ids.to_api(drawing['drawing_id'])
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(drawings[request_start:request_end])
+    return pagination.page_response(drawings, page, next_cursor)
 
 
 def read_drawings_for_one_user(artist_name):
-    # Get number of requested drawings from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of drawings from query parameters
+    page, error = pagination.read_page(10)
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    if error:
+        return error
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve drawings from database
+    # Retrieve requested page of drawings with each drawing's likers from
+    # database
     cursor.execute(
         """
           SELECT drawing.created, drawing.drawing_id, drawing.title,
-                 drawing.url, drawing.views, cp_user.username
+                 drawing.url, drawing.views, drawing.like_count,
+                 cp_user.username,
+                 COALESCE((
+                          SELECT json_agg(json_build_object(
+                                     'drawing_like_id',
+                                     drawing_like.drawing_like_id,
+                                     'username', liker.username
+                                     ) ORDER BY drawing_like.drawing_like_id)
+                            FROM drawing_like, cp_user AS liker
+                           WHERE drawing_like.drawing_id = drawing.drawing_id
+                                 AND drawing_like.member_id = liker.member_id
+                 ), '[]') AS likers
             FROM drawing, cp_user
            WHERE LOWER(cp_user.username) = %(username)s
                  AND drawing.member_id = cp_user.member_id
-        ORDER BY created DESC;
+                 AND (%(after_id)s IS NULL
+                      OR (drawing.created, drawing.drawing_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY drawing.created DESC, drawing.drawing_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
         """,
-        {'username': artist_name.lower()}
+        dict(page, username=artist_name.lower())
         )
 
     drawings = []
@@ -361,29 +566,20 @@ def read_drawings_for_one_user(artist_name):
     for row in cursor.fetchall():
         drawings.append(dict(row))
 
-    # Get each drawing's likers and like count from database
-    for drawing in drawings:
-        cursor.execute(
-            """
-            SELECT drawing_like.drawing_like_id, cp_user.username
-              FROM drawing_like, cp_user
-             WHERE drawing_id = %(drawing_id)s
-                   AND drawing_like.member_id = cp_user.member_id;
-            """,
-            {'drawing_id': drawing['drawing_id']}
-            )
-
-        drawing['likers'] = []
-
-        for row in cursor.fetchall():
-            drawing['likers'].append(dict(row))
+    drawings, next_cursor = pagination.split_page(
+        drawings, page, 'created', 'drawing_id'
+        )
 
-        drawing['like_count'] = len(drawing['likers'])
+    # Include views not yet flushed to database and convert drawing ids to
+    # hexadecimal
+    for drawing in drawings:
+        drawing['views'] += view_counter.pending_views(drawing['drawing_id'])
+        drawing['drawing_id'] = drawing_ids.to_api(drawing['drawing_id'])
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(drawings[request_start:request_end])
+    return pagination.page_response(drawings, page, next_cursor)
 
 
 def create_drawing_like(requester):
@@ -399,90 +595,68 @@ def create_drawing_like(requester):
     if not data['drawing_id'] or not isinstance(data['drawing_id'], str):
         return make_response('Drawing id must be a string', 400)
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Return error if drawing id is not a 64-bit hexadecimal number
+    stored_id = drawing_ids.to_db(data['drawing_id'])
+
+    if stored_id is None:
+        return make_response('Not found', 404)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor()
 
-    # Verify that drawing exists
+    # Add drawing like to database if drawing exists and user did not like
+    # drawing previously, getting whether drawing exists
     cursor.execute(
         """
+          WITH inserted AS (
+                            INSERT INTO drawing_like (member_id, drawing_id)
+                                 SELECT %(member_id)s::UUID, drawing_id
+                                   FROM drawing
+                                  WHERE drawing_id = %(drawing_id)s
+                            ON CONFLICT (drawing_id, member_id) DO NOTHING
+                              RETURNING drawing_like_id
+               )
         SELECT EXISTS (
                        SELECT 1
                          FROM drawing
                         WHERE drawing_id = %(drawing_id)s
-                        LIMIT 1
-        );
+               ),
+               (SELECT drawing_like_id
+                  FROM inserted);
         """,
-        {'drawing_id': data['drawing_id']}
+        {'member_id': user.read_member_id(cursor, requester),
+        'drawing_id': stored_id}
         )
 
-    drawing = cursor.fetchone()[0]
+    drawing, drawing_like_id = cursor.fetchone()
 
     # Return error if drawing not found
     if not drawing:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
-    # Verify that user did not like drawing previously
-    cursor.execute(
-        """
-        SELECT EXISTS (
-                       SELECT 1
-                         FROM drawing_like
-                        WHERE drawing_id = %(drawing_id)s
-                              AND member_id = (
-                                               SELECT member_id
-                                                 FROM cp_user
-                                                WHERE LOWER(username) =
-                                                      %(username)s
-                              )
-                        LIMIT 1
-        );
-        """,
-        {'drawing_id': data['drawing_id'],
-        'username': requester.lower()}
-        )
-
-    drawing_like = cursor.fetchone()[0]
-
-    if drawing_like:
+    # Return error if user liked drawing previously
+    if not drawing_like_id:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('User already liked drawing', 400)
 
-    # Add drawing like to database
-    cursor.execute(
-        """
-        INSERT INTO drawing_like (member_id, drawing_id)
-             VALUES (
-                     (SELECT member_id
-                        FROM cp_user
-                       WHERE LOWER(username) = %(username)s),
-                     %(drawing_id)s
-             )
-          RETURNING drawing_like_id;
-        """,
-        {'username': requester.lower(),
-        'drawing_id': data['drawing_id']}
-        )
-
-    drawing_like_id = cursor.fetchone()[0]
-
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response(str(drawing_like_id), 201)
 
 
 def read_drawing_like(drawing_like_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
@@ -501,7 +675,7 @@ def read_drawing_like(drawing_like_id):
     drawing_like = cursor.fetchone()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     # Return error if drawing like not found
     if not drawing_like:
@@ -509,25 +683,42 @@ def read_drawing_like(drawing_like_id):
 
     # Otherwise, convert drawing like data to dictionary
     drawing_like = dict(drawing_like)
+    drawing_like['drawing_id'] = drawing_ids.to_api(drawing_like['drawing_id'])
 
     return jsonify(drawing_like)
 
 
 def delete_drawing_like(requester, drawing_like_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
-    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+    cursor = conn.cursor()
 
-    # Verify that user liked drawing previously
+    # Delete like for drawing from database if requester is the liker, getting
+    # whether drawing like exists and requester is the liker
     cursor.execute(
         """
-        SELECT drawing_like.*, cp_user.username
-          FROM drawing_like, cp_user
-         WHERE drawing_like_id = %(drawing_like_id)s
-               AND drawing_like.member_id = cp_user.member_id;
+          WITH target AS (
+                          SELECT drawing_like.drawing_like_id,
+                                 LOWER(cp_user.username) = %(username)s
+                                     AS is_liker
+                            FROM drawing_like, cp_user
+                           WHERE drawing_like.drawing_like_id =
+                                 %(drawing_like_id)s
+                                 AND drawing_like.member_id = cp_user.member_id
+               ),
+               deleted AS (
+                           DELETE FROM drawing_like
+                                 USING target
+                                 WHERE drawing_like.drawing_like_id =
+                                       target.drawing_like_id
+                                       AND target.is_liker
+               )
+        SELECT is_liker
+          FROM target;
         """,
-        {'drawing_like_id': drawing_like_id}
+        {'drawing_like_id': drawing_like_id,
+        'username': requester.lower()}
         )
 
     drawing_like = cursor.fetchone()
@@ -535,53 +726,44 @@ def delete_drawing_like(requester, drawing_like_id):
     # Return error if user did not like drawing previously
     if not drawing_like:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('User did not like drawing', 400)
 
-    # Otherwise, convert drawing_like to dictionary
-    drawing_like = dict(drawing_like)
-
     # Return error if requester is not the liker
-    if requester.lower() != drawing_like['username'].lower():
+    if not drawing_like[0]:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Unauthorized', 401)
 
-    # Delete like for drawing in database
-    cursor.execute(
-        """
-        DELETE FROM drawing_like
-              WHERE drawing_like_id = %(drawing_like_id)s;
-        """,
-        {'drawing_like_id': drawing_like_id}
-        )
-
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response('Success', 200)
 
 
 def read_drawing_likes(drawing_id):
-    # Get number of requested drawing likes from query parameters, using
-    # default if null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Return error if drawing id is not a 64-bit hexadecimal number
+    stored_id = drawing_ids.to_db(drawing_id)
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    if stored_id is None:
+        return make_response('Not found', 404)
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Get requested page of drawing likes from query parameters
+    page, error = pagination.read_page(10)
+
+    if error:
+        return error
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve drawing likes from database
+    # Retrieve requested page of drawing likes from database
     cursor.execute(
         """
           SELECT drawing_like.created, drawing_like.drawing_id,
@@ -590,9 +772,14 @@ def read_drawing_likes(drawing_id):
            WHERE drawing_like.drawing_id = %(drawing_id)s
                  AND drawing_like.member_id = cp_user.member_id
                  AND drawing_like.drawing_id = drawing.drawing_id
-        ORDER BY created DESC;
+                 AND (%(after_id)s IS NULL
+                      OR (drawing_like.created, drawing_like.drawing_like_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY drawing_like.created DESC, drawing_like.drawing_like_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
         """,
-        {'drawing_id': drawing_id}
+        dict(page, drawing_id=stored_id)
         )
 
     drawing_likes = []
@@ -600,40 +787,63 @@ def read_drawing_likes(drawing_id):
     for row in cursor.fetchall():
         drawing_likes.append(dict(row))
 
+    drawing_likes, next_cursor = pagination.split_page(
+        drawing_likes, page, 'created', 'drawing_like_id'
+        )
+
+    # Convert drawing ids to hexadecimal
+    for drawing_like in drawing_likes:
+        drawing_like['drawing_id'] = drawing_ids.to_api(stored_id)
+
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(drawing_likes[request_start:request_end])
+    return pagination.page_response(drawing_likes, page, next_cursor)
 
 
 def read_drawing_likes_for_one_user(liker_name):
-    # Get number of requested drawings from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of drawing likes from query parameters
+    page, error = pagination.read_page(10)
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    if error:
+        return error
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve drawing likes from database
+    # Retrieve requested page of drawing likes with each drawing's artist and
+    # likers from database
     cursor.execute(
         """
           SELECT drawing_like.created, drawing_like.drawing_like_id,
                  drawing.drawing_id, drawing.url, drawing.title, drawing.views,
-                 drawing.member_id, cp_user.username
-            FROM drawing_like, drawing, cp_user
+                 drawing.like_count, artist.username AS artist_name,
+                 cp_user.username,
+                 COALESCE((
+                          SELECT json_agg(json_build_object(
+                                     'drawing_like_id',
+                                     other_like.drawing_like_id,
+                                     'username', liker.username
+                                     ) ORDER BY other_like.drawing_like_id)
+                            FROM drawing_like AS other_like, cp_user AS liker
+                           WHERE other_like.drawing_id = drawing.drawing_id
+                                 AND other_like.member_id = liker.member_id
+                 ), '[]') AS likers
+            FROM drawing_like, drawing, cp_user, cp_user AS artist
            WHERE LOWER(cp_user.username) = %(username)s
                  AND drawing_like.drawing_id = drawing.drawing_id
                  AND drawing_like.member_id = cp_user.member_id
-        ORDER BY drawing_like.created DESC;
+                 AND drawing.member_id = artist.member_id
+                 AND (%(after_id)s IS NULL
+                      OR (drawing_like.created, drawing_like.drawing_like_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY drawing_like.created DESC, drawing_like.drawing_like_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
         """,
-        {'username': liker_name.lower()}
+        dict(page, username=liker_name.lower())
         )
 
     drawing_likes = []
@@ -641,39 +851,21 @@ def read_drawing_likes_for_one_user(liker_name):
     for row in cursor.fetchall():
         drawing_likes.append(dict(row))
 
-    # Replace each drawing artist's member id with username and get each
-    # drawing's likers and like count from database
+    drawing_likes, next_cursor = pagination.split_page(
+        drawing_likes, page, 'created', 'drawing_like_id'
+        )
+
+    # Include views not yet flushed to database and convert drawing ids to
+    # hexadecimal
     for drawing_like in drawing_likes:
-        cursor.execute(
-            """
-            SELECT username
-              FROM cp_user
-             WHERE member_id = %(member_id)s;
-            """,
-            {'member_id': drawing_like['member_id']}
+        drawing_like['views'] += view_counter.pending_views(
+            drawing_like['drawing_id']
             )
-
-        drawing_like.pop('member_id')
-        drawing_like['artist_name'] = cursor.fetchone()[0]
-
-        cursor.execute(
-            """
-            SELECT drawing_like.drawing_like_id, cp_user.username
-              FROM drawing_like, cp_user
-             WHERE drawing_id = %(drawing_id)s
-                   AND drawing_like.member_id = cp_user.member_id;
-            """,
-            {'drawing_id': drawing_like['drawing_id']}
+        drawing_like['drawing_id'] = drawing_ids.to_api(
+            drawing_like['drawing_id']
             )
 
-        drawing_like['likers'] = []
-
-        for row in cursor.fetchall():
-            drawing_like['likers'].append(dict(row))
-
-        drawing_like['like_count'] = len(drawing_like['likers'])
-
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(drawing_likes[request_start:request_end])
+    return pagination.page_response(drawing_likes, page, next_cursor)
@@ -5,35 +5,57 @@ import psycopg2.extras
 
 from flask import jsonify, make_response, request
 
+from utils import db, pagination
+
 
 def read_ideas():
-    # Get number of requested posts from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of posts from query parameters
+    page, error = pagination.read_page(10)
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    if error:
+        return error
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve posts from database
+    # Retrieve requested page of posts with each post's public content versions
+    # from database
     cursor.execute(
         """
           SELECT post.created, post.modified, post.post_id,
-                 post_content.public, cp_user.username
+                 post_content.public, cp_user.username,
+                 post_content.content, post_content.title,
+                 COALESCE((
+                          SELECT json_agg(json_build_object(
+                                     'content', past_content.content,
+                                     'created', to_char(
+                                         past_content.created
+                                         AT TIME ZONE 'UTC',
+                                         'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"'
+                                         ),
+                                     'title', past_content.title
+                                     ) ORDER BY past_content.version)
+                            FROM post_content AS past_content
+                           WHERE past_content.post_id = post.post_id
+                                 AND past_content.version != post.version
+                                 AND past_content.public = TRUE
+                 ), '[]') AS history
             FROM post, post_content, cp_user
            WHERE cp_user.is_owner = TRUE
                  AND public = TRUE
-                 AND post_content.created = post.modified
+                 AND post_content.version = post.version
                  AND post_content.post_id = post.post_id
                  AND post.member_id = cp_user.member_id
-        ORDER BY created DESC;
-        """
+                 AND (%(after_id)s IS NULL
+                      OR (post.created, post.post_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY post.created DESC, post.post_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
+        """,
+        page
         )
 
     posts = []
@@ -41,36 +63,14 @@ def read_ideas():
     for row in cursor.fetchall():
         posts.append(dict(row))
 
-    # Retrieve each post's public content versions from database
-    for post in posts:
-        cursor.execute(
-            """
-            SELECT content, created, title
-              FROM post_content
-             WHERE post_id = %(post_id)s
-                   AND public = TRUE;
-            """,
-            {'post_id': post['post_id']}
-            )
-
-        post['history'] = []
-
-        for row in cursor.fetchall():
-            row = dict(row)
-
-            # Set current post content, public, and title items
-            if row['created'] == post['modified']:
-                post['content'] = row['content']
-                post['title'] = row['title']
-
-            # Add rest of post versions to history item
-            else:
-                post['history'].append(row)
+    posts, next_cursor = pagination.split_page(
+        posts, page, 'created', 'post_id'
+        )
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(posts[request_start:request_end])
+    return pagination.page_response(posts, page, next_cursor)
 
 
 def read_photos():
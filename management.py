@@ -3,10 +3,12 @@ import argparse
 import bcrypt
 import boto3
 import getpass
+import importlib
 import json
 import os
 import pathlib
 import psycopg2 as pg
+import re
 import subprocess
 
 from base64 import decodebytes
@@ -15,6 +17,8 @@ from datetime import datetime, timezone
 from io import BytesIO
 from PIL import Image
 
+from utils import drawing_ids, drawing_index
+
 
 def initialize_database():
     # Set up database connection with environment variable
@@ -169,11 +173,400 @@ def initialize_database():
     cursor.close()
     conn.close()
 
+    # Apply schema migrations made since the tables above were defined,
+    # including ones that rewrite whole tables, since the tables are empty
+    migrate(maintenance=True)
+
     print('Database ' + os.environ['DB_NAME'] + ' initialized successfully.')
 
     return
 
 
+def load_migrations():
+    # Get migration modules from migrations folder in order of version number,
+    # which is the numeric prefix of each module's filename (e.g.,
+    # "0002_api_indexes.py")
+    migrations_dir = pathlib.Path(__file__).parent / 'migrations'
+
+    migrations = []
+
+    for path in sorted(migrations_dir.glob('[0-9]*.py')):
+        version, name = path.stem.split('_', 1)
+
+        migrations.append({
+            'version': version,
+            'name': name,
+            'module': importlib.import_module('migrations.' + path.stem)
+            })
+
+    return migrations
+
+
+def create_migration_table(cursor):
+    # Create table that records which migrations have been applied, and
+    # whether each one's backfills have finished
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migration (
+            PRIMARY KEY (version),
+            version          TEXT        NOT NULL,
+            name             TEXT        NOT NULL,
+            applied          TIMESTAMPTZ DEFAULT now() NOT NULL,
+            backfill_pending BOOLEAN     DEFAULT FALSE NOT NULL
+        );
+        """
+        )
+
+    # Upgrade table created when applied times were stored as formatted TEXT
+    cursor.execute(
+        """
+        SELECT data_type
+          FROM information_schema.columns
+         WHERE table_name = 'schema_migration'
+               AND column_name = 'applied';
+        """
+        )
+
+    if cursor.fetchone()[0] == 'text':
+        cursor.execute(
+            """
+            ALTER TABLE schema_migration
+                  ALTER COLUMN applied DROP DEFAULT,
+                  ALTER COLUMN applied TYPE TIMESTAMPTZ
+                      USING applied::TIMESTAMPTZ,
+                  ALTER COLUMN applied SET DEFAULT now(),
+                    ADD COLUMN IF NOT EXISTS backfill_pending BOOLEAN
+                        DEFAULT FALSE NOT NULL;
+            """
+            )
+
+
+def run_backfills(cursor, migration, batch_size):
+    # Backfill existing rows in small batches, each committed on its own, so
+    # that no lock is held on a large part of a table for long; each backfill
+    # processes the batch_size rows after last_id in primary key order and
+    # returns the last id in its batch, which the next batch starts after,
+    # until a batch is empty, so every row is read once; backfills must be
+    # safe to run again, so that backfills interrupted partway through are
+    # finished by running them from the start
+    for backfill in getattr(migration['module'], 'backfills', []):
+        last_id = None
+
+        while True:
+            cursor.execute(backfill,
+                {'batch_size': batch_size, 'last_id': last_id})
+            last_id = cursor.fetchone()[0]
+
+            if last_id is None:
+                break
+
+    cursor.execute(
+        """
+        UPDATE schema_migration
+           SET backfill_pending = FALSE
+         WHERE version = %(version)s;
+        """,
+        {'version': migration['version']}
+        )
+
+
+def migrate(dry_run=False, maintenance=False):
+    # Set up database connection with environment variable
+    conn = pg.connect(os.environ['DB_CONNECTION'])
+    conn.autocommit = True
+
+    cursor = conn.cursor()
+
+    create_migration_table(cursor)
+
+    # Hold lock for the whole run so that servers starting at the same time
+    # do not apply the same migration twice
+    cursor.execute("SELECT pg_advisory_lock(hashtext('schema_migration'));")
+
+    try:
+        cursor.execute(
+            """
+            SELECT version, backfill_pending
+              FROM schema_migration;
+            """
+            )
+
+        applied = dict(cursor.fetchall())
+
+        migrations = load_migrations()
+
+        pending = [migration for migration in migrations
+            if migration['version'] not in applied]
+
+        # Migrations whose statements were applied but whose backfills were
+        # interrupted
+        unfinished = [migration for migration in migrations
+            if applied.get(migration['version'])]
+
+        batch_size = int(os.environ.get('MIGRATION_BATCH_SIZE', 1000))
+
+        for migration in unfinished:
+            if dry_run:
+                print('Would finish backfills of migration ' +
+                    migration['version'] + ' ' + migration['name'])
+                continue
+
+            print('Finishing backfills of migration ' + migration['version'] +
+                ' ' + migration['name'] + '...')
+
+            run_backfills(cursor, migration, batch_size)
+
+        for migration in pending:
+            # Stop before a migration that must be applied with the server
+            # stopped (e.g., one that rewrites whole tables) unless it was
+            # asked for explicitly, so that the automatic migration run in the
+            # release phase fails and the new version is not deployed while
+            # the old one is still serving requests; later migrations may
+            # depend on it, so they are not applied either
+            if (getattr(migration['module'], 'maintenance', False)
+                    and not maintenance and not dry_run):
+                raise SystemExit('Migration ' + migration['version'] + ' ' +
+                    migration['name'] + ' must be applied during a ' +
+                    'maintenance window: stop the server and run ' +
+                    '`python management.py migrate --maintenance`')
+
+            apply_migration(conn, cursor, migration, batch_size, dry_run)
+
+    finally:
+        # Release lock even if a migration fails, so that the next run is not
+        # left waiting; closing the connection also releases it
+        try:
+            cursor.execute(
+                "SELECT pg_advisory_unlock(hashtext('schema_migration'));"
+                )
+        except pg.Error:
+            pass
+
+        conn.close()
+
+    if not pending and not unfinished:
+        print('No migrations to apply.')
+    elif not dry_run:
+        print('Applied ' + str(len(pending)) + ' migrations successfully.')
+
+    return
+
+
+def apply_migration(conn, cursor, migration, batch_size, dry_run=False):
+    module = migration['module']
+    atomic = getattr(module, 'atomic', True)
+    backfills = getattr(module, 'backfills', [])
+    maintenance = getattr(module, 'maintenance', False)
+
+    # Print migration's statements instead of running them for a dry run
+    if dry_run:
+        print('Would apply migration ' + migration['version'] + ' ' +
+            migration['name'] + (' (in a transaction)' if atomic
+            else ' (statement by statement)') +
+            (' during a maintenance window' if maintenance else '') + ':')
+
+        for statement in module.statements:
+            print(statement)
+
+        for backfill in backfills:
+            print('In batches of ' + str(batch_size) + ':' + backfill)
+
+        return
+
+    print('Applying migration ' + migration['version'] + ' ' +
+        migration['name'] + '...')
+
+    # Drop this migration's indexes left invalid by an interrupted concurrent
+    # build so that they are built again instead of skipped
+    if not atomic:
+        index_names = re.findall(
+            r'INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)',
+            ' '.join(module.statements)
+            )
+
+        cursor.execute(
+            """
+            SELECT indexrelid::regclass::text
+              FROM pg_index
+             WHERE NOT indisvalid
+                   AND indexrelid::regclass::text = ANY(%(index_names)s);
+            """,
+            {'index_names': index_names}
+            )
+
+        for row in cursor.fetchall():
+            cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + row[0] +
+                ';')
+
+    # Run statements in one transaction unless migration contains statements
+    # that cannot run in a transaction block (e.g., CREATE INDEX
+    # CONCURRENTLY), in which case each statement commits on its own and must
+    # be safe to run again if the migration is interrupted; an atomic
+    # migration is recorded as applied in the same transaction as its
+    # statements, so that it is either applied and recorded or neither
+    if atomic:
+        conn.autocommit = False
+
+    try:
+        for statement in module.statements:
+            cursor.execute(statement)
+
+        cursor.execute(
+            """
+            INSERT INTO schema_migration
+                        (version, name, backfill_pending)
+                 VALUES (%(version)s, %(name)s, %(backfill_pending)s);
+            """,
+            {'version': migration['version'],
+            'name': migration['name'],
+            'backfill_pending': bool(backfills)}
+            )
+
+        if atomic:
+            conn.commit()
+
+    except pg.Error:
+        if atomic:
+            conn.rollback()
+        raise
+
+    finally:
+        conn.autocommit = True
+
+    if backfills:
+        run_backfills(cursor, migration, batch_size)
+
+
+def migration_status():
+    # Set up database connection with environment variable
+    conn = pg.connect(os.environ['DB_CONNECTION'])
+    conn.autocommit = True
+
+    cursor = conn.cursor()
+
+    create_migration_table(cursor)
+
+    cursor.execute(
+        """
+        SELECT version, applied, backfill_pending
+          FROM schema_migration;
+        """
+        )
+
+    applied = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    cursor.close()
+    conn.close()
+
+    # Print each migration with the time it was applied or as pending
+    for migration in load_migrations():
+        if migration['version'] not in applied:
+            print(migration['version'] + ' ' + migration['name'] +
+                ': pending')
+            continue
+
+        applied_time, backfill_pending = applied[migration['version']]
+
+        print(migration['version'] + ' ' + migration['name'] + ': ' +
+            applied_time.astimezone(timezone.utc).isoformat() +
+            (' (backfill pending)' if backfill_pending else ''))
+
+    return
+
+
+def repair_counts():
+    # Set up database connection with environment variable
+    conn = pg.connect(os.environ['DB_CONNECTION'])
+
+    cursor = conn.cursor()
+
+    # Recompute each drawing's like count, updating only drawings whose stored
+    # count has drifted
+    cursor.execute(
+        """
+        UPDATE drawing
+           SET like_count = counts.like_count
+          FROM (
+                  SELECT drawing.drawing_id,
+                         COUNT(drawing_like.drawing_like_id) AS like_count
+                    FROM drawing
+               LEFT JOIN drawing_like
+                         ON drawing_like.drawing_id = drawing.drawing_id
+                GROUP BY drawing.drawing_id
+          ) AS counts
+         WHERE drawing.drawing_id = counts.drawing_id
+               AND drawing.like_count != counts.like_count;
+        """
+        )
+
+    drawings_repaired = cursor.rowcount
+
+    # Recompute each post's comment count, updating only posts whose stored
+    # count has drifted
+    cursor.execute(
+        """
+        UPDATE post
+           SET comment_count = counts.comment_count
+          FROM (
+                  SELECT post.post_id,
+                         COUNT(comment.comment_id) AS comment_count
+                    FROM post
+               LEFT JOIN comment
+                         ON comment.post_id = post.post_id
+                GROUP BY post.post_id
+          ) AS counts
+         WHERE post.post_id = counts.post_id
+               AND post.comment_count != counts.comment_count;
+        """
+        )
+
+    posts_repaired = cursor.rowcount
+
+    conn.commit()
+
+    cursor.close()
+    conn.close()
+
+    print('Repaired like counts for ' + str(drawings_repaired) +
+        ' drawings and comment counts for ' + str(posts_repaired) + ' posts.')
+
+    return
+
+
+def prune_rollups():
+    # Set up database connection with environment variable
+    conn = pg.connect(os.environ['DB_CONNECTION'])
+
+    cursor = conn.cursor()
+
+    rows_pruned = 0
+
+    # Delete players' best scores for time windows that ended more than
+    # ROLLUP_RETENTION_DAYS days ago
+    for table in ['rhythm_score_rollup', 'shapes_score_rollup']:
+        cursor.execute(
+            """
+            DELETE FROM """ + table + """
+                  WHERE period_end <
+                        now() - %(retention_days)s * INTERVAL '1 day';
+            """,
+            {'retention_days': int(
+                os.environ.get('ROLLUP_RETENTION_DAYS', 90)
+                )}
+            )
+
+        rows_pruned += cursor.rowcount
+
+    conn.commit()
+
+    cursor.close()
+    conn.close()
+
+    print('Pruned ' + str(rows_pruned) + ' expired leaderboard rollups.')
+
+    return
+
+
 def create_owner_user():
     # Set up database connection with environment variable
     conn = pg.connect(os.environ['DB_CONNECTION'])
@@ -615,7 +1008,7 @@ def create_all_drawings_from_s3():
                           WHERE LOWER(username) = %(username)s),
                         %(title)s, %(url)s);
             """,
-            {'drawing_id': drawing_id,
+            {'drawing_id': drawing_ids.to_db(drawing_id),
             'username': username.lower(),
             'title': drawing_id,
             'created': drawing["LastModified"],
@@ -668,6 +1061,10 @@ def create_drawings(drawings_filename):
     with open(drawings_file, 'r') as drawing_data:
         drawings = json.load(drawing_data)
 
+    # Get number of bits within which a drawing's hash is too similar to an
+    # existing drawing's hash
+    threshold = int(os.environ.get('DRAWING_SIMILARITY_THRESHOLD', 0))
+
     # Add drawings to database
     for drawing in drawings:
 
@@ -705,12 +1102,17 @@ def create_drawings(drawings_filename):
                             LIMIT 1
             );
             """,
-            {'drawing_id': drawing_id}
+            {'drawing_id': drawing_ids.to_db(drawing_id)}
             )
 
         if cursor.fetchone()[0]:
             print('Drawing "' + drawing_id + '" already exists')
 
+        elif threshold and drawing_index.find_similar(
+                cursor, drawing_ids.to_db(drawing_id), threshold):
+            print('Drawing "' + drawing_id + '" is similar to an ' +
+                'existing drawing')
+
         else:
             # Upload drawing to S3 bucket
             s3 = boto3.client(
@@ -741,7 +1143,7 @@ def create_drawings(drawings_filename):
                               WHERE LOWER(username) = %(username)s),
                             %(title)s, %(url)s);
                 """,
-                {'drawing_id': drawing_id,
+                {'drawing_id': drawing_ids.to_db(drawing_id),
                 'username': username.lower(),
                 'title': drawing['title'],
                 'url': os.environ['S3_URL'] + bucket_folder + drawing_name}
@@ -752,6 +1154,8 @@ def create_drawings(drawings_filename):
             cursor.close()
             conn.close()
 
+            drawing_index.add(drawing_ids.to_db(drawing_id))
+
             print('Drawing "' + drawing_id + '" added to database.')
 
     return
@@ -881,11 +1285,23 @@ def schedule_weekly_backup():
 # Add arguments for initializing database in CLI
 parser = argparse.ArgumentParser(description='Management commands')
 parser.add_argument('action', type=str, help="an action for the database")
+parser.add_argument('--dry-run', action='store_true',
+    help="print pending migrations without applying them")
+parser.add_argument('--maintenance', action='store_true',
+    help="also apply migrations that must run with the server stopped")
 args = parser.parse_args()
 if args.action == 'init_db':
     initialize_database()
+if args.action == 'migrate':
+    migrate(args.dry_run, args.maintenance)
+if args.action == 'migration_status':
+    migration_status()
 if args.action == 'load_data':
     load_initial_data()
+if args.action == 'repair_counts':
+    repair_counts()
+if args.action == 'prune_rollups':
+    prune_rollups()
 if args.action == 'load_s3_drawings':
     create_all_drawings_from_s3()
 if args.action == 'backup_db':
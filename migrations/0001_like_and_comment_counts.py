@@ -0,0 +1,123 @@
+# Add denormalized like and comment counters, which are kept up to date by
+# triggers on drawing_like and comment inserts and deletes (including cascaded
+# deletes), and backfill them for existing drawings and posts in batches taken
+# in primary key order
+atomic = True
+
+statements = [
+    """
+    ALTER TABLE drawing
+            ADD COLUMN IF NOT EXISTS like_count INT DEFAULT 0 NOT NULL;
+    """,
+    """
+    ALTER TABLE post
+            ADD COLUMN IF NOT EXISTS comment_count INT DEFAULT 0 NOT NULL;
+    """,
+    """
+    CREATE OR REPLACE FUNCTION update_drawing_like_count()
+    RETURNS TRIGGER AS $$
+    BEGIN
+         IF TG_OP = 'INSERT' THEN
+           UPDATE drawing
+              SET like_count = like_count + 1
+            WHERE drawing_id = NEW.drawing_id;
+         ELSE
+           UPDATE drawing
+              SET like_count = like_count - 1
+            WHERE drawing_id = OLD.drawing_id;
+         END IF;
+         RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    DROP TRIGGER IF EXISTS drawing_like_count ON drawing_like;
+    """,
+    """
+    CREATE TRIGGER drawing_like_count
+     AFTER INSERT OR DELETE ON drawing_like
+       FOR EACH ROW EXECUTE PROCEDURE update_drawing_like_count();
+    """,
+    """
+    CREATE OR REPLACE FUNCTION update_post_comment_count()
+    RETURNS TRIGGER AS $$
+    BEGIN
+         IF TG_OP = 'INSERT' THEN
+           UPDATE post
+              SET comment_count = comment_count + 1
+            WHERE post_id = NEW.post_id;
+         ELSE
+           UPDATE post
+              SET comment_count = comment_count - 1
+            WHERE post_id = OLD.post_id;
+         END IF;
+         RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    DROP TRIGGER IF EXISTS post_comment_count ON comment;
+    """,
+    """
+    CREATE TRIGGER post_comment_count
+     AFTER INSERT OR DELETE ON comment
+       FOR EACH ROW EXECUTE PROCEDURE update_post_comment_count();
+    """
+    ]
+
+backfills = [
+    """
+      WITH batch AS (
+             SELECT drawing_id
+               FROM drawing
+              WHERE %(last_id)s IS NULL
+                    OR drawing_id > %(last_id)s
+           ORDER BY drawing_id
+              LIMIT %(batch_size)s
+           ),
+           counts AS (
+                SELECT batch.drawing_id,
+                       COUNT(drawing_like.drawing_like_id) AS like_count
+                  FROM batch
+             LEFT JOIN drawing_like
+                       ON drawing_like.drawing_id = batch.drawing_id
+              GROUP BY batch.drawing_id
+           ),
+           updated AS (
+             UPDATE drawing
+                SET like_count = counts.like_count
+               FROM counts
+              WHERE drawing.drawing_id = counts.drawing_id
+                    AND drawing.like_count != counts.like_count
+           )
+    SELECT MAX(drawing_id)
+      FROM batch;
+    """,
+    """
+      WITH batch AS (
+             SELECT post_id
+               FROM post
+              WHERE %(last_id)s IS NULL
+                    OR post_id > %(last_id)s
+           ORDER BY post_id
+              LIMIT %(batch_size)s
+           ),
+           counts AS (
+                SELECT batch.post_id,
+                       COUNT(comment.comment_id) AS comment_count
+                  FROM batch
+             LEFT JOIN comment
+                       ON comment.post_id = batch.post_id
+              GROUP BY batch.post_id
+           ),
+           updated AS (
+             UPDATE post
+                SET comment_count = counts.comment_count
+               FROM counts
+              WHERE post.post_id = counts.post_id
+                    AND post.comment_count != counts.comment_count
+           )
+    SELECT MAX(post_id)
+      FROM batch;
+    """
+    ]
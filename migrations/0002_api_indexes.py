@@ -0,0 +1,71 @@
+# Add indexes for the lookups, joins and sort orders used by the API; indexes
+# are built concurrently, which cannot run in a transaction block, so that
+# writes to the tables are not blocked while they build
+atomic = False
+
+statements = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS cp_user_username_lower_idx
+        ON cp_user (LOWER(username));
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS cp_user_created_idx
+        ON cp_user (created, member_id);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS rhythm_score_score_idx
+        ON rhythm_score (score DESC, score_id DESC);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS rhythm_score_member_id_idx
+        ON rhythm_score (member_id, score DESC, score_id DESC);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS shapes_score_score_idx
+        ON shapes_score (score DESC, score_id DESC);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS shapes_score_member_id_idx
+        ON shapes_score (member_id, score DESC, score_id DESC);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS post_created_idx
+        ON post (created, post_id);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS post_member_id_idx
+        ON post (member_id, created, post_id);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS post_content_post_id_idx
+        ON post_content (post_id, created);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS comment_post_id_idx
+        ON comment (post_id, created, comment_id);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS comment_member_id_idx
+        ON comment (member_id, created, comment_id);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS comment_content_comment_id_idx
+        ON comment_content (comment_id, created);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS drawing_created_idx
+        ON drawing (created, drawing_id);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS drawing_member_id_idx
+        ON drawing (member_id, created, drawing_id);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS drawing_like_drawing_id_idx
+        ON drawing_like (drawing_id, created, drawing_like_id);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS drawing_like_member_id_idx
+        ON drawing_like (member_id, created, drawing_like_id);
+    """
+    ]
@@ -0,0 +1,167 @@
+# Store created and modified times as timestamptz instead of formatted TEXT,
+# and link posts and comments to their current content version by version
+# number instead of by matching the content's created time to the post's or
+# comment's modified time
+#
+# Changing a column's type rewrites the whole table under an ACCESS EXCLUSIVE
+# lock, so every read and write of the users, scores, posts, comments, drawings
+# and drawing likes tables waits until this migration commits; its run time
+# grows with the size of those tables, so it is only applied by running
+# `migrate --maintenance` with the API stopped, never by the release phase
+atomic = True
+
+maintenance = True
+
+statements = [
+    """
+    ALTER TABLE cp_user
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now(),
+          ALTER COLUMN modified DROP DEFAULT,
+          ALTER COLUMN modified TYPE TIMESTAMPTZ USING modified::TIMESTAMPTZ,
+          ALTER COLUMN modified SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE rhythm_score
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE shapes_score
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE post
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now(),
+          ALTER COLUMN modified DROP DEFAULT,
+          ALTER COLUMN modified TYPE TIMESTAMPTZ USING modified::TIMESTAMPTZ,
+          ALTER COLUMN modified SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE post_content
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE comment
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now(),
+          ALTER COLUMN modified DROP DEFAULT,
+          ALTER COLUMN modified TYPE TIMESTAMPTZ USING modified::TIMESTAMPTZ,
+          ALTER COLUMN modified SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE comment_content
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE drawing
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE drawing_like
+          ALTER COLUMN created DROP DEFAULT,
+          ALTER COLUMN created TYPE TIMESTAMPTZ USING created::TIMESTAMPTZ,
+          ALTER COLUMN created SET DEFAULT now();
+    """,
+    """
+    ALTER TABLE post
+            ADD COLUMN version INT;
+    """,
+    """
+    ALTER TABLE post_content
+            ADD COLUMN version INT;
+    """,
+    """
+    UPDATE post_content
+       SET version = numbered.version
+      FROM (
+            SELECT post_content_id,
+                   row_number() OVER (PARTITION BY post_id
+                                          ORDER BY created, post_content_id)
+                       AS version
+              FROM post_content
+      ) AS numbered
+     WHERE post_content.post_content_id = numbered.post_content_id;
+    """,
+    """
+    UPDATE post
+       SET version = COALESCE((
+                               SELECT MAX(version)
+                                 FROM post_content
+                                WHERE post_content.post_id = post.post_id
+                                      AND post_content.created <= post.modified
+           ), 1);
+    """,
+    """
+    ALTER TABLE post
+          ALTER COLUMN version SET DEFAULT 1,
+          ALTER COLUMN version SET NOT NULL;
+    """,
+    """
+    ALTER TABLE post_content
+          ALTER COLUMN version SET DEFAULT 1,
+          ALTER COLUMN version SET NOT NULL;
+    """,
+    """
+    CREATE UNIQUE INDEX post_content_post_id_version_idx
+        ON post_content (post_id, version);
+    """,
+    """
+    ALTER TABLE comment
+            ADD COLUMN version INT;
+    """,
+    """
+    ALTER TABLE comment_content
+            ADD COLUMN version INT;
+    """,
+    """
+    UPDATE comment_content
+       SET version = numbered.version
+      FROM (
+            SELECT comment_content_id,
+                   row_number() OVER (PARTITION BY comment_id
+                                          ORDER BY created, comment_content_id)
+                       AS version
+              FROM comment_content
+      ) AS numbered
+     WHERE comment_content.comment_content_id = numbered.comment_content_id;
+    """,
+    """
+    UPDATE comment
+       SET version = COALESCE((
+                               SELECT MAX(version)
+                                 FROM comment_content
+                                WHERE comment_content.comment_id =
+                                      comment.comment_id
+                                      AND comment_content.created <=
+                                          comment.modified
+           ), 1);
+    """,
+    """
+    ALTER TABLE comment
+          ALTER COLUMN version SET DEFAULT 1,
+          ALTER COLUMN version SET NOT NULL;
+    """,
+    """
+    ALTER TABLE comment_content
+          ALTER COLUMN version SET DEFAULT 1,
+          ALTER COLUMN version SET NOT NULL;
+    """,
+    """
+    CREATE UNIQUE INDEX comment_content_comment_id_version_idx
+        ON comment_content (comment_id, version);
+    """
+    ]
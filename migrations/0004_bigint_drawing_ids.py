@@ -0,0 +1,35 @@
+# Store drawing ids as 64-bit integers instead of 16-character hexadecimal
+# TEXT, reinterpreting each id's 64 bits as a signed BIGINT so that the API can
+# convert between the two forms without loss
+#
+# Changing a column's type rewrites the whole table under an ACCESS EXCLUSIVE
+# lock, so every read and write of the drawings and drawing likes tables waits
+# until this migration commits; its run time grows with the size of those
+# tables, so it is only applied by running `migrate --maintenance` with the API
+# stopped, never by the release phase
+atomic = True
+
+maintenance = True
+
+statements = [
+    """
+    ALTER TABLE drawing_like
+          DROP CONSTRAINT drawing_like_drawing_id_fkey;
+    """,
+    """
+    ALTER TABLE drawing
+          ALTER COLUMN drawing_id TYPE BIGINT
+          USING ('x' || lpad(drawing_id, 16, '0'))::BIT(64)::BIGINT;
+    """,
+    """
+    ALTER TABLE drawing_like
+          ALTER COLUMN drawing_id TYPE BIGINT
+          USING ('x' || lpad(drawing_id, 16, '0'))::BIT(64)::BIGINT;
+    """,
+    """
+    ALTER TABLE drawing_like
+          ADD CONSTRAINT drawing_like_drawing_id_fkey
+          FOREIGN KEY (drawing_id) REFERENCES drawing (drawing_id)
+          ON DELETE CASCADE;
+    """
+    ]
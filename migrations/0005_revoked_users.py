@@ -0,0 +1,26 @@
+# Record usernames whose bearer tokens were revoked (accounts that were
+# deleted or renamed), so that tokens can be verified without looking up the
+# account's status on every request; only revocations newer than the token
+# lifetime are read
+atomic = True
+
+statements = [
+    """
+    CREATE TABLE IF NOT EXISTS revoked_user (
+        PRIMARY KEY (username),
+        username TEXT        NOT NULL,
+        revoked  TIMESTAMPTZ DEFAULT now() NOT NULL
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS revoked_user_revoked_idx
+        ON revoked_user (revoked);
+    """,
+    """
+    INSERT INTO revoked_user (username)
+         SELECT LOWER(username)
+           FROM cp_user
+          WHERE status = 'deleted'
+    ON CONFLICT DO NOTHING;
+    """
+    ]
@@ -0,0 +1,21 @@
+# Store hashes of refresh tokens, which let clients get a new bearer token
+# without sending the user's password again; each refresh token is used once
+# and replaced by a new one
+atomic = True
+
+statements = [
+    """
+    CREATE TABLE IF NOT EXISTS refresh_token (
+        PRIMARY KEY (token_hash),
+        token_hash TEXT        NOT NULL,
+        member_id  UUID        REFERENCES cp_user (member_id)
+                   ON DELETE CASCADE NOT NULL,
+        created    TIMESTAMPTZ DEFAULT now() NOT NULL,
+        expires    TIMESTAMPTZ NOT NULL
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS refresh_token_member_id_idx
+        ON refresh_token (member_id);
+    """
+    ]
@@ -0,0 +1,31 @@
+# Enforce one like per user per drawing and case-insensitively unique
+# usernames with unique indexes, so that writes can rely on ON CONFLICT instead
+# of checking for an existing row in a separate query first; indexes are built
+# concurrently, which cannot run in a transaction block, so that writes to the
+# tables are not blocked while they build. Duplicate likes are removed first;
+# if a duplicate is added before the like index is built, the build fails and
+# running the migration again removes it and rebuilds the index
+atomic = False
+
+statements = [
+    """
+    DELETE FROM drawing_like
+          USING drawing_like AS earlier_like
+          WHERE drawing_like.drawing_id = earlier_like.drawing_id
+                AND drawing_like.member_id = earlier_like.member_id
+                AND drawing_like.drawing_like_id >
+                    earlier_like.drawing_like_id;
+    """,
+    """
+    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS
+        drawing_like_drawing_id_member_id_key
+        ON drawing_like (drawing_id, member_id);
+    """,
+    """
+    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS cp_user_username_lower_key
+        ON cp_user (LOWER(username));
+    """,
+    """
+    DROP INDEX CONCURRENTLY IF EXISTS cp_user_username_lower_idx;
+    """
+    ]
@@ -0,0 +1,64 @@
+# Keep each player's best score per day, week and month for each game, so that
+# daily, weekly and monthly leaderboards are read from one small table instead
+# of scanning every score; rows are derived from the score tables and are
+# backfilled for windows that have not ended yet
+atomic = True
+
+statements = []
+
+for table in ['rhythm_score', 'shapes_score']:
+    statements += [
+        """
+        CREATE TABLE IF NOT EXISTS """ + table + """_rollup (
+            PRIMARY KEY (period, period_start, member_id),
+            period       TEXT        NOT NULL,
+            period_start TIMESTAMPTZ NOT NULL,
+            period_end   TIMESTAMPTZ NOT NULL,
+            member_id    UUID        REFERENCES cp_user (member_id)
+                                     ON DELETE CASCADE NOT NULL,
+            score_id     INT         NOT NULL,
+            score        INT         NOT NULL,
+            created      TIMESTAMPTZ NOT NULL
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS """ + table + """_rollup_score_idx
+            ON """ + table + """_rollup
+               (period, period_start, score DESC, score_id DESC);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS """ + table + """_rollup_score_id_idx
+            ON """ + table + """_rollup (score_id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS """ + table + """_rollup_period_end_idx
+            ON """ + table + """_rollup (period_end);
+        """,
+        """
+        INSERT INTO """ + table + """_rollup
+                    (period, period_start, period_end, member_id, score_id,
+                    score, created)
+             SELECT DISTINCT ON (period, period_start, member_id)
+                    period, period_start, period_end, member_id, score_id,
+                    score, created
+               FROM (
+                     SELECT period,
+                            date_trunc(period, created AT TIME ZONE 'UTC')
+                                AT TIME ZONE 'UTC' AS period_start,
+                            (date_trunc(period, created AT TIME ZONE 'UTC') +
+                            ('1 ' || period)::INTERVAL)
+                                AT TIME ZONE 'UTC' AS period_end,
+                            member_id, score_id, score, created
+                       FROM """ + table + """,
+                            unnest(ARRAY['day', 'week', 'month']) AS period
+                      WHERE member_id IS NOT NULL
+                            AND created >=
+                                date_trunc('month', now() AT TIME ZONE 'UTC')
+                                    AT TIME ZONE 'UTC' - INTERVAL '7 days'
+               ) AS windowed
+              WHERE period_end > now()
+           ORDER BY period, period_start, member_id, score DESC,
+                    score_id DESC
+        ON CONFLICT DO NOTHING;
+        """
+        ]
@@ -0,0 +1,22 @@
+# Keep each player's all-time best score for each game in the game's rollup
+# table as an 'all' period spanning all time, so that per-player leaderboards
+# and profile high scores are read without grouping every score
+atomic = True
+
+statements = []
+
+for table in ['rhythm_score', 'shapes_score']:
+    statements += [
+        """
+        INSERT INTO """ + table + """_rollup
+                    (period, period_start, period_end, member_id, score_id,
+                    score, created)
+             SELECT DISTINCT ON (member_id)
+                    'all', '-infinity', 'infinity', member_id, score_id, score,
+                    created
+               FROM """ + table + """
+              WHERE member_id IS NOT NULL
+           ORDER BY member_id, score DESC, score_id DESC
+        ON CONFLICT DO NOTHING;
+        """
+        ]
@@ -0,0 +1,14 @@
+# Drop indexes on post and comment content by created time, which were used to
+# find the current content version before posts and comments were linked to
+# their content by version number; indexes are dropped concurrently so that
+# reads and writes of the tables are not blocked
+atomic = False
+
+statements = [
+    """
+    DROP INDEX CONCURRENTLY IF EXISTS post_content_post_id_idx;
+    """,
+    """
+    DROP INDEX CONCURRENTLY IF EXISTS comment_content_comment_id_idx;
+    """
+    ]
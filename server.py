@@ -1,4 +1,3 @@
-import json
 import os
 
 from flask import Flask, make_response, request
@@ -10,13 +9,22 @@ from rhythm_of_life import rhythm_of_life
 from shapes_in_rain import shapes_in_rain
 from thought_writer import thought_writer
 from user import user
+from utils import db, timestamps
 
 app = Flask(__name__)
-cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
+app.json_encoder = timestamps.TimestampJSONEncoder
+cors = CORS(app, resources={r"/api/*": {"origins": "*"}},
+    expose_headers=['X-Refresh-Token'])
 if os.environ['ENV_TYPE'] == 'Dev':
     app.config['DEBUG'] = True
 
 
+@app.teardown_request
+def release_db_connections(exception):
+    # Return any database connections a handler did not give back to the pool
+    db.release_conns()
+
+
 @app.route('/api/canvashare/drawing', methods=['POST'])
 def drawing():
     # Post a drawing when client sends the jsonified drawing data URI in base64
@@ -24,13 +32,9 @@ def drawing():
     # in the request Authorization header
     if request.method == 'POST':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return canvashare.create_drawing(requester)
 
@@ -53,17 +57,21 @@ def drawing_id(drawing_id):
     # header
     if request.method == 'DELETE':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return canvashare.delete_drawing(requester, drawing_id)
 
 
+@app.route('/api/canvashare/drawing/<drawing_id>/similar', methods=['GET'])
+def similar_drawings(drawing_id):
+    # Retrieve drawings that look similar to a drawing when client sends the
+    # drawing id in the request URL; no bearer token needed
+    if request.method == 'GET':
+        return canvashare.read_similar_drawings(drawing_id)
+
+
 @app.route('/api/canvashare/drawings', methods=['GET'])
 def drawings():
     # Retrieve all drawings in order of newest to oldest; no bearer token
@@ -88,13 +96,9 @@ def drawing_like():
     # header
     if request.method == 'POST':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return canvashare.create_drawing_like(requester)
 
@@ -112,13 +116,9 @@ def drawing_like_id(drawing_like_id):
     # Authorization header
     if request.method == 'DELETE':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return canvashare.delete_drawing_like(requester, drawing_like_id)
 
@@ -166,25 +166,43 @@ def login_route():
         return user.login()
 
 
+@app.route('/api/refresh', methods=['POST'])
+def refresh_route():
+    # Check if refresh token in request X-Refresh-Token header is valid and
+    # return new JWT and refresh token if so, without checking user's password
+    if request.method == 'POST':
+        return user.refresh()
+
+
 @app.route('/api/ping', methods=['GET'])
 def ping():
     # Return success response if server is up
     return make_response('Success', 200)
 
 
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    # Retrieve this worker's database connection pool and password hashing
+    # queue statistics when client sends a verified bearer token for an admin
+    # in the request Authorization header
+    if request.method == 'GET':
+        # Verify that user is logged in and return error status code if not
+        requester, error = user.authenticate()
+        if error:
+            return error
+
+        return user.read_stats(requester)
+
+
 @app.route('/api/rhythm-of-life/score', methods=['POST'])
 def rhythm_score():
     # Post a game score for a user when client sends the jsonified score in the
     # request body and verified bearer token in request Authorization header
     if request.method == 'POST':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return rhythm_of_life.create_score(requester)
 
@@ -201,24 +219,31 @@ def rhythm_score_id(score_id):
     # Authorization header
     if request.method == 'DELETE':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return rhythm_of_life.delete_score(requester, score_id)
 
 
-@app.route('/api/rhythm-of-life/scores', methods=['GET'])
+@app.route('/api/rhythm-of-life/scores', methods=['GET', 'POST'])
 def rhythm_scores():
     # Retrieve all users' game scores in order of highest to lowest score; no
     # bearer token needed; query params specify number of scores
     if request.method == 'GET':
         return rhythm_of_life.read_scores()
 
+    # Post a batch of game scores for a user when client sends the scores in
+    # request body and verified bearer token for the player in request
+    # Authorization header
+    if request.method == 'POST':
+        # Verify that user is logged in and return error status code if not
+        requester, error = user.authenticate()
+        if error:
+            return error
+
+        return rhythm_of_life.create_scores(requester)
+
 
 @app.route('/api/rhythm-of-life/scores/<player_name>', methods=['GET'])
 def rhythm_user_scores(player_name):
@@ -229,19 +254,32 @@ def rhythm_user_scores(player_name):
         return rhythm_of_life.read_scores_for_one_user(player_name)
 
 
+@app.route('/api/rhythm-of-life/rank/<player_name>', methods=['GET'])
+def rhythm_rank(player_name):
+    # Retrieve a user's high score and its rank on the leaderboard when client
+    # sends the player's username in the request URL; no bearer token needed
+    if request.method == 'GET':
+        return rhythm_of_life.read_rank(player_name)
+
+
+@app.route('/api/rhythm-of-life/scores/around/<player_name>', methods=['GET'])
+def rhythm_scores_around(player_name):
+    # Retrieve a user's high score and the scores ranked directly above and
+    # below it when client sends the player's username in the request URL; no
+    # bearer token needed; query param specifies number of scores on each side
+    if request.method == 'GET':
+        return rhythm_of_life.read_scores_around(player_name)
+
+
 @app.route('/api/shapes-in-rain/score', methods=['POST'])
 def shapes_score():
     # Post a game score for a user when client sends the jsonified score in the
     # request body and verified bearer token in request Authorization header
     if request.method == 'POST':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return shapes_in_rain.create_score(requester)
 
@@ -257,24 +295,31 @@ def shapes_score_id(score_id):
     # request URL and verified bearer token in request Authorization header
     if request.method == 'DELETE':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return shapes_in_rain.delete_score(requester, score_id)
 
 
-@app.route('/api/shapes-in-rain/scores', methods=['GET'])
+@app.route('/api/shapes-in-rain/scores', methods=['GET', 'POST'])
 def shapes_scores():
     # Retrieve all users' game scores in order of highest to lowest score; no
     # bearer token needed; query params specify number of scores
     if request.method == 'GET':
         return shapes_in_rain.read_scores()
 
+    # Post a batch of game scores for a user when client sends the scores in
+    # request body and verified bearer token for the player in request
+    # Authorization header
+    if request.method == 'POST':
+        # Verify that user is logged in and return error status code if not
+        requester, error = user.authenticate()
+        if error:
+            return error
+
+        return shapes_in_rain.create_scores(requester)
+
 
 @app.route('/api/shapes-in-rain/scores/<player_name>', methods=['GET'])
 def shapes_user_scores(player_name):
@@ -285,6 +330,23 @@ def shapes_user_scores(player_name):
         return shapes_in_rain.read_scores_for_one_user(player_name)
 
 
+@app.route('/api/shapes-in-rain/rank/<player_name>', methods=['GET'])
+def shapes_rank(player_name):
+    # Retrieve a user's high score and its rank on the leaderboard when client
+    # sends the player's username in the request URL; no bearer token needed
+    if request.method == 'GET':
+        return shapes_in_rain.read_rank(player_name)
+
+
+@app.route('/api/shapes-in-rain/scores/around/<player_name>', methods=['GET'])
+def shapes_scores_around(player_name):
+    # Retrieve a user's high score and the scores ranked directly above and
+    # below it when client sends the player's username in the request URL; no
+    # bearer token needed; query param specifies number of scores on each side
+    if request.method == 'GET':
+        return shapes_in_rain.read_scores_around(player_name)
+
+
 @app.route('/api/thought-writer/post', methods=['POST'])
 def post():
     # Post a thought post when client sends the jsonified post content, title,
@@ -292,13 +354,9 @@ def post():
     # bearer token in the request Authorization header
     if request.method == 'POST':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return thought_writer.create_post(requester)
 
@@ -318,13 +376,9 @@ def post_id(post_id):
     # request Authorization header
     if request.method == 'PATCH':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return thought_writer.update_post(requester, post_id)
 
@@ -333,13 +387,9 @@ def post_id(post_id):
     # header
     if request.method == 'DELETE':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return thought_writer.delete_post(requester, post_id)
 
@@ -371,13 +421,9 @@ def comment():
     # the request Authorization header
     if request.method == 'POST':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return thought_writer.create_comment(requester)
 
@@ -396,13 +442,9 @@ def comment_id(comment_id):
     # header
     if request.method == 'PATCH':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return thought_writer.update_comment(requester, comment_id)
 
@@ -411,13 +453,9 @@ def comment_id(comment_id):
     # request Authorization header
     if request.method == 'DELETE':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return thought_writer.delete_comment(requester, comment_id)
 
@@ -462,13 +500,9 @@ def user_account_id(username):
     # request Authorization header
     if request.method == 'PATCH':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         # Return error if requester is not the user
         if requester.lower() != username.lower():
@@ -481,13 +515,9 @@ def user_account_id(username):
     # request Authorization header
     if request.method == 'DELETE':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         # Return error if requester is not the user
         if requester.lower() != username.lower():
@@ -503,13 +533,9 @@ def user_account_data(username):
     # request Authorization header
     if request.method == 'GET':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         # Return error if requester is not the user
         if requester.lower() != username.lower():
@@ -522,13 +548,9 @@ def user_account_data(username):
     # Authorization header
     if request.method == 'DELETE':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
-
-        # Get username from payload if user is logged in
-        payload = json.loads(verification.data.decode())
-        requester = payload['username']
+        requester, error = user.authenticate()
+        if error:
+            return error
 
         return user.delete_user_hard(requester, username)
 
@@ -547,8 +569,8 @@ def users():
     # in the request Authorization header; query params specify number of users
     if request.method == 'GET':
         # Verify that user is logged in and return error status code if not
-        verification = user.verify_token()
-        if verification.status_code != 200:
-            return verification
+        error = user.authenticate()[1]
+        if error:
+            return error
 
         return user.read_users()
@@ -1,9 +1,12 @@
 import boto3
 import json
 import os
+import psycopg2 as pg
+import psycopg2.extras
 import re
 
 from unittest.mock import patch
+from utils import view_counter
 from utils.tests import CrystalPrismTestCase
 
 
@@ -249,6 +252,81 @@ class TestDrawing(CrystalPrismTestCase):
             headers=header
         )
 
+    @patch('canvashare.canvashare.boto3')
+    def test_drawing_post_upload_error(self, boto3):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        resource = boto3.resource.return_value
+        bucket = resource.Bucket.return_value
+        bucket.put_object.side_effect = Exception('Upload failed')
+
+        # Get sample image data URL
+        test_drawing = (
+            os.path.dirname(__file__) + '/../fixtures/test-drawing.txt'
+            )
+        with open(test_drawing, 'r') as drawing:
+            drawing = drawing.read()
+        data = {
+            'drawing': drawing,
+            'title': 'Test'
+            }
+
+        # Act
+        with self.assertRaises(Exception):
+            self.client.post(
+                '/api/canvashare/drawing',
+                headers=header,
+                data=json.dumps(data),
+                content_type='application/json'
+                )
+
+        get_response = self.client.get(
+            '/api/canvashare/drawings/' + self.username
+            )
+        drawings = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(bucket.put_object.called, True)
+
+        # Ensure drawing was removed from database after failed upload
+        self.assertEqual(drawings, [])
+
+    @patch('canvashare.canvashare.boto3')
+    def test_drawing_post_similar_error(self, boto3):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        bucket = boto3.resource.return_value.Bucket.return_value
+
+        # Get sample image data URL
+        test_drawing = (
+            os.path.dirname(__file__) + '/../fixtures/test-drawing.txt'
+            )
+        with open(test_drawing, 'r') as drawing:
+            drawing = drawing.read()
+        data = {
+            'drawing': drawing,
+            'title': 'Test'
+            }
+
+        # Act - post drawing with threshold that every drawing is within
+        with patch.dict(os.environ, {'DRAWING_SIMILARITY_THRESHOLD': '64'}):
+            post_response = self.client.post(
+                '/api/canvashare/drawing',
+                headers=header,
+                data=json.dumps(data),
+                content_type='application/json'
+                )
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 409)
+        self.assertEqual(error, 'Similar drawing already exists')
+        self.assertEqual(bucket.put_object.called, False)
+
     def test_drawing_patch_not_found_error(self):
         # Arrange
         drawing_id = '10000'
@@ -263,6 +341,95 @@ class TestDrawing(CrystalPrismTestCase):
         self.assertEqual(patch_response.status_code, 404)
         self.assertEqual(error, 'Not found')
 
+    def test_drawing_patch_invalid_id_error(self):
+        # Arrange
+        drawing_id = 'not-a-drawing'
+
+        # Act
+        patch_response = self.client.patch(
+            '/api/canvashare/drawing/' + drawing_id
+            )
+        error = patch_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(patch_response.status_code, 404)
+        self.assertEqual(error, 'Not found')
+
+    def test_drawing_patch_views_flushed(self):
+        # Arrange
+        drawing_id = '1'
+
+        # Act
+        for i in range(3):
+            self.client.patch('/api/canvashare/drawing/' + drawing_id)
+
+        buffered_get_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id
+            )
+        buffered_drawing = json.loads(
+            buffered_get_response.get_data(as_text=True)
+            )
+
+        view_counter.flush_views()
+
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT views
+              FROM drawing
+             WHERE drawing_id = %(drawing_id)s;
+            """,
+            {'drawing_id': int(drawing_id, 16)}
+            )
+        stored_views = cursor.fetchone()[0]
+        cursor.close()
+        conn.close()
+
+        flushed_get_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id
+            )
+        flushed_drawing = json.loads(
+            flushed_get_response.get_data(as_text=True)
+            )
+
+        # Assert
+        self.assertEqual(buffered_drawing['views'], 3)
+        self.assertEqual(stored_views, 3)
+        self.assertEqual(flushed_drawing['views'], 3)
+
+    def test_drawing_patch_deleted_by_other_worker(self):
+        # Arrange - view drawing so that this worker knows it exists
+        drawing_id = '1'
+        self.client.patch('/api/canvashare/drawing/' + drawing_id)
+
+        # Arrange - delete drawing outside of this worker
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            DELETE FROM drawing
+                  WHERE drawing_id = %(drawing_id)s;
+            """,
+            {'drawing_id': int(drawing_id, 16)}
+            )
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        # Act
+        view_counter.flush_views()
+
+        patch_response = self.client.patch(
+            '/api/canvashare/drawing/' + drawing_id
+            )
+        error = patch_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(view_counter.is_known(int(drawing_id, 16)), False)
+        self.assertEqual(patch_response.status_code, 404)
+        self.assertEqual(error, 'Not found')
+
     def test_drawing_delete_unauthorized_error(self):
         # Arrange
         drawing_id = '1'
@@ -405,6 +572,102 @@ class TestDrawings(CrystalPrismTestCase):
         self.assertEqual(get_response.status_code, 400)
         self.assertEqual(error, 'Start param cannot be greater than end')
 
+    def test_drawings_get_negative_error(self):
+        # Arrange
+        query = {'start': -3, 'end': -1}
+
+        # Act
+        get_response = self.client.get(
+            '/api/canvashare/drawings',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Start and end params cannot be negative')
+
+    def test_drawings_get_type_error(self):
+        # Arrange
+        query = {'start': 'abc'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/canvashare/drawings',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Start and end params must be integers')
+
+    def test_drawings_get_cursor(self):
+        # Arrange
+        query = {'cursor': '', 'limit': 3}
+        all_response = self.client.get(
+            '/api/canvashare/drawings',
+            query_string={'end': 100}
+            )
+        all_drawings = json.loads(all_response.get_data(as_text=True))
+        drawings = []
+
+        # Act
+        while query['cursor'] is not None:
+            get_response = self.client.get(
+                '/api/canvashare/drawings',
+                query_string=query
+                )
+            page = json.loads(get_response.get_data(as_text=True))
+            drawings += page['items']
+            query['cursor'] = page['next_cursor']
+
+            self.assertEqual(get_response.status_code, 200)
+            self.assertLessEqual(len(page['items']), 3)
+
+        # Assert
+        self.assertEqual(len(drawings), 10)
+        self.assertEqual(drawings, all_drawings)
+
+    def test_drawings_get_cursor_error(self):
+        # Arrange
+        query = {'cursor': 'invalid'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/canvashare/drawings',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Invalid cursor')
+
+    def test_drawings_get_query_count(self):
+        # Arrange
+        execute = pg.extras.DictCursor.execute
+
+        # Act
+        with patch.object(pg.extras.DictCursor, 'execute', autospec=True,
+                          side_effect=execute) as execute_mock:
+            self.client.get(
+                '/api/canvashare/drawings',
+                query_string={'end': 1}
+                )
+            one_drawing_count = execute_mock.call_count
+            execute_mock.reset_mock()
+
+            self.client.get(
+                '/api/canvashare/drawings',
+                query_string={'end': 10}
+                )
+            ten_drawings_count = execute_mock.call_count
+
+        # Assert
+        self.assertEqual(one_drawing_count, 1)
+        self.assertEqual(ten_drawings_count, one_drawing_count)
+
     def test_user_drawings_get(self):
         # Arrange
         artist_name = 'user1'
@@ -504,6 +767,110 @@ class TestDrawings(CrystalPrismTestCase):
         self.assertEqual(error, 'Start param cannot be greater than end')
 
 
+# Test /api/canvashare/drawing/<drawing_id>/similar endpoint [GET]
+class TestSimilarDrawings(CrystalPrismTestCase):
+    def test_similar_drawings_get(self):
+        # Arrange
+        drawing_id = '0000000000000001'
+        query = {'distance': 1}
+
+        # Act
+        get_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id + '/similar',
+            query_string=query
+            )
+        drawings = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+
+        # Ensure drawings one bit away from drawing 1 are returned, ordered by
+        # drawing id
+        self.assertEqual([drawing['drawing_id'] for drawing in drawings], [
+            '0000000000000000', '0000000000000003', '0000000000000005',
+            '0000000000000009'])
+        self.assertEqual(all(drawing['distance'] == 1
+            for drawing in drawings), True)
+        self.assertEqual(all(isinstance(drawing['likers'], list)
+            for drawing in drawings), True)
+
+    def test_similar_drawings_get_cursor(self):
+        # Arrange
+        drawing_id = '0000000000000001'
+        query = {'distance': 2, 'cursor': '', 'limit': 5}
+
+        # Act
+        first_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id + '/similar',
+            query_string=query
+            )
+        first_page = json.loads(first_response.get_data(as_text=True))
+
+        query['cursor'] = first_page['next_cursor']
+        second_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id + '/similar',
+            query_string=query
+            )
+        second_page = json.loads(second_response.get_data(as_text=True))
+
+        drawings = first_page['items'] + second_page['items']
+
+        # Assert
+        self.assertEqual(len(first_page['items']), 5)
+        self.assertEqual(len(drawings), 8)
+        self.assertEqual(second_page['next_cursor'], None)
+
+        # Ensure drawings are ordered from most to least similar
+        self.assertEqual([drawing['distance'] for drawing in drawings],
+            sorted(drawing['distance'] for drawing in drawings))
+
+    def test_similar_drawings_get_not_found_error(self):
+        # Arrange
+        drawing_id = '10000'
+
+        # Act
+        get_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id + '/similar'
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 404)
+        self.assertEqual(error, 'Not found')
+
+    def test_similar_drawings_get_distance_error(self):
+        # Arrange
+        drawing_id = '0000000000000001'
+        query = {'distance': 65}
+
+        # Act
+        get_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id + '/similar',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Distance param must be between 0 and 64')
+
+    def test_similar_drawings_get_distance_type_error(self):
+        # Arrange
+        drawing_id = '0000000000000001'
+        query = {'distance': 'far'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id + '/similar',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Distance param must be between 0 and 64')
+
+
 # Test /api/canvashare/drawing-like endpoint [POST, GET, DELETE]
 class TestDrawingLike(CrystalPrismTestCase):
     def test_drawing_like_post_get_and_delete(self):
@@ -552,7 +919,7 @@ class TestDrawingLike(CrystalPrismTestCase):
         # Assert [GET]
         self.assertEqual(get_response.status_code, 200)
         self.assertEqual(drawing_like['drawing_like_id'], int(drawing_like_id))
-        self.assertEqual(drawing_like['drawing_id'], str(1))
+        self.assertEqual(drawing_like['drawing_id'], '0000000000000001')
         self.assertEqual(drawing_like['username'], self.username)
 
         # Ensure created timestamp matches UTC format
@@ -588,6 +955,13 @@ class TestDrawingLike(CrystalPrismTestCase):
             deleted_get_user_response.get_data(as_text=True)
             )
 
+        deleted_get_drawing_response = self.client.get(
+            '/api/canvashare/drawing/' + drawing_id
+            )
+        updated_drawing = json.loads(
+            deleted_get_drawing_response.get_data(as_text=True)
+            )
+
         # Assert [DELETE]
         self.assertEqual(delete_response.status_code, 200)
 
@@ -596,6 +970,8 @@ class TestDrawingLike(CrystalPrismTestCase):
 
         self.assertEqual(updated_user_data['drawing_like_count'], 0)
 
+        self.assertEqual(updated_drawing['like_count'], like_count)
+
     def test_drawing_like_post_unauthorized_error(self):
         # Act
         post_response = self.client.post('/api/canvashare/drawing-like')
@@ -768,8 +1144,8 @@ class TestDrawingLikes(CrystalPrismTestCase):
         self.assertEqual(all(isinstance(drawing_like['drawing_like_id'], int)
             for drawing_like in drawing_likes), True)
 
-        # Ensure each drawing id is specified drawing id
-        self.assertEqual(all(drawing_like['drawing_id'] == str(1)
+        # Ensure each drawing id is specified drawing id in hexadecimal
+        self.assertEqual(all(drawing_like['drawing_id'] == '0000000000000001'
             for drawing_like in drawing_likes), True)
 
         # Ensure each liker is a string
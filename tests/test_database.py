@@ -0,0 +1,518 @@
+import json
+import os
+import psycopg2 as pg
+import psycopg2.extensions
+import psycopg2.extras
+
+from base64 import urlsafe_b64encode
+from math import ceil
+from types import SimpleNamespace
+from unittest.mock import patch
+from utils import db
+from utils.tests import CrystalPrismTestCase
+
+import management
+
+
+# Tables that grow with site activity, where a sequential scan makes a request
+# slower the more the site is used
+LARGE_TABLES = {'comment', 'comment_content', 'cp_user', 'drawing',
+    'drawing_like', 'post', 'post_content', 'rhythm_score',
+    'rhythm_score_rollup', 'shapes_score', 'shapes_score_rollup'}
+
+# Queries run on cursors created without a cursor factory
+plain_queries = []
+
+
+class RecordingCursor(pg.extensions.cursor):
+    # Cursor that records each query it runs, used as the default cursor of
+    # pooled connections
+    def execute(self, query, params=None):
+        plain_queries.append((query, params))
+
+        return super().execute(query, params)
+
+
+# Encode sort key and id as a cursor for keyset pagination
+def make_cursor(key, id):
+    return urlsafe_b64encode(json.dumps([key, id]).encode()).decode()
+
+
+# Get names of large tables that are sequentially scanned in query plan
+def find_seq_scans(plan):
+    seq_scans = []
+
+    is_large_table = plan.get('Relation Name') in LARGE_TABLES
+
+    if plan['Node Type'] == 'Seq Scan' and is_large_table:
+        seq_scans.append(plan['Relation Name'])
+
+    for child_plan in plan.get('Plans', []):
+        seq_scans += find_seq_scans(child_plan)
+
+    return seq_scans
+
+
+# Test that queries run by read endpoints are served by indexes
+class TestIndexes(CrystalPrismTestCase):
+    def setUp(self):
+        super().setUp()
+
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+
+        cursor = conn.cursor()
+
+        # Add 20,000 users, each with a drawing, two drawing likes, a post
+        # with two content versions, two comments and two scores per game;
+        # seed1 also has the highest score in each game, so that ranking
+        # seed1 counts few scores
+        cursor.execute(
+            """
+            INSERT INTO cp_user (username, password)
+                 SELECT 'seed' || i, 'password'
+                   FROM generate_series(1, 20000) AS i;
+
+            INSERT INTO drawing (drawing_id, member_id, title, url)
+                 SELECT 1000 + i, cp_user.member_id, 'Seed',
+                        'https://example.com/seed.png'
+                   FROM cp_user, generate_series(1, 20000) AS i
+                  WHERE cp_user.username = 'seed' || i;
+
+            INSERT INTO drawing_like (drawing_id, member_id)
+                 SELECT 1000 + i, cp_user.member_id
+                   FROM cp_user, generate_series(1, 20000) AS i,
+                        generate_series(1, 2) AS j
+                  WHERE cp_user.username = 'seed' || (i % 20000 + j);
+
+            INSERT INTO post (member_id)
+                 SELECT member_id
+                   FROM cp_user
+                  WHERE username LIKE 'seed%';
+
+            INSERT INTO post_content (post_id, content, public, title, created)
+                 SELECT post.post_id, 'Seed', TRUE, 'Seed',
+                        '2000-01-01T00:00:00.000Z'
+                   FROM post, cp_user
+                  WHERE post.member_id = cp_user.member_id
+                        AND cp_user.username LIKE 'seed%';
+
+            INSERT INTO post_content (post_id, content, public, title, version)
+                 SELECT post.post_id, 'Seed', TRUE, 'Seed', 2
+                   FROM post, cp_user
+                  WHERE post.member_id = cp_user.member_id
+                        AND cp_user.username LIKE 'seed%';
+
+            UPDATE post
+               SET version = 2
+              FROM cp_user
+             WHERE post.member_id = cp_user.member_id
+                   AND cp_user.username LIKE 'seed%';
+
+            INSERT INTO comment (post_id, member_id)
+                 SELECT post.post_id, cp_user.member_id
+                   FROM post, cp_user, generate_series(1, 2) AS i
+                  WHERE post.member_id = cp_user.member_id
+                        AND cp_user.username LIKE 'seed%';
+
+            INSERT INTO comment_content (comment_id, content)
+                 SELECT comment.comment_id, 'Seed'
+                   FROM comment, post, cp_user
+                  WHERE comment.post_id = post.post_id
+                        AND post.member_id = cp_user.member_id
+                        AND cp_user.username LIKE 'seed%';
+
+            INSERT INTO rhythm_score (member_id, score)
+                 SELECT member_id, (random() * 1000)::INT
+                   FROM cp_user, generate_series(1, 2) AS i
+                  WHERE username LIKE 'seed%';
+
+            INSERT INTO shapes_score (member_id, score)
+                 SELECT member_id, (random() * 1000)::INT
+                   FROM cp_user, generate_series(1, 2) AS i
+                  WHERE username LIKE 'seed%';
+
+            INSERT INTO rhythm_score (member_id, score)
+                 SELECT member_id, 1001
+                   FROM cp_user
+                  WHERE username = 'seed1';
+
+            INSERT INTO shapes_score (member_id, score)
+                 SELECT member_id, 1001
+                   FROM cp_user
+                  WHERE username = 'seed1';
+            """
+            )
+
+        # Add each seeded player's best scores for today and of all time
+        for table in ['rhythm_score', 'shapes_score']:
+            cursor.execute(
+                """
+                INSERT INTO """ + table + """_rollup
+                            (period, period_start, period_end, member_id,
+                            score_id, score, created)
+                     SELECT DISTINCT ON (period, member_id)
+                            period,
+                            CASE WHEN period = 'all' THEN '-infinity'
+                                 ELSE date_trunc('day',
+                                      now() AT TIME ZONE 'UTC')
+                                          AT TIME ZONE 'UTC'
+                            END,
+                            CASE WHEN period = 'all' THEN 'infinity'
+                                 ELSE (date_trunc('day',
+                                      now() AT TIME ZONE 'UTC') +
+                                      INTERVAL '1 day') AT TIME ZONE 'UTC'
+                            END,
+                            member_id, score_id, score, created
+                       FROM """ + table + """,
+                            unnest(ARRAY['all', 'day']) AS period
+                   ORDER BY period, member_id, score DESC, score_id DESC
+                ON CONFLICT DO NOTHING;
+                """
+                )
+
+        conn.commit()
+
+        # Update planner statistics for seeded tables
+        conn.autocommit = True
+        cursor.execute('ANALYZE;')
+
+        cursor.execute(
+            """
+            SELECT post.post_id
+              FROM post, cp_user
+             WHERE post.member_id = cp_user.member_id
+                   AND cp_user.username = 'seed1';
+            """
+            )
+        self.post_id = str(cursor.fetchone()[0])
+
+        cursor.close()
+        conn.close()
+
+    def test_read_queries_use_indexes(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        drawing_id = (1001).__format__('016x')
+        created_cursor = make_cursor('2100-01-01T00:00:00+00:00', '0')
+        score_cursor = make_cursor(500, '0')
+        user_cursor = make_cursor(
+            '2100-01-01T00:00:00+00:00', '00000000-0000-0000-0000-000000000000'
+            )
+
+        # Scores past those held in memory, so that score queries are run
+        past_leaderboard = ('?start=' + str(
+            int(os.environ.get('LEADERBOARD_SIZE', 100)) + 50
+            ))
+        routes = [
+            '/api/canvashare/drawings',
+            '/api/canvashare/drawings/seed1',
+            '/api/canvashare/drawing/' + drawing_id,
+            '/api/canvashare/drawing-likes/drawing/' + drawing_id,
+            '/api/canvashare/drawing-likes/user/seed1',
+            '/api/homepage/ideas',
+            '/api/rhythm-of-life/scores',
+            '/api/rhythm-of-life/scores/seed1',
+            '/api/shapes-in-rain/scores',
+            '/api/shapes-in-rain/scores/seed1',
+            '/api/thought-writer/posts',
+            '/api/thought-writer/posts/seed1',
+            '/api/thought-writer/post/' + self.post_id,
+            '/api/thought-writer/comments/post/' + self.post_id,
+            '/api/thought-writer/comments/user/seed1',
+            '/api/user/seed1',
+            '/api/users',
+            '/api/canvashare/drawings?cursor=' + created_cursor,
+            '/api/canvashare/drawings/seed1?cursor=' + created_cursor,
+            ('/api/canvashare/drawing-likes/drawing/' + drawing_id +
+             '?cursor=' + created_cursor),
+            ('/api/canvashare/drawing-likes/user/seed1?cursor=' +
+             created_cursor),
+            '/api/homepage/ideas?cursor=' + created_cursor,
+            '/api/rhythm-of-life/scores' + past_leaderboard,
+            '/api/rhythm-of-life/scores?cursor=' + score_cursor,
+            '/api/rhythm-of-life/scores/seed1?cursor=' + score_cursor,
+            '/api/rhythm-of-life/scores?window=daily',
+            '/api/rhythm-of-life/scores?distinct=player',
+            '/api/rhythm-of-life/rank/seed1',
+            '/api/rhythm-of-life/scores/around/seed1',
+            '/api/shapes-in-rain/scores' + past_leaderboard,
+            '/api/shapes-in-rain/scores?cursor=' + score_cursor,
+            '/api/shapes-in-rain/scores/seed1?cursor=' + score_cursor,
+            '/api/shapes-in-rain/scores?window=daily',
+            '/api/shapes-in-rain/scores?distinct=player',
+            '/api/shapes-in-rain/rank/seed1',
+            '/api/shapes-in-rain/scores/around/seed1',
+            '/api/thought-writer/posts?cursor=' + created_cursor,
+            '/api/thought-writer/posts/seed1?cursor=' + created_cursor,
+            ('/api/thought-writer/comments/post/' + self.post_id +
+             '?cursor=' + created_cursor),
+            ('/api/thought-writer/comments/user/seed1?cursor=' +
+             created_cursor),
+            '/api/users?cursor=' + user_cursor
+            ]
+        execute = pg.extras.DictCursor.execute
+        connect = pg.connect
+        seq_scans = {}
+        del plain_queries[:]
+
+        # Open new pooled connections whose plain cursors record their queries
+        db.close_pool()
+
+        # Act
+        # Record queries run by each route
+        with patch.object(pg.extras.DictCursor, 'execute', autospec=True,
+                          side_effect=execute) as execute_mock, \
+             patch('utils.db.pg.connect', side_effect=lambda dsn: connect(
+                 dsn, cursor_factory=RecordingCursor)):
+            for route in routes:
+                response = self.client.get(route, headers=header)
+                self.assertEqual(response.status_code, 200, route)
+
+        db.close_pool()
+
+        queries = [(call[0][1], call[0][2] if len(call[0]) > 2 else None)
+            for call in execute_mock.call_args_list] + plain_queries
+
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+
+        cursor = conn.cursor()
+
+        # Get query plan for each recorded query
+        for query, params in queries:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+            plan = cursor.fetchone()[0][0]['Plan']
+
+            if find_seq_scans(plan):
+                seq_scans[query] = find_seq_scans(plan)
+
+        cursor.close()
+        conn.close()
+
+        # Assert
+        self.assertEqual(len(execute_mock.call_args_list) > 0, True)
+        self.assertEqual(len(plain_queries) > 0, True)
+        self.assertEqual(seq_scans, {})
+
+
+# Test schema migration runner
+class TestMigrations(CrystalPrismTestCase):
+    def get_applied_versions(self):
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT version
+              FROM schema_migration
+          ORDER BY version;
+            """
+            )
+
+        versions = [row[0] for row in cursor.fetchall()]
+
+        cursor.close()
+        conn.close()
+
+        return versions
+
+    def test_migrations_applied(self):
+        # Act
+        management.migrate()
+        versions = self.get_applied_versions()
+
+        # Assert
+        self.assertEqual(versions, [
+            migration['version'] for migration in management.load_migrations()
+            ])
+
+    def test_migration_dry_run(self):
+        # Arrange
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+
+        cursor = conn.cursor()
+
+        # Mark latest migration as not applied
+        cursor.execute(
+            """
+            DELETE FROM schema_migration
+                  WHERE version = (
+                                   SELECT MAX(version)
+                                     FROM schema_migration
+                  )
+              RETURNING version, name;
+            """
+            )
+
+        latest_migration = cursor.fetchone()
+
+        conn.commit()
+
+        # Act
+        management.migrate(dry_run=True)
+        versions = self.get_applied_versions()
+
+        # Restore record of latest migration
+        cursor.execute(
+            """
+            INSERT INTO schema_migration (version, name)
+                 VALUES (%s, %s);
+            """,
+            latest_migration
+            )
+
+        conn.commit()
+
+        cursor.close()
+        conn.close()
+
+        # Assert
+        self.assertEqual(latest_migration[0] in versions, False)
+        self.assertEqual(len(versions), len(management.load_migrations()) - 1)
+
+    def test_migration_maintenance(self):
+        # Arrange - migration that must be applied with the server stopped,
+        # followed by one that may depend on it
+        migrations = management.load_migrations() + [{
+            'version': '9998',
+            'name': 'rewrite',
+            'module': SimpleNamespace(maintenance=True, statements=[
+                'CREATE TABLE maintenance_migration (id INT);'
+                ])
+            }, {
+            'version': '9999',
+            'name': 'after_rewrite',
+            'module': SimpleNamespace(statements=[
+                'ALTER TABLE maintenance_migration ADD COLUMN name TEXT;'
+                ])
+            }]
+
+        # Act
+        with patch('management.load_migrations', return_value=migrations):
+            with self.assertRaises(SystemExit):
+                management.migrate()
+
+            skipped_versions = self.get_applied_versions()
+
+            management.migrate(maintenance=True)
+
+        versions = self.get_applied_versions()
+
+        # Assert
+        self.assertEqual('9998' in skipped_versions, False)
+        self.assertEqual('9999' in skipped_versions, False)
+        self.assertEqual(versions[-2:], ['9998', '9999'])
+
+    def test_migration_failure_not_recorded(self):
+        # Arrange - migration whose second statement fails
+        migrations = management.load_migrations() + [{
+            'version': '9999',
+            'name': 'failing',
+            'module': SimpleNamespace(statements=[
+                'CREATE TABLE failing_migration (id INT);',
+                'SELECT 1 / 0;'
+                ])
+            }]
+
+        # Act
+        with patch('management.load_migrations', return_value=migrations):
+            with self.assertRaises(pg.Error):
+                management.migrate()
+
+        versions = self.get_applied_versions()
+
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT to_regclass('failing_migration');")
+        failing_table = cursor.fetchone()[0]
+
+        # Ensure migration lock was released
+        cursor.execute(
+            "SELECT pg_try_advisory_lock(hashtext('schema_migration'));"
+            )
+        locked = cursor.fetchone()[0]
+
+        cursor.close()
+        conn.close()
+
+        # Assert
+        self.assertEqual('9999' in versions, False)
+        self.assertEqual(failing_table, None)
+        self.assertEqual(locked, True)
+
+    def test_migration_backfills(self):
+        # Arrange
+        migration = management.load_migrations()[0]
+
+        conn = pg.connect(os.environ['DB_CONNECTION'],
+            cursor_factory=RecordingCursor)
+        conn.autocommit = True
+
+        cursor = conn.cursor()
+
+        # Corrupt stored counters
+        cursor.execute(
+            """
+            UPDATE drawing
+               SET like_count = like_count + 5;
+
+            UPDATE post
+               SET comment_count = 0;
+            """
+            )
+
+        cursor.execute('SELECT COUNT(*) FROM drawing;')
+        drawing_count = cursor.fetchone()[0]
+
+        cursor.execute('SELECT COUNT(*) FROM post;')
+        post_count = cursor.fetchone()[0]
+
+        del plain_queries[:]
+
+        # Act
+        management.run_backfills(cursor, migration, 3)
+
+        batch_count = len(plain_queries) - 1
+
+        cursor.execute(
+            """
+            SELECT COUNT(*)
+              FROM drawing
+             WHERE like_count != (
+                                  SELECT COUNT(*)
+                                    FROM drawing_like
+                                   WHERE drawing_like.drawing_id =
+                                         drawing.drawing_id
+                   );
+            """
+            )
+        wrong_like_counts = cursor.fetchone()[0]
+
+        cursor.execute(
+            """
+            SELECT COUNT(*)
+              FROM post
+             WHERE comment_count != (
+                                     SELECT COUNT(*)
+                                       FROM comment
+                                      WHERE comment.post_id = post.post_id
+                   );
+            """
+            )
+        wrong_comment_counts = cursor.fetchone()[0]
+
+        cursor.close()
+        conn.close()
+
+        # Assert
+        self.assertEqual(wrong_like_counts, 0)
+        self.assertEqual(wrong_comment_counts, 0)
+
+        # Ensure each row was read in one batch of 3, with an empty batch
+        # ending each backfill
+        self.assertEqual(batch_count,
+            ceil(drawing_count / 3) + 1 + ceil(post_count / 3) + 1)
@@ -0,0 +1,516 @@
+import json
+
+from base64 import urlsafe_b64encode
+from unittest.mock import patch
+from utils import db
+from utils.tests import CrystalPrismTestCase
+
+
+# Test leaderboard endpoints shared by the games through Shapes in Rain's
+# /api/shapes-in-rain/scores endpoint [GET, POST]
+class TestScores(CrystalPrismTestCase):
+    def test_scores_get_cursor(self):
+        # Arrange
+        query = {'cursor': '', 'limit': 2}
+        all_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string={'end': 100}
+            )
+        all_scores = json.loads(all_response.get_data(as_text=True))
+        scores = []
+
+        # Act
+        while query['cursor'] is not None:
+            get_response = self.client.get(
+                '/api/shapes-in-rain/scores',
+                query_string=query
+                )
+            page = json.loads(get_response.get_data(as_text=True))
+            scores += page['items']
+            query['cursor'] = page['next_cursor']
+
+            self.assertEqual(get_response.status_code, 200)
+            self.assertLessEqual(len(page['items']), 2)
+
+        # Assert
+        self.assertEqual(len(scores), 5)
+        self.assertEqual(scores, all_scores)
+
+    def test_scores_get_in_memory(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        # Get scores once to load high scores into memory
+        self.client.get('/api/shapes-in-rain/scores')
+
+        post_response = self.client.post(
+            '/api/shapes-in-rain/score',
+            headers=header,
+            data=json.dumps({'score': 1000000}),
+            content_type='application/json'
+            )
+        score_id = int(post_response.get_data(as_text=True))
+
+        # Act
+        with patch('utils.leaderboard.db.get_conn',
+                   wraps=db.get_conn) as get_conn:
+            get_response = self.client.get('/api/shapes-in-rain/scores')
+            scores = json.loads(get_response.get_data(as_text=True))
+
+            self.client.delete(
+                '/api/shapes-in-rain/score/' + str(score_id),
+                headers=header
+                )
+            get_conn.reset_mock()
+
+            deleted_response = self.client.get('/api/shapes-in-rain/scores')
+            deleted_scores = json.loads(
+                deleted_response.get_data(as_text=True)
+                )
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(scores[0]['score_id'], score_id)
+        self.assertEqual(scores[0]['username'], self.username)
+        self.assertEqual(len(scores), 5)
+        self.assertEqual(deleted_response.status_code, 200)
+        self.assertEqual(score_id in [
+            score['score_id'] for score in deleted_scores], False)
+        self.assertEqual(len(deleted_scores), 5)
+        self.assertEqual(get_conn.called, False)
+
+    def test_scores_get_window(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        query = {'window': 'daily'}
+        score_ids = []
+
+        for score in [1000, 500]:
+            post_response = self.client.post(
+                '/api/shapes-in-rain/score',
+                headers=header,
+                data=json.dumps({'score': score}),
+                content_type='application/json'
+                )
+            score_ids.append(post_response.get_data(as_text=True))
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string=query
+            )
+        scores = json.loads(get_response.get_data(as_text=True))
+
+        # Delete player's best score for the day
+        self.client.delete(
+            '/api/shapes-in-rain/score/' + score_ids[0],
+            headers=header
+            )
+
+        deleted_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string=query
+            )
+        deleted_scores = json.loads(deleted_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(len(scores), 1)
+        self.assertEqual(scores[0]['score'], 1000)
+        self.assertEqual(scores[0]['username'], self.username)
+        self.assertEqual(deleted_response.status_code, 200)
+        self.assertEqual(len(deleted_scores), 1)
+        self.assertEqual(deleted_scores[0]['score'], 500)
+
+    def test_scores_get_window_error(self):
+        # Arrange
+        query = {'window': 'yearly'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error,
+            'Window param must be daily, weekly or monthly')
+
+    def test_scores_get_distinct(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        query = {'distinct': 'player'}
+
+        for score in [1000000, 999999]:
+            self.client.post(
+                '/api/shapes-in-rain/score',
+                headers=header,
+                data=json.dumps({'score': score}),
+                content_type='application/json'
+                )
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string=query
+            )
+        scores = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual([score['score'] for score in scores],
+            [1000000, 55])
+        self.assertEqual([score['username'] for score in scores],
+            [self.username, 'user1'])
+
+    def test_scores_get_distinct_error(self):
+        # Arrange
+        query = {'distinct': 'score'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Distinct param must be player')
+
+    def test_scores_get_cursor_error(self):
+        # Arrange
+        query = {'cursor': 'invalid'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Invalid cursor')
+
+    def test_scores_get_cursor_type_error(self):
+        # Arrange - cursors that decode but hold values of the wrong type
+        cursors = [urlsafe_b64encode(json.dumps(values).encode()).decode()
+            for values in [[{}, 'x'], ['x', '1'], [10, 1], [10, '1' * 20]]]
+
+        # Act
+        get_responses = [self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string={'cursor': cursor}
+            ) for cursor in cursors]
+
+        # Assert
+        for get_response in get_responses:
+            self.assertEqual(get_response.status_code, 400)
+            self.assertEqual(get_response.get_data(as_text=True),
+                'Invalid cursor')
+
+    def test_scores_post(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        post_data = {'scores': [60, 10, 58]}
+
+        # Act
+        post_response = self.client.post(
+            '/api/shapes-in-rain/scores',
+            headers=header,
+            data=json.dumps(post_data),
+            content_type='application/json'
+            )
+        score_ids = json.loads(post_response.get_data(as_text=True))
+
+        get_responses = [self.client.get(
+            '/api/shapes-in-rain/score/' + str(score_id)
+            ) for score_id in score_ids]
+
+        get_scores_response = self.client.get('/api/shapes-in-rain/scores')
+        scores = json.loads(get_scores_response.get_data(as_text=True))
+
+        get_user_response = self.client.get(
+            '/api/user/' + self.username
+            )
+        user_data = json.loads(get_user_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(post_response.status_code, 201)
+        self.assertEqual(len(score_ids), 3)
+
+        # Ensure score ids are returned in the order scores were sent
+        self.assertEqual([json.loads(response.get_data(
+            as_text=True))['score'] for response in get_responses],
+            [60, 10, 58])
+
+        self.assertEqual([score['score'] for score in scores[:3]],
+            [60, 58, 55])
+        self.assertEqual(user_data['shapes_score_count'], 3)
+        self.assertEqual(user_data['shapes_high_score'], 60)
+
+    def test_scores_post_unauthorized_error(self):
+        # Act
+        post_response = self.client.post('/api/shapes-in-rain/scores')
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 401)
+        self.assertEqual(error, 'Unauthorized')
+
+    def test_scores_post_data_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        post_data = {'scores': []}
+
+        # Act
+        post_response = self.client.post(
+            '/api/shapes-in-rain/scores',
+            headers=header,
+            data=json.dumps(post_data),
+            content_type='application/json'
+            )
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 400)
+        self.assertEqual(error, 'Request must contain scores')
+
+    def test_scores_post_score_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        post_data = {'scores': [100, '']}
+
+        # Act
+        post_response = self.client.post(
+            '/api/shapes-in-rain/scores',
+            headers=header,
+            data=json.dumps(post_data),
+            content_type='application/json'
+            )
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 400)
+        self.assertEqual(error, 'Scores must be integers')
+
+    def test_scores_post_boolean_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        post_data = {'scores': [5, 500, True]}
+
+        # Act
+        post_response = self.client.post(
+            '/api/shapes-in-rain/scores',
+            headers=header,
+            data=json.dumps(post_data),
+            content_type='application/json'
+            )
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 400)
+        self.assertEqual(error, 'Scores must be integers')
+
+    def test_scores_post_size_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        post_data = {'scores': [100, 200, 300]}
+
+        # Act
+        with patch.dict('os.environ', {'SCORE_BATCH_SIZE': '2'}):
+            post_response = self.client.post(
+                '/api/shapes-in-rain/scores',
+                headers=header,
+                data=json.dumps(post_data),
+                content_type='application/json'
+                )
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 400)
+        self.assertEqual(error, 'Too many scores')
+
+
+# Test leaderboard /api/shapes-in-rain/rank and /scores/around endpoints [GET]
+class TestRank(CrystalPrismTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Post a score that ranks third among the sample scores
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        self.client.post(
+            '/api/shapes-in-rain/score',
+            headers=header,
+            data=json.dumps({'score': 23}),
+            content_type='application/json'
+            )
+
+    def test_rank_get(self):
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/rank/' + self.username
+            )
+        score = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(score['rank'], 3)
+        self.assertEqual(score['score'], 23)
+        self.assertEqual(score['username'], self.username)
+
+    def test_rank_get_tie(self):
+        # Arrange
+        username = self.username
+
+        # Post a score tied with user's score, which ranks higher as the
+        # newer score
+        second_username = 'second_username'
+        self.create_user(second_username)
+        self.login(second_username)
+
+        self.client.post(
+            '/api/shapes-in-rain/score',
+            headers={'Authorization': 'Bearer ' + self.token},
+            data=json.dumps({'score': 23}),
+            content_type='application/json'
+            )
+
+        # Act
+        get_response = self.client.get('/api/shapes-in-rain/rank/' + username)
+        score = json.loads(get_response.get_data(as_text=True))
+
+        second_get_response = self.client.get(
+            '/api/shapes-in-rain/rank/' + second_username
+            )
+        second_score = json.loads(second_get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(score['rank'], 4)
+        self.assertEqual(second_score['rank'], 3)
+
+        # Delete second user account for clean-up
+        self.delete_user(second_username)
+        self.username = username
+
+    def test_rank_get_lowest(self):
+        # Arrange
+        username = self.username
+
+        # Post a score lower than every other score
+        second_username = 'second_username'
+        self.create_user(second_username)
+        self.login(second_username)
+
+        self.client.post(
+            '/api/shapes-in-rain/score',
+            headers={'Authorization': 'Bearer ' + self.token},
+            data=json.dumps({'score': -2147483648}),
+            content_type='application/json'
+            )
+
+        all_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string={'end': 1000}
+            )
+        all_scores = json.loads(all_response.get_data(as_text=True))
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/rank/' + second_username
+            )
+        score = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(score['rank'], len(all_scores))
+        self.assertEqual(score['score'], -2147483648)
+
+        # Delete second user account for clean-up
+        self.delete_user(second_username)
+        self.username = username
+
+    def test_rank_get_not_found_error(self):
+        # Arrange
+        player_name = 'user2'
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/rank/' + player_name
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 404)
+        self.assertEqual(error, 'Not found')
+
+    def test_scores_around_get(self):
+        # Arrange
+        query = {'count': 1}
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores/around/' + self.username,
+            query_string=query
+            )
+        scores = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual([score['score'] for score in scores],
+            [24, 23, 22])
+        self.assertEqual([score['rank'] for score in scores], [2, 3, 4])
+        self.assertEqual(scores[1]['username'], self.username)
+
+    def test_scores_around_get_error(self):
+        # Arrange
+        query = {'count': 51}
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores/around/' + self.username,
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Count param must be between 0 and 50')
+
+    def test_scores_around_get_count_type_error(self):
+        # Arrange
+        query = {'count': 'x'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores/around/' + self.username,
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Count param must be between 0 and 50')
@@ -1,7 +1,13 @@
+import json
 import os
+import psycopg2 as pg
 
+from unittest.mock import MagicMock, patch
+from utils import db, drawing_ids, hashing, leaderboard
 from utils.tests import CrystalPrismTestCase
 
+import management
+
 
 # Test /api/ping endpoint [GET]
 class TestPing(CrystalPrismTestCase):
@@ -11,3 +17,242 @@ class TestPing(CrystalPrismTestCase):
 
         # Assert
         self.assertEqual(response.status_code, 200)
+
+
+# Test /api/stats endpoint [GET]
+class TestStats(CrystalPrismTestCase):
+    def test_stats_get(self):
+        # Arrange
+        admin_username = 'admin_username'
+        self.create_user(admin_username)
+
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            UPDATE cp_user
+               SET is_admin = TRUE
+             WHERE username = %(username)s;
+            """,
+            {'username': admin_username}
+            )
+
+        conn.commit()
+
+        cursor.close()
+        conn.close()
+
+        self.login(admin_username)
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        # Act
+        get_response = self.client.get('/api/stats', headers=header)
+        stats = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(stats['db_pool']['in_use'], 0)
+        self.assertEqual(stats['db_pool']['checkouts'] > 0, True)
+        self.assertEqual(stats['hashing']['completed'] > 0, True)
+
+        # Delete admin account for clean-up
+        self.delete_user(admin_username)
+
+    def test_stats_get_not_admin_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        # Act
+        get_response = self.client.get('/api/stats', headers=header)
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 401)
+        self.assertEqual(error, 'Unauthorized')
+
+
+# Test database connection pool shared by request handlers
+class TestConnectionPool(CrystalPrismTestCase):
+    def test_connection_reused_across_requests(self):
+        # Act
+        first_response = self.client.get('/api/shapes-in-rain/scores')
+        second_response = self.client.get('/api/rhythm-of-life/scores')
+        stats = db.pool_stats()
+
+        # Assert
+        self.assertEqual(first_response.status_code, 200)
+        self.assertEqual(second_response.status_code, 200)
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['idle'], 1)
+
+
+# Test management command that repairs denormalized like and comment counts
+class TestRepairCounts(CrystalPrismTestCase):
+    def test_repair_counts(self):
+        # Arrange
+        conn = pg.connect(os.environ['DB_CONNECTION'])
+        cursor = conn.cursor()
+
+        # Corrupt stored counters
+        cursor.execute(
+            """
+            UPDATE drawing
+               SET like_count = like_count + 5;
+
+            UPDATE post
+               SET comment_count = 0;
+            """
+            )
+
+        conn.commit()
+
+        # Act
+        management.repair_counts()
+
+        cursor.execute(
+            """
+            SELECT COUNT(*)
+              FROM drawing
+             WHERE like_count != (
+                                  SELECT COUNT(*)
+                                    FROM drawing_like
+                                   WHERE drawing_like.drawing_id =
+                                         drawing.drawing_id
+                   );
+            """
+            )
+        wrong_like_counts = cursor.fetchone()[0]
+
+        cursor.execute(
+            """
+            SELECT COUNT(*)
+              FROM post
+             WHERE comment_count != (
+                                     SELECT COUNT(*)
+                                       FROM comment
+                                      WHERE comment.post_id = post.post_id
+                   );
+            """
+            )
+        wrong_comment_counts = cursor.fetchone()[0]
+
+        cursor.close()
+        conn.close()
+
+        get_response = self.client.get('/api/canvashare/drawing/1')
+        drawing = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(wrong_like_counts, 0)
+        self.assertEqual(wrong_comment_counts, 0)
+        self.assertEqual(drawing['like_count'], len(drawing['likers']))
+
+
+# Test conversion between hexadecimal and stored integer drawing ids
+class TestDrawingIds(CrystalPrismTestCase):
+    def test_drawing_id_round_trip(self):
+        # Arrange
+        hex_ids = ['0000000000000000', '0000000000000001', '7fffffffffffffff',
+            '8000000000000000', 'ffffffffffffffff']
+
+        # Act
+        stored_ids = [drawing_ids.to_db(hex_id) for hex_id in hex_ids]
+
+        # Assert
+        self.assertEqual(stored_ids, [0, 1, 2 ** 63 - 1, -2 ** 63, -1])
+        self.assertEqual([drawing_ids.to_api(stored_id)
+            for stored_id in stored_ids], hex_ids)
+
+    def test_drawing_id_invalid(self):
+        # Act
+        stored_ids = [drawing_ids.to_db(hex_id) for hex_id in
+            ['not-a-drawing', '1' * 17, '-1', '', None]]
+
+        # Assert
+        self.assertEqual(stored_ids, [None] * 5)
+
+
+# Test bcrypt hashing on bounded thread pool
+class TestHashing(CrystalPrismTestCase):
+    def test_hash_and_check_password(self):
+        # Arrange
+        completed = hashing.get_stats()['completed']
+
+        # Act
+        hashed_password = hashing.hash_password('password')
+        correct = hashing.check_password('password', hashed_password)
+        incorrect = hashing.check_password('incorrect', hashed_password)
+        stats = hashing.get_stats()
+
+        # Assert
+        self.assertEqual(correct, True)
+        self.assertEqual(incorrect, False)
+        self.assertEqual(stats['completed'], completed + 3)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['running'], 0)
+
+    def test_hash_rejected_when_queue_full(self):
+        # Arrange - all hashing threads are busy and queue holds no jobs
+        settings = {'BCRYPT_CONCURRENCY': '2', 'BCRYPT_QUEUE_SIZE': '0'}
+
+        # Act
+        with patch.dict('os.environ', settings), \
+             patch.dict(hashing._stats, {'running': 2}):
+            with self.assertRaises(hashing.HashingBusyError):
+                hashing.hash_password('password')
+
+            stats = hashing.get_stats()
+
+        # Assert
+        self.assertEqual(stats['rejected'] > 0, True)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['queue_size'], 0)
+
+
+# Test in-memory top scores used to serve leaderboard pages
+class TestLeaderboard(CrystalPrismTestCase):
+    def test_leaderboard_add_and_remove(self):
+        # Arrange
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [
+            {'created': None, 'score': score, 'score_id': score_id,
+            'username': 'user1'}
+            for score_id, score in [(1, 30), (2, 20), (3, 10)]
+            ]
+        high_scores = leaderboard.Leaderboard('shapes_score', 3, 60)
+        page = {'limit': 3, 'offset': 0, 'after_key': None, 'after_id': None}
+        extra_page = dict(page, limit=4)
+        after_page = dict(page, limit=1, after_key=20, after_id='2')
+
+        # Act
+        high_scores.load(cursor)
+        loaded_scores = high_scores.read_page(page)
+        extra_scores = high_scores.read_page(extra_page)
+        after_scores = high_scores.read_page(after_page)
+
+        # Score below lowest held score is not held
+        high_scores.add({'created': None, 'score': 5, 'score_id': 4,
+            'username': 'user1'})
+        low_scores = high_scores.read_page(page)
+
+        high_scores.add({'created': None, 'score': 25, 'score_id': 5,
+            'username': 'user1'})
+        added_scores = high_scores.read_page(page)
+
+        high_scores.remove(1)
+        removed_scores = high_scores.read_page(page)
+
+        # Assert
+        self.assertEqual([score['score_id'] for score in loaded_scores],
+            [1, 2, 3])
+        self.assertEqual(extra_scores, None)
+        self.assertEqual([score['score_id'] for score in after_scores], [3])
+        self.assertEqual([score['score_id'] for score in low_scores],
+            [1, 2, 3])
+        self.assertEqual([score['score_id'] for score in added_scores],
+            [1, 5, 2])
+        self.assertEqual(removed_scores, None)
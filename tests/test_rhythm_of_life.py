@@ -334,3 +334,23 @@ class TestScores(CrystalPrismTestCase):
         # Assert
         self.assertEqual(get_response.status_code, 400)
         self.assertEqual(error, 'Start param cannot be greater than end')
+
+
+# Test /api/rhythm-of-life/rank endpoint [GET]; the leaderboard engine is
+# tested in test_leaderboard
+class TestRank(CrystalPrismTestCase):
+    def test_rank_get(self):
+        # Arrange
+        player_name = 'user1'
+
+        # Act
+        get_response = self.client.get(
+            '/api/rhythm-of-life/rank/' + player_name
+            )
+        score = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(score['rank'], 1)
+        self.assertEqual(score['score'], 250)
+        self.assertEqual(score['username'], player_name)
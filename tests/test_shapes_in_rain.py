@@ -148,6 +148,28 @@ class TestScore(CrystalPrismTestCase):
         self.assertEqual(post_response.status_code, 400)
         self.assertEqual(error, 'Score must be an integer')
 
+    def test_score_post_boolean_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        post_data = {
+            'score': True
+            }
+
+        # Act
+        post_response = self.client.post(
+            '/api/shapes-in-rain/score',
+            headers=header,
+            data=json.dumps(post_data),
+            content_type='application/json'
+            )
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 400)
+        self.assertEqual(error, 'Score must be an integer')
+
     def test_score_delete_unauthorized_error(self):
         # Arrange
         score_id = '1'
@@ -255,6 +277,36 @@ class TestScores(CrystalPrismTestCase):
         self.assertEqual(get_response.status_code, 400)
         self.assertEqual(error, 'Start param cannot be greater than end')
 
+    def test_scores_get_negative_error(self):
+        # Arrange
+        query = {'start': -3, 'end': -1}
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Start and end params cannot be negative')
+
+    def test_scores_get_type_error(self):
+        # Arrange
+        query = {'start': 'abc'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/shapes-in-rain/scores',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Start and end params must be integers')
+
     def test_user_scores_get(self):
         # Arrange
         player_name = 'user1'
@@ -1,6 +1,10 @@
 import json
+import psycopg2 as pg
+import psycopg2.extras
 import re
 
+from base64 import urlsafe_b64encode
+from unittest.mock import patch
 from utils.tests import CrystalPrismTestCase
 
 
@@ -649,6 +653,95 @@ class TestPosts(CrystalPrismTestCase):
         self.assertEqual(get_response.status_code, 400)
         self.assertEqual(error, 'Start param cannot be greater than end')
 
+    def test_posts_get_cursor(self):
+        # Arrange
+        query = {'cursor': '', 'limit': 3}
+        all_response = self.client.get(
+            '/api/thought-writer/posts',
+            query_string={'end': 100}
+            )
+        all_posts = json.loads(all_response.get_data(as_text=True))
+        posts = []
+
+        # Act
+        while query['cursor'] is not None:
+            get_response = self.client.get(
+                '/api/thought-writer/posts',
+                query_string=query
+                )
+            page = json.loads(get_response.get_data(as_text=True))
+            posts += page['items']
+            query['cursor'] = page['next_cursor']
+
+            self.assertEqual(get_response.status_code, 200)
+            self.assertLessEqual(len(page['items']), 3)
+
+        # Assert
+        self.assertEqual(len(posts), 10)
+        self.assertEqual(posts, all_posts)
+
+    def test_posts_get_cursor_error(self):
+        # Arrange
+        query = {'cursor': 'invalid'}
+
+        # Act
+        get_response = self.client.get(
+            '/api/thought-writer/posts',
+            query_string=query
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 400)
+        self.assertEqual(error, 'Invalid cursor')
+
+    def test_posts_get_cursor_type_error(self):
+        # Arrange - cursors that decode but hold values of the wrong type
+        cursor_values = [
+            [{}, 'x'],
+            ['x', '1'],
+            [10, '1'],
+            ['2018-01-01T00:00:00+00:00', 'x']
+            ]
+        cursors = [urlsafe_b64encode(json.dumps(values).encode()).decode()
+            for values in cursor_values]
+
+        # Act
+        get_responses = [self.client.get(
+            '/api/thought-writer/posts',
+            query_string={'cursor': cursor}
+            ) for cursor in cursors]
+
+        # Assert
+        for get_response in get_responses:
+            self.assertEqual(get_response.status_code, 400)
+            self.assertEqual(get_response.get_data(as_text=True),
+                'Invalid cursor')
+
+    def test_posts_get_query_count(self):
+        # Arrange
+        execute = pg.extras.DictCursor.execute
+
+        # Act
+        with patch.object(pg.extras.DictCursor, 'execute', autospec=True,
+                          side_effect=execute) as execute_mock:
+            self.client.get(
+                '/api/thought-writer/posts',
+                query_string={'end': 1}
+                )
+            one_post_count = execute_mock.call_count
+            execute_mock.reset_mock()
+
+            self.client.get(
+                '/api/thought-writer/posts',
+                query_string={'end': 10}
+                )
+            ten_posts_count = execute_mock.call_count
+
+        # Assert
+        self.assertEqual(one_post_count, 1)
+        self.assertEqual(ten_posts_count, one_post_count)
+
     def test_user_public_posts_get(self):
         # Arrange
         writer_name = 'user1'
@@ -2,16 +2,43 @@ import boto3
 import hmac
 import json
 import os
+import psycopg2 as pg
+import psycopg2.extensions
 import re
 
 from base64 import b64encode, urlsafe_b64encode
 from hashlib import sha256
 from math import floor
 from time import time
-from unittest.mock import patch
+from server import app
+from unittest.mock import MagicMock, patch
+from user import user
+from utils import db, hashing
 from utils.tests import CrystalPrismTestCase
 
 
+class StaleCheckCursor(pg.extensions.cursor):
+    # Cursor whose existence checks find nothing, as if a conflicting row were
+    # added by another request right after each check
+    def execute(self, query, params=None):
+        self.is_check = 'SELECT EXISTS' in query
+
+        return super().execute(query, params)
+
+    def fetchone(self):
+        row = super().fetchone()
+
+        return (False,) if self.is_check else row
+
+
+class RecordingCursor(pg.extensions.cursor):
+    # Cursor that records each query it runs
+    def execute(self, query, params=None):
+        self.queries = getattr(self, 'queries', []) + [query]
+
+        return super().execute(query, params)
+
+
 # Test /api/login endpoint [GET]
 class TestLogin(CrystalPrismTestCase):
     def test_login_get(self):
@@ -38,6 +65,7 @@ class TestLogin(CrystalPrismTestCase):
             r'\.[a-zA-Z0-9-_]+={0,2}$'
             )
         self.assertEqual(bool(token_pattern.match(token)), True)
+        self.assertEqual(bool(get_response.headers['X-Refresh-Token']), True)
 
     def test_login_get_verify_error(self):
         # Act
@@ -114,6 +142,137 @@ class TestLogin(CrystalPrismTestCase):
         self.assertEqual(get_response.status_code, 401)
         self.assertEqual(error, 'Unauthorized')
 
+    def test_login_get_busy_error(self):
+        # Arrange
+        self.create_user()
+
+        b64_user_pass = str(b64encode((self.username + ':password').encode())
+            .decode())
+        header = {'Authorization': 'Basic ' + b64_user_pass}
+
+        # Act - log in while password hashing queue is full
+        with patch('user.user.hashing.check_password',
+                   side_effect=hashing.HashingBusyError):
+            get_response = self.client.get(
+                '/api/login',
+                headers=header
+            )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 503)
+        self.assertEqual(error, 'Server busy')
+        self.assertEqual(get_response.headers['Retry-After'], '1')
+
+
+# Test /api/refresh endpoint [POST]
+class TestRefresh(CrystalPrismTestCase):
+    def get_refresh_token(self):
+        b64_user_pass = str(b64encode((self.username + ':password').encode())
+            .decode())
+        header = {'Authorization': 'Basic ' + b64_user_pass}
+
+        login_response = self.client.get(
+            '/api/login',
+            headers=header
+        )
+
+        return login_response.headers['X-Refresh-Token']
+
+    def test_refresh_post(self):
+        # Arrange
+        self.create_user()
+        refresh_token = self.get_refresh_token()
+        header = {'X-Refresh-Token': refresh_token}
+
+        # Act
+        with patch('user.user.hashing.check_password') as check_password:
+            post_response = self.client.post(
+                '/api/refresh',
+                headers=header
+                )
+        token = post_response.get_data(as_text=True)
+
+        verify_response = self.client.get(
+            '/api/user/verify',
+            headers={'Authorization': 'Bearer ' + token}
+            )
+
+        # Attempt to reuse refresh token
+        reused_response = self.client.post(
+            '/api/refresh',
+            headers=header
+            )
+
+        # Assert
+        self.assertEqual(post_response.status_code, 200)
+        self.assertEqual(check_password.called, False)
+        self.assertEqual(verify_response.status_code, 200)
+        self.assertEqual(json.loads(verify_response.get_data(as_text=True))
+            ['username'], self.username)
+        self.assertEqual(
+            post_response.headers['X-Refresh-Token'] != refresh_token, True
+            )
+        self.assertEqual(reused_response.status_code, 401)
+
+    def test_refresh_post_missing_error(self):
+        # Act
+        post_response = self.client.post('/api/refresh')
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 401)
+        self.assertEqual(error, 'Unauthorized')
+
+    def test_refresh_post_deleted_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        refresh_token = self.get_refresh_token()
+
+        # Soft-delete user
+        self.client.delete(
+            '/api/user/' + self.username,
+            headers={'Authorization': 'Bearer ' + self.token}
+        )
+
+        # Act
+        post_response = self.client.post(
+            '/api/refresh',
+            headers={'X-Refresh-Token': refresh_token}
+            )
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(post_response.status_code, 401)
+        self.assertEqual(error, 'Unauthorized')
+
+    def test_refresh_post_password_changed_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        refresh_token = self.get_refresh_token()
+
+        # Change user's password
+        patch_response = self.client.patch(
+            '/api/user/' + self.username,
+            headers={'Authorization': 'Bearer ' + self.token},
+            data=json.dumps({'password': 'new_password'}),
+            content_type='application/json'
+            )
+
+        # Act
+        post_response = self.client.post(
+            '/api/refresh',
+            headers={'X-Refresh-Token': refresh_token}
+            )
+        error = post_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(patch_response.status_code, 200)
+        self.assertEqual(post_response.status_code, 401)
+        self.assertEqual(error, 'Unauthorized')
+
 
 # Test /api/user endpoint [POST, GET, PATCH, DELETE]
 class TestUser(CrystalPrismTestCase):
@@ -519,6 +678,118 @@ class TestUser(CrystalPrismTestCase):
         self.assertEqual(patch_response.status_code, 409)
         self.assertEqual(error, 'Email address already claimed')
 
+    def test_user_patch_concurrent_claim_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        username_data = {'username': 'user1'}
+        email_data = {'email': 'admin@crystalprism.io'}
+
+        # Act - update account as if username and email address were claimed
+        # by another request after they were checked
+        with patch('user.user.db.get_conn', side_effect=lambda: pg.connect(
+                os.environ['DB_CONNECTION'],
+                cursor_factory=StaleCheckCursor)):
+            username_response = self.client.patch(
+                '/api/user/' + self.username,
+                headers=header,
+                data=json.dumps(username_data),
+                content_type='application/json'
+                )
+
+            email_response = self.client.patch(
+                '/api/user/' + self.username,
+                headers=header,
+                data=json.dumps(email_data),
+                content_type='application/json'
+                )
+
+        # Assert
+        self.assertEqual(username_response.status_code, 409)
+        self.assertEqual(username_response.get_data(as_text=True),
+            'Username already exists')
+        self.assertEqual(email_response.status_code, 409)
+        self.assertEqual(email_response.get_data(as_text=True),
+            'Email address already claimed')
+
+    def test_user_patch_partial(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        data = {'icon_color': '#ff0000'}
+
+        # Act
+        with patch('user.user.hashing.hash_password') as hash_password:
+            patch_response = self.client.patch(
+                '/api/user/' + self.username,
+                headers=header,
+                data=json.dumps(data),
+                content_type='application/json'
+                )
+
+        get_response = self.client.get(
+            '/api/user/' + self.username,
+            headers={'Authorization': 'Bearer ' +
+                patch_response.get_data(as_text=True)}
+            )
+        user_data = json.loads(get_response.get_data(as_text=True))
+
+        # Log in with unchanged password
+        self.login()
+
+        # Assert
+        self.assertEqual(patch_response.status_code, 200)
+        self.assertEqual(hash_password.called, False)
+        self.assertEqual(user_data['icon_color'], '#ff0000')
+        self.assertEqual(user_data['background_color'], '#ffffff')
+        self.assertEqual(user_data['username'], self.username)
+        self.assertEqual(bool(self.token), True)
+
+    def test_user_patch_type_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        data = {'name_public': 'yes'}
+
+        # Act
+        patch_response = self.client.patch(
+            '/api/user/' + self.username,
+            headers=header,
+            data=json.dumps(data),
+            content_type='application/json'
+            )
+        error = patch_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(patch_response.status_code, 400)
+        self.assertEqual(error, 'Invalid value for name_public')
+
+    def test_user_get_counts(self):
+        # Arrange
+        username = 'user1'
+
+        # Act
+        with patch('user.user.db.get_conn', wraps=db.get_conn) as get_conn:
+            get_response = self.client.get(
+                '/api/user/' + username
+                )
+        user_data = json.loads(get_response.get_data(as_text=True))
+
+        # Assert
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(get_conn.call_count, 1)
+        self.assertEqual(user_data['comment_count'], 10)
+        self.assertEqual(user_data['drawing_count'], 10)
+        self.assertEqual(user_data['drawing_like_count'], 10)
+        self.assertEqual(user_data['post_count'], 10)
+        self.assertEqual(user_data['rhythm_high_score'], 250)
+        self.assertEqual(user_data['rhythm_score_count'], 5)
+        self.assertEqual(user_data['shapes_high_score'], 55)
+        self.assertEqual(user_data['shapes_score_count'], 5)
+
     def test_user_delete_unauthorized_error(self):
         # Arrange
         username = 'user1'
@@ -758,10 +1029,11 @@ class TestUserData(CrystalPrismTestCase):
             )
 
         # Act - delete first user account as first user
-        delete_response = self.client.delete(
-            '/api/user/data/' + first_username,
-            headers=first_user_header
-            )
+        with patch.object(db, 'get_conn', wraps=db.get_conn) as get_conn:
+            delete_response = self.client.delete(
+                '/api/user/data/' + first_username,
+                headers=first_user_header
+                )
 
         # Assert
         self.assertEqual(delete_unauthorized_response.status_code, 401)
@@ -773,6 +1045,14 @@ class TestUserData(CrystalPrismTestCase):
         boto3.resource.return_value.Bucket.assert_called_with(
             os.environ['S3_BUCKET']
             )
+        resource.Object.assert_called_with(
+            os.environ['S3_BUCKET'],
+            os.environ['S3_CANVASHARE_DIR'] + drawing_id + '.png'
+            )
+
+        # Ensure user's drawing was deleted without borrowing a second
+        # connection from pool
+        self.assertEqual(get_conn.call_count, 1)
 
         # Ensure deleted user account isn't found when user is searched for
         deleted_get_response = self.client.get(
@@ -930,6 +1210,7 @@ class TestVerify(CrystalPrismTestCase):
         # Assert
         self.assertEqual(get_response.status_code, 200)
         self.assertEqual(payload['username'], self.username)
+        self.assertEqual(isinstance(payload['member_id'], str), True)
 
         # Ensure expiration time is 10-digit integer
         self.assertEqual(isinstance(payload['exp'], int), True)
@@ -1054,6 +1335,256 @@ class TestVerify(CrystalPrismTestCase):
         self.assertEqual(get_response.status_code, 401)
         self.assertEqual(error, 'Unauthorized')
 
+    def test_verify_once_per_request(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        # Act
+        with patch('user.user.check_token',
+                   wraps=user.check_token) as check_token:
+            with app.test_request_context(headers=header):
+                requester, error = user.authenticate()
+                second_requester, second_error = user.authenticate()
+
+        # Assert
+        self.assertEqual(check_token.call_count, 1)
+        self.assertEqual(requester, self.username)
+        self.assertEqual(second_requester, self.username)
+        self.assertEqual(error, None)
+        self.assertEqual(second_error, None)
+
+    def test_verify_status_cached(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        # Verify token once to cache account status
+        self.client.get(
+            '/api/user/verify',
+            headers=header
+            )
+
+        # Act
+        with patch('user.user.db.get_conn', wraps=db.get_conn) as get_conn:
+            cached_response = self.client.get(
+                '/api/user/verify',
+                headers=header
+                )
+            cached_count = get_conn.call_count
+
+        # Soft-delete user, which removes cached account status
+        self.client.delete(
+            '/api/user/' + self.username,
+            headers=header
+        )
+
+        deleted_response = self.client.get(
+            '/api/user/verify',
+            headers=header
+            )
+
+        # Assert
+        self.assertEqual(cached_response.status_code, 200)
+        self.assertEqual(cached_count, 0)
+        self.assertEqual(deleted_response.status_code, 401)
+
+    @patch.dict(os.environ, {'TOKEN_VERIFICATION': 'stateless'})
+    def test_verify_stateless(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        # Verify token once to load revocation filter
+        self.client.get(
+            '/api/user/verify',
+            headers=header
+            )
+
+        # Act
+        with patch('user.user.db.get_conn', wraps=db.get_conn) as get_conn:
+            stateless_response = self.client.get(
+                '/api/user/verify',
+                headers=header
+                )
+            stateless_count = get_conn.call_count
+
+        # Soft-delete user, which revokes user's tokens
+        self.client.delete(
+            '/api/user/' + self.username,
+            headers=header
+        )
+
+        revoked_response = self.client.get(
+            '/api/user/verify',
+            headers=header
+            )
+
+        # Assert
+        self.assertEqual(stateless_response.status_code, 200)
+        self.assertEqual(stateless_count, 0)
+        self.assertEqual(revoked_response.status_code, 401)
+
+    def test_verify_password_changed_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        # Verify token once to cache account status
+        self.client.get(
+            '/api/user/verify',
+            headers=header
+            )
+
+        # Change user's password
+        patch_response = self.client.patch(
+            '/api/user/' + self.username,
+            headers=header,
+            data=json.dumps({'password': 'new_password'}),
+            content_type='application/json'
+            )
+        new_header = {'Authorization': 'Bearer ' +
+            patch_response.get_data(as_text=True)}
+
+        # Act
+        old_response = self.client.post(
+            '/api/shapes-in-rain/score',
+            headers=header,
+            data=json.dumps({'score': 100}),
+            content_type='application/json'
+            )
+        error = old_response.get_data(as_text=True)
+
+        new_response = self.client.get(
+            '/api/user/verify',
+            headers=new_header
+            )
+
+        # Assert
+        self.assertEqual(patch_response.status_code, 200)
+        self.assertEqual(old_response.status_code, 401)
+        self.assertEqual(error, 'Unauthorized')
+        self.assertEqual(new_response.status_code, 200)
+
+    @patch.dict(os.environ, {'TOKEN_VERIFICATION': 'stateless'})
+    def test_verify_stateless_password_changed_error(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+
+        # Verify token once to load revocation filter
+        self.client.get(
+            '/api/user/verify',
+            headers=header
+            )
+
+        # Change user's password
+        patch_response = self.client.patch(
+            '/api/user/' + self.username,
+            headers=header,
+            data=json.dumps({'password': 'new_password'}),
+            content_type='application/json'
+            )
+        new_header = {'Authorization': 'Bearer ' +
+            patch_response.get_data(as_text=True)}
+
+        # Act
+        old_response = self.client.post(
+            '/api/shapes-in-rain/score',
+            headers=header,
+            data=json.dumps({'score': 100}),
+            content_type='application/json'
+            )
+        error = old_response.get_data(as_text=True)
+
+        new_response = self.client.get(
+            '/api/user/verify',
+            headers=new_header
+            )
+
+        # Assert
+        self.assertEqual(patch_response.status_code, 200)
+        self.assertEqual(old_response.status_code, 401)
+        self.assertEqual(error, 'Unauthorized')
+        self.assertEqual(new_response.status_code, 200)
+
+    @patch.dict(os.environ, {'TOKEN_VERIFICATION': 'stateless'})
+    def test_verify_stateless_forged_error(self):
+        # Arrange
+        token_header = urlsafe_b64encode(b'{"alg": "HS256", "typ": "JWT"}')
+        payload = urlsafe_b64encode(json.dumps({
+            'username': 'user1',
+            'exp': floor(time() + (60 * 60))
+            }).encode())
+        message = token_header + b'.' + payload
+        signature = hmac.new(b'forged', message, digestmod=sha256).digest()
+        forged_token = (message + b'.' + urlsafe_b64encode(signature)).decode()
+
+        header = {'Authorization': 'Bearer ' + forged_token}
+
+        # Act
+        with patch('user.user.db.get_conn', wraps=db.get_conn) as get_conn:
+            get_response = self.client.get(
+                '/api/user/verify',
+                headers=header
+                )
+        error = get_response.get_data(as_text=True)
+
+        # Assert
+        self.assertEqual(get_response.status_code, 401)
+        self.assertEqual(error, 'Unauthorized')
+        self.assertEqual(get_conn.called, False)
+
+    def test_member_id_from_token(self):
+        # Arrange
+        self.create_user()
+        self.login()
+        header = {'Authorization': 'Bearer ' + self.token}
+        cursor = MagicMock()
+
+        # Act
+        with app.test_request_context(headers=header):
+            user.authenticate()
+            member_id = user.read_member_id(cursor, self.username)
+
+        # Assert
+        self.assertEqual(isinstance(member_id, str), True)
+        self.assertEqual(cursor.execute.called, False)
+
+    def test_member_id_cached(self):
+        # Arrange
+        self.create_user()
+        conn = db.get_conn()
+        cursor = conn.cursor(cursor_factory=RecordingCursor)
+
+        # Act
+        # Look up member id without a bearer token, then again from cache
+        with app.test_request_context():
+            member_id = user.read_member_id(cursor, self.username)
+            lookup_queries = list(cursor.queries)
+
+            cached_member_id = user.read_member_id(
+                cursor, self.username.upper()
+                )
+            cached_queries = list(cursor.queries)
+
+            unknown_member_id = user.read_member_id(cursor, 'unknown')
+
+        cursor.close()
+        db.put_conn(conn)
+
+        # Assert
+        self.assertEqual(isinstance(member_id, str), True)
+        self.assertEqual(cached_member_id, member_id)
+        self.assertEqual(len(lookup_queries), 1)
+        self.assertEqual(cached_queries, lookup_queries)
+        self.assertEqual(unknown_member_id, None)
+
 
 # Test /api/users endpoint [GET]
 class TestUsers(CrystalPrismTestCase):
@@ -1,11 +1,10 @@
-import json
-import os
 import psycopg2 as pg
 import psycopg2.extras
 
 from flask import jsonify, make_response, request
 
 from user import user
+from utils import db, pagination
 
 
 def create_post(requester):
@@ -32,55 +31,43 @@ def create_post(requester):
     if not isinstance(data['public'], bool):
         return make_response('Public status must be true or false', 400)
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor()
 
-    # Add post to database
+    # Add post and its first content version to database
     cursor.execute(
         """
-        INSERT INTO post
-                    (member_id)
-             VALUES (
-                     (SELECT member_id
-                        FROM cp_user
-                       WHERE LOWER(username) = %(username)s)
-             )
+          WITH inserted AS (
+                            INSERT INTO post (member_id)
+                                 VALUES (%(member_id)s)
+                              RETURNING post_id
+               )
+        INSERT INTO post_content (content, post_id, public, title)
+             SELECT %(content)s, post_id, %(public)s, %(title)s
+               FROM inserted
           RETURNING post_id;
         """,
-        {'username': requester.lower()}
-        )
-
-    post_id = cursor.fetchone()[0]
-
-    cursor.execute(
-        """
-        INSERT INTO post_content
-                    (content, created, post_id, public, title)
-             VALUES (%(content)s,
-                    (SELECT modified
-                       FROM post
-                      WHERE post_id = %(post_id)s),
-                    %(post_id)s, %(public)s, %(title)s);
-        """,
-        {'content': data['content'].strip(),
-        'post_id': post_id,
+        {'member_id': user.read_member_id(cursor, requester),
+        'content': data['content'].strip(),
         'public': data['public'],
         'title': data['title'].strip()}
         )
 
+    post_id = cursor.fetchone()[0]
+
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response(str(post_id), 201)
 
 
 def read_post(post_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
@@ -88,7 +75,7 @@ def read_post(post_id):
     cursor.execute(
         """
         SELECT post.created, post.modified, post.post_id,
-               cp_user.username
+               post.comment_count, cp_user.username
           FROM post, cp_user
          WHERE post_id = %(post_id)s
                AND post.member_id = cp_user.member_id;
@@ -100,6 +87,9 @@ def read_post(post_id):
 
     # Return error if post not found
     if not post:
+        cursor.close()
+        db.put_conn(conn)
+
         return make_response('Not found', 404)
 
     # Otherwise, convert post data to dictionary
@@ -108,9 +98,13 @@ def read_post(post_id):
     # Retrieve all post content versions from database
     cursor.execute(
         """
-        SELECT content, created, public, title
-          FROM post_content
-         WHERE post_id = %(post_id)s;
+          SELECT post_content.content, post_content.created,
+                 post_content.public, post_content.title,
+                 post_content.version = post.version AS is_current
+            FROM post_content, post
+           WHERE post_content.post_id = %(post_id)s
+                 AND post_content.post_id = post.post_id
+        ORDER BY post_content.version;
         """,
         {'post_id': post_id}
         )
@@ -121,7 +115,7 @@ def read_post(post_id):
         row = dict(row)
 
         # Set current post content, public, and title items
-        if row['created'] == post['modified']:
+        if row.pop('is_current'):
             post['content'] = row['content']
             post['public'] = row['public']
             post['title'] = row['title']
@@ -130,30 +124,16 @@ def read_post(post_id):
         else:
             post['history'].append(row)
 
-    # Retrieve comment count from database
-    cursor.execute(
-        """
-        SELECT COUNT(*)
-          FROM comment
-         WHERE post_id = %(post_id)s;
-        """,
-        {'post_id': post_id}
-        )
-
-    post['comment_count'] = cursor.fetchone()[0]
-
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     # Check if user is logged in
-    verification = user.verify_token()
+    requester, error = user.authenticate()
 
     # If requester's user token is verified and requester is the writer, return
     # post and its entire history
-    if (verification.status_code == 200 and json.loads(verification.data
-        .decode())['username'].lower() == post['username'].lower()):
-
-            return jsonify(post)
+    if not error and requester.lower() == post['username'].lower():
+        return jsonify(post)
 
     # if post is private and requester is not the writer, retun error
     if not post['public']:
@@ -191,22 +171,56 @@ def update_post(requester, post_id):
     if not isinstance(data['public'], bool):
         return make_response('Public status must be true or false', 400)
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
-    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+    cursor = conn.cursor()
 
-    # Get current post from database
+    # Add new post content version to database and increment post version if
+    # requester is the writer and post content changed, getting whether post
+    # exists, requester is the writer and post was updated
     cursor.execute(
         """
-        SELECT post.*, post_content.*, cp_user.username
-          FROM post, post_content, cp_user
-         WHERE post.post_id = %(post_id)s
-               AND post.modified = post_content.created
-               AND post.post_id = post_content.post_id
-               AND post.member_id = cp_user.member_id;
+          WITH current AS (
+                           SELECT post.post_id,
+                                  LOWER(cp_user.username) = %(username)s
+                                      AS is_writer,
+                                  (post_content.content, post_content.public,
+                                  post_content.title) IS DISTINCT FROM
+                                  (%(content)s, %(public)s, %(title)s)
+                                      AS is_changed
+                             FROM post, post_content, cp_user
+                            WHERE post.post_id = %(post_id)s
+                                  AND post.version = post_content.version
+                                  AND post.post_id = post_content.post_id
+                                  AND post.member_id = cp_user.member_id
+               ),
+               updated AS (
+                              UPDATE post
+                                 SET version = post.version + 1,
+                                     modified = now()
+                                FROM current
+                               WHERE post.post_id = current.post_id
+                                     AND current.is_writer
+                                     AND current.is_changed
+                           RETURNING post.post_id, post.version
+               ),
+               inserted AS (
+                            INSERT INTO post_content
+                                        (content, post_id, public, title,
+                                        version)
+                                 SELECT %(content)s, post_id, %(public)s,
+                                        %(title)s, version
+                                   FROM updated
+               )
+        SELECT is_writer, is_changed
+          FROM current;
         """,
-        {'post_id': post_id}
+        {'post_id': post_id,
+        'username': requester.lower(),
+        'content': data['content'].strip(),
+        'public': data['public'],
+        'title': data['title'].strip()}
         )
 
     post = cursor.fetchone()
@@ -214,75 +228,61 @@ def update_post(requester, post_id):
     # Return error if post not found
     if not post:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
-    # Otherwise, convert post data to dictionary
-    post = dict(post)
-
     # Return error if requester is not the writer
-    if requester.lower() != post['username'].lower():
+    if not post[0]:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Unauthorized', 401)
 
     # Return error if there are no changes to post
-    if (data['content'] == post['content'] and
-        data['public'] == post['public'] and data['title'] == post['title']):
-            return make_response('No changes made', 409)
-
-    # Otherwise, add post content version to database
-    cursor.execute(
-        """
-        INSERT INTO post_content
-                    (content, post_id, public, title)
-             VALUES (%(content)s, %(post_id)s, %(public)s, %(title)s)
-          RETURNING created;
-        """,
-        {'content': data['content'].strip(),
-        'post_id': post_id,
-        'public': data['public'],
-        'title': data['title'].strip()}
-        )
-
-    content_timestamp = cursor.fetchone()[0]
+    if not post[1]:
+        cursor.close()
+        db.put_conn(conn)
 
-    # Update post modified time to created timestamp for post content version
-    cursor.execute(
-        """
-        UPDATE post
-           SET modified = %(modified)s
-         WHERE post_id = %(post_id)s;
-        """,
-        {'modified': content_timestamp,
-        'post_id': post_id}
-        )
+        return make_response('No changes made', 409)
 
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response('Success', 200)
 
 
 def delete_post(requester, post_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
-    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+    cursor = conn.cursor()
 
-    # Get post from database
+    # Delete post from database if requester is the writer, getting whether
+    # post exists and requester is the writer
     cursor.execute(
         """
-        SELECT post.*, cp_user.username
-          FROM post, cp_user
-         WHERE post_id = %(post_id)s
-               AND post.member_id = cp_user.member_id;
+          WITH target AS (
+                          SELECT post.post_id,
+                                 LOWER(cp_user.username) = %(username)s
+                                     AS is_writer
+                            FROM post, cp_user
+                           WHERE post.post_id = %(post_id)s
+                                 AND post.member_id = cp_user.member_id
+               ),
+               deleted AS (
+                           DELETE FROM post
+                                 USING target
+                                 WHERE post.post_id = target.post_id
+                                       AND target.is_writer
+               )
+        SELECT is_writer
+          FROM target;
         """,
-        {'post_id': post_id}
+        {'post_id': post_id,
+        'username': requester.lower()}
         )
 
     post = cursor.fetchone()
@@ -290,65 +290,73 @@ def delete_post(requester, post_id):
     # Return error if post not found
     if not post:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
-    # Otherwise, convert post data to dictionary
-    post = dict(post)
-
     # Return error if requester is not the writer
-    if requester.lower() != post['username'].lower():
+    if not post[0]:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Unauthorized', 401)
 
-    # Delete post from database
-    cursor.execute(
-        """
-        DELETE FROM post
-              WHERE post_id = %(post_id)s;
-        """,
-        {'post_id': post_id}
-        )
-
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response('Success', 200)
 
 
 def read_posts():
-    # Get number of requested posts from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of posts from query parameters
+    page, error = pagination.read_page(10)
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    if error:
+        return error
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve all posts except for website owner's from database
+    # Retrieve requested page of posts except for website owner's with each
+    # post's public content versions from database
     cursor.execute(
         """
           SELECT post.created, post.modified, post.post_id,
-                 post_content.public, cp_user.username
+                 post.comment_count, post_content.public, cp_user.username,
+                 post_content.content, post_content.title,
+                 COALESCE((
+                          SELECT json_agg(json_build_object(
+                                     'content', past_content.content,
+                                     'created', to_char(
+                                         past_content.created
+                                         AT TIME ZONE 'UTC',
+                                         'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"'
+                                         ),
+                                     'title', past_content.title
+                                     ) ORDER BY past_content.version)
+                            FROM post_content AS past_content
+                           WHERE past_content.post_id = post.post_id
+                                 AND past_content.version != post.version
+                                 AND past_content.public = TRUE
+                 ), '[]') AS history
             FROM post, post_content, cp_user
            WHERE cp_user.is_owner != TRUE
                  AND post_content.public = TRUE
-                 AND post_content.created = post.modified
+                 AND post_content.version = post.version
                  AND post_content.post_id = post.post_id
                  AND post.member_id = cp_user.member_id
-        ORDER BY created DESC;
-        """
+                 AND (%(after_id)s IS NULL
+                      OR (post.created, post.post_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY post.created DESC, post.post_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
+        """,
+        page
         )
 
     posts = []
@@ -356,170 +364,88 @@ def read_posts():
     for row in cursor.fetchall():
         posts.append(dict(row))
 
-    # Retrieve each post's public content versions from database
-    for post in posts:
-        cursor.execute(
-            """
-            SELECT content, created, title
-              FROM post_content
-             WHERE post_id = %(post_id)s
-                   AND public = TRUE;
-            """,
-            {'post_id': post['post_id']}
-            )
-
-        post['history'] = []
-
-        for row in cursor.fetchall():
-            row = dict(row)
-
-            # Set current post content, public, and title items
-            if row['created'] == post['modified']:
-                post['content'] = row['content']
-                post['title'] = row['title']
-
-            # Add rest of post versions to history item
-            else:
-                post['history'].append(row)
-
-    # Retrieve each post's comment count from database
-    for post in posts:
-        cursor.execute(
-            """
-            SELECT COUNT(*)
-              FROM comment
-             WHERE post_id = %(post_id)s;
-            """,
-            {'post_id': post['post_id']}
-            )
-
-        post['comment_count'] = cursor.fetchone()[0]
+    posts, next_cursor = pagination.split_page(
+        posts, page, 'created', 'post_id'
+        )
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(posts[request_start:request_end])
+    return pagination.page_response(posts, page, next_cursor)
 
 
 def read_posts_for_one_user(writer_name):
-    # Get number of requested posts from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of posts from query parameters
+    page, error = pagination.read_page(10)
+
+    if error:
+        return error
+
+    # Check if user is logged in
+    requester, error = user.authenticate()
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    # Requester can see private posts only if requester's user token is
+    # verified and requester is the writer
+    is_writer = not error and requester.lower() == writer_name.lower()
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve posts from database
+    # Retrieve requested page of posts with each post's content versions from
+    # database, skipping private posts and private content versions if
+    # requester is not the writer
     cursor.execute(
         """
           SELECT post.created, post.modified, post.post_id,
-                 post_content.public, cp_user.username
+                 post.comment_count, post_content.public, cp_user.username,
+                 post_content.content, post_content.title,
+                 COALESCE((
+                          SELECT json_agg(json_build_object(
+                                     'content', past_content.content,
+                                     'created', to_char(
+                                         past_content.created
+                                         AT TIME ZONE 'UTC',
+                                         'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"'
+                                         ),
+                                     'title', past_content.title
+                                     ) ORDER BY past_content.version)
+                            FROM post_content AS past_content
+                           WHERE past_content.post_id = post.post_id
+                                 AND past_content.version != post.version
+                                 AND (past_content.public = TRUE OR
+                                      %(is_writer)s)
+                 ), '[]') AS history
             FROM post, post_content, cp_user
            WHERE LOWER(cp_user.username) = %(username)s
-                 AND post_content.created = post.modified
+                 AND (post_content.public = TRUE OR %(is_writer)s)
+                 AND post_content.version = post.version
                  AND post_content.post_id = post.post_id
                  AND post.member_id = cp_user.member_id
-        ORDER BY created DESC;
+                 AND (%(after_id)s IS NULL
+                      OR (post.created, post.post_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY post.created DESC, post.post_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
         """,
-        {'username': writer_name.lower()}
+        dict(page, username=writer_name.lower(), is_writer=is_writer)
         )
 
     posts = []
 
-    # Check if user is logged in
-    verification = user.verify_token()
-
-    # Return all posts to client only if requester's user token is verified and
-    # requester is the writer
-    if (verification.status_code == 200 and
-        json.loads(verification.data.decode())['username']
-        .lower() == writer_name.lower()):
-
-        for row in cursor.fetchall():
-            posts.append(dict(row))
-
-        # Retrieve each post's public and private content versions from
-        # database
-        for post in posts:
-            cursor.execute(
-                """
-                SELECT content, created, title
-                  FROM post_content
-                 WHERE post_id = %(post_id)s;
-                """,
-                {'post_id': post['post_id']}
-                )
-
-            post['history'] = []
-
-            for row in cursor.fetchall():
-                row = dict(row)
-
-                # Set current post content, public, and title items
-                if row['created'] == post['modified']:
-                    post['content'] = row['content']
-                    post['title'] = row['title']
-
-                # Add rest of post versions to history item
-                else:
-                    post['history'].append(row)
-
-    # Otherwise, return only public posts to client
-    else:
-        for row in cursor.fetchall():
-            if row['public']:
-                posts.append(dict(row))
-
-        # Retrieve each post's public content versions from database
-        for post in posts:
-            cursor.execute(
-                """
-                SELECT content, created, title
-                  FROM post_content
-                 WHERE post_id = %(post_id)s
-                       AND public = TRUE;
-                """,
-                {'post_id': post['post_id']}
-                )
-
-            post['history'] = []
-
-            for row in cursor.fetchall():
-                row = dict(row)
-
-                # Set current post content, public, and title items
-                if row['created'] == post['modified']:
-                    post['content'] = row['content']
-                    post['title'] = row['title']
-
-                # Add rest of post versions to history item
-                else:
-                    post['history'].append(row)
-
-    # Retrieve each post's comment count from database
-    for post in posts:
-        cursor.execute(
-            """
-            SELECT COUNT(*)
-              FROM comment
-             WHERE post_id = %(post_id)s;
-            """,
-            {'post_id': post['post_id']}
-            )
+    for row in cursor.fetchall():
+        posts.append(dict(row))
 
-        post['comment_count'] = cursor.fetchone()[0]
+    posts, next_cursor = pagination.split_page(
+        posts, page, 'created', 'post_id'
+        )
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(posts[request_start:request_end])
+    return pagination.page_response(posts, page, next_cursor)
 
 
 def create_comment(requester):
@@ -542,85 +468,57 @@ def create_comment(requester):
     if not data['content']:
         return make_response('Comment cannot be blank', 400)
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor()
 
-    # Get latest post content from database and ensure it is public
+    # Add comment and its first content version to database if post exists
+    # and its latest content is public
     cursor.execute(
         """
-        SELECT public
-          FROM post_content
-         WHERE post_id = %(post_id)s
-               AND created = (
-                              SELECT modified
-                                FROM post
-                               WHERE post_id = %(post_id)s
-               );
+          WITH inserted AS (
+                            INSERT INTO comment (member_id, post_id)
+                                 SELECT %(member_id)s::UUID, post.post_id
+                                   FROM post, post_content
+                                  WHERE post.post_id = %(post_id)s
+                                        AND post.post_id = post_content.post_id
+                                        AND post.version = post_content.version
+                                        AND post_content.public = TRUE
+                              RETURNING comment_id
+               )
+        INSERT INTO comment_content (comment_id, content)
+             SELECT comment_id, %(content)s
+               FROM inserted
+          RETURNING comment_id;
         """,
-        {'post_id': data['post_id']}
+        {'member_id': user.read_member_id(cursor, requester),
+        'post_id': data['post_id'],
+        'content': data['content'].strip()}
         )
 
-    public = cursor.fetchone()
-
-    # Return error if post not found
-    if not public:
-        cursor.close()
-        conn.close()
-
-        return make_response('Not found', 404)
+    comment = cursor.fetchone()
 
-    # Return error if post not public
-    if not public[0]:
+    # Return error if post not found or not public
+    if not comment:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
-    # Add comment to database
-    cursor.execute(
-        """
-        INSERT INTO comment
-                    (member_id, post_id)
-             VALUES (
-                     (SELECT member_id
-                        FROM cp_user
-                       WHERE LOWER(username) = %(username)s),
-                     %(post_id)s
-             )
-          RETURNING comment_id;
-        """,
-        {'username': requester.lower(),
-        'post_id': data['post_id']}
-        )
-
-    comment_id = cursor.fetchone()[0]
-
-    cursor.execute(
-        """
-        INSERT INTO comment_content
-                    (comment_id, content, created)
-             VALUES (%(comment_id)s, %(content)s,
-                    (SELECT modified
-                       FROM comment
-                      WHERE comment_id = %(comment_id)s));
-        """,
-        {'comment_id': comment_id,
-        'content': data['content'].strip()}
-        )
+    comment_id = comment[0]
 
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response(str(comment_id), 201)
 
 
 def read_comment(comment_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
@@ -640,6 +538,9 @@ def read_comment(comment_id):
 
     # Return error if comment not found
     if not comment:
+        cursor.close()
+        db.put_conn(conn)
+
         return make_response('Not found', 404)
 
     # Otherwise, convert comment data to dictionary
@@ -651,8 +552,8 @@ def read_comment(comment_id):
         SELECT public
           FROM post_content
          WHERE post_id = %(post_id)s
-               AND created = (
-                              SELECT modified
+               AND version = (
+                              SELECT version
                                 FROM post
                                WHERE post_id = %(post_id)s
                );
@@ -665,16 +566,19 @@ def read_comment(comment_id):
     # Return error if post not public
     if not public[0]:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
     # Retrieve all comment content versions from database
     cursor.execute(
         """
-        SELECT content, created
-          FROM comment_content
-         WHERE comment_id = %(comment_id)s;
+          SELECT comment_content.content, comment_content.created,
+                 comment_content.version = comment.version AS is_current
+            FROM comment_content, comment
+           WHERE comment_content.comment_id = %(comment_id)s
+                 AND comment_content.comment_id = comment.comment_id
+        ORDER BY comment_content.version;
         """,
         {'comment_id': comment_id}
         )
@@ -685,7 +589,7 @@ def read_comment(comment_id):
         row = dict(row)
 
         # Set current comment content items
-        if row['created'] == comment['modified']:
+        if row.pop('is_current'):
             comment['content'] = row['content']
 
         # Add rest of comment versions to history item
@@ -693,7 +597,7 @@ def read_comment(comment_id):
             comment['history'].append(row)
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return jsonify(comment)
 
@@ -711,22 +615,52 @@ def update_comment(requester, comment_id):
     if not data['content']:
         return make_response('Comment cannot be blank', 400)
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
-    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+    cursor = conn.cursor()
 
-    # Get current comment from database
+    # Add new comment content version to database and increment comment
+    # version if requester is the commenter and comment content changed,
+    # getting whether comment exists, requester is the commenter and comment
+    # was updated
     cursor.execute(
         """
-        SELECT comment.*, comment_content.*, cp_user.username
-          FROM comment, comment_content, cp_user
-         WHERE comment.comment_id = %(comment_id)s
-               AND comment.modified = comment_content.created
-               AND comment.comment_id = comment_content.comment_id
-               AND comment.member_id = cp_user.member_id;
+          WITH current AS (
+                           SELECT comment.comment_id,
+                                  LOWER(cp_user.username) = %(username)s
+                                      AS is_commenter,
+                                  comment_content.content IS DISTINCT FROM
+                                  %(content)s AS is_changed
+                             FROM comment, comment_content, cp_user
+                            WHERE comment.comment_id = %(comment_id)s
+                                  AND comment.version = comment_content.version
+                                  AND comment.comment_id =
+                                      comment_content.comment_id
+                                  AND comment.member_id = cp_user.member_id
+               ),
+               updated AS (
+                              UPDATE comment
+                                 SET version = comment.version + 1,
+                                     modified = now()
+                                FROM current
+                               WHERE comment.comment_id = current.comment_id
+                                     AND current.is_commenter
+                                     AND current.is_changed
+                           RETURNING comment.comment_id, comment.version
+               ),
+               inserted AS (
+                            INSERT INTO comment_content
+                                        (comment_id, content, version)
+                                 SELECT comment_id, %(content)s, version
+                                   FROM updated
+               )
+        SELECT is_commenter, is_changed
+          FROM current;
         """,
-        {'comment_id': comment_id}
+        {'comment_id': comment_id,
+        'username': requester.lower(),
+        'content': data['content'].strip()}
         )
 
     comment = cursor.fetchone()
@@ -734,73 +668,61 @@ def update_comment(requester, comment_id):
     # Return error if comment not found
     if not comment:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
-    # Otherwise, convert comment data to dictionary
-    comment = dict(comment)
-
     # Return error if requester is not the commenter
-    if requester.lower() != comment['username'].lower():
+    if not comment[0]:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Unauthorized', 401)
 
     # Return error if there are no changes to comment
-    if data['content'] == comment['content']:
-        return make_response('No changes made', 409)
-
-    # Otherwise, add comment content version to database
-    cursor.execute(
-        """
-        INSERT INTO comment_content
-                    (comment_id, content)
-             VALUES (%(comment_id)s, %(content)s)
-          RETURNING created;
-        """,
-        {'comment_id': comment_id,
-        'content': data['content'].strip()}
-        )
-
-    content_timestamp = cursor.fetchone()[0]
+    if not comment[1]:
+        cursor.close()
+        db.put_conn(conn)
 
-    # Update comment modified time to created timestamp for comment content
-    # version
-    cursor.execute(
-        """
-        UPDATE comment
-           SET modified = %(modified)s
-         WHERE comment_id = %(comment_id)s;
-        """,
-        {'modified': content_timestamp,
-        'comment_id': comment_id}
-        )
+        return make_response('No changes made', 409)
 
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response('Success', 200)
 
 
 def delete_comment(requester, comment_id):
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
-    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+    cursor = conn.cursor()
 
-    # Get current comment from database
+    # Delete comment from database if requester is the commenter, getting
+    # whether comment exists and requester is the commenter
     cursor.execute(
         """
-        SELECT comment.*, cp_user.username
-          FROM comment, cp_user
-         WHERE comment_id = %(comment_id)s
-               AND comment.member_id = cp_user.member_id;
+          WITH target AS (
+                          SELECT comment.comment_id,
+                                 LOWER(cp_user.username) = %(username)s
+                                     AS is_commenter
+                            FROM comment, cp_user
+                           WHERE comment.comment_id = %(comment_id)s
+                                 AND comment.member_id = cp_user.member_id
+               ),
+               deleted AS (
+                           DELETE FROM comment
+                                 USING target
+                                 WHERE comment.comment_id = target.comment_id
+                                       AND target.is_commenter
+               )
+        SELECT is_commenter
+          FROM target;
         """,
-        {'comment_id': comment_id}
+        {'comment_id': comment_id,
+        'username': requester.lower()}
         )
 
     comment = cursor.fetchone()
@@ -808,53 +730,38 @@ def delete_comment(requester, comment_id):
     # Return error if comment not found
     if not comment:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
-    # Otherwise, convert comment data to dictionary
-    comment = dict(comment)
-
     # Return error if requester is not the commenter
-    if requester.lower() != comment['username'].lower():
+    if not comment[0]:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Unauthorized', 401)
 
-    # Delete comment from database
-    cursor.execute(
-        """
-        DELETE FROM comment
-              WHERE comment_id = %(comment_id)s;
-        """,
-        {'comment_id': comment_id}
-        )
-
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response('Success', 200)
 
 
 def read_comments(post_id):
-    # Get number of requested comments from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of comments from query parameters
+    page, error = pagination.read_page(10)
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    if error:
+        return error
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve comments from database
+    # Retrieve requested page of comments from database
     cursor.execute(
         """
           SELECT comment.comment_id, comment.created, comment.modified,
@@ -865,10 +772,15 @@ def read_comments(post_id):
                  AND comment.member_id = cp_user.member_id
                  AND comment.post_id = post.post_id
                  AND comment.post_id = post_content.post_id
-                 AND post.modified = post_content.created
-        ORDER BY created DESC;
+                 AND post.version = post_content.version
+                 AND (%(after_id)s IS NULL
+                      OR (comment.created, comment.comment_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY comment.created DESC, comment.comment_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
         """,
-        {'post_id': post_id}
+        dict(page, post_id=post_id)
         )
 
     comments = []
@@ -876,13 +788,20 @@ def read_comments(post_id):
     for row in cursor.fetchall():
         comments.append(dict(row))
 
+    comments, next_cursor = pagination.split_page(
+        comments, page, 'created', 'comment_id'
+        )
+
     for comment in comments:
         # Retrieve each comment's content versions from database
         cursor.execute(
             """
-            SELECT content, created
-              FROM comment_content
-             WHERE comment_id = %(comment_id)s;
+              SELECT comment_content.content, comment_content.created,
+                     comment_content.version = comment.version AS is_current
+                FROM comment_content, comment
+               WHERE comment_content.comment_id = %(comment_id)s
+                     AND comment_content.comment_id = comment.comment_id
+            ORDER BY comment_content.version;
             """,
             {'comment_id': comment['comment_id']}
             )
@@ -893,7 +812,7 @@ def read_comments(post_id):
             row = dict(row)
 
             # Set current comment content items
-            if row['created'] == comment['modified']:
+            if row.pop('is_current'):
                 comment['content'] = row['content']
 
             # Add rest of comment versions to history item
@@ -901,27 +820,24 @@ def read_comments(post_id):
                 comment['history'].append(row)
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(comments[request_start:request_end])
+    return pagination.page_response(comments, page, next_cursor)
 
 
 def read_comments_for_one_user(commenter_name):
-    # Get number of requested posts from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of posts from query parameters
+    page, error = pagination.read_page(10)
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    if error:
+        return error
 
-    # Set up database connection with environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve comments from database
+    # Retrieve requested page of comments from database
     cursor.execute(
         """
           SELECT comment.comment_id, comment.created, comment.modified,
@@ -932,11 +848,16 @@ def read_comments_for_one_user(commenter_name):
                  AND post_content.public = TRUE
                  AND comment.post_id = post.post_id
                  AND post_content.post_id = post.post_id
-                 AND post_content.created = post.modified
+                 AND post_content.version = post.version
                  AND comment.member_id = cp_user.member_id
-        ORDER BY comment.created DESC;
+                 AND (%(after_id)s IS NULL
+                      OR (comment.created, comment.comment_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY comment.created DESC, comment.comment_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
         """,
-        {'username': commenter_name.lower()}
+        dict(page, username=commenter_name.lower())
         )
 
     comments = []
@@ -944,6 +865,10 @@ def read_comments_for_one_user(commenter_name):
     for row in cursor.fetchall():
         comments.append(dict(row))
 
+    comments, next_cursor = pagination.split_page(
+        comments, page, 'created', 'comment_id'
+        )
+
     for comment in comments:
         # Replace each post writer's member id with username
         cursor.execute(
@@ -961,9 +886,12 @@ def read_comments_for_one_user(commenter_name):
         # Retrieve each comment's content versions from database
         cursor.execute(
             """
-            SELECT content, created
-              FROM comment_content
-             WHERE comment_id = %(comment_id)s;
+              SELECT comment_content.content, comment_content.created,
+                     comment_content.version = comment.version AS is_current
+                FROM comment_content, comment
+               WHERE comment_content.comment_id = %(comment_id)s
+                     AND comment_content.comment_id = comment.comment_id
+            ORDER BY comment_content.version;
             """,
             {'comment_id': comment['comment_id']}
             )
@@ -974,7 +902,7 @@ def read_comments_for_one_user(commenter_name):
             row = dict(row)
 
             # Set current comment content items
-            if row['created'] == comment['modified']:
+            if row.pop('is_current'):
                 comment['content'] = row['content']
 
             # Add rest of comment versions to history item
@@ -982,6 +910,6 @@ def read_comments_for_one_user(commenter_name):
                 comment['history'].append(row)
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    return jsonify(comments[request_start:request_end])
+    return pagination.page_response(comments, page, next_cursor)
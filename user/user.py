@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import bcrypt
+import binascii
 import boto3
 import hmac
 import json
@@ -9,18 +9,38 @@ import psycopg2 as pg
 import psycopg2.extras
 import re
 import requests
+import secrets
 import shutil
 import tempfile
 
 from base64 import urlsafe_b64decode, urlsafe_b64encode
-from datetime import datetime, timezone
-from flask import jsonify, make_response, request, send_file
+from datetime import timezone
+from flask import g, jsonify, make_response, request, send_file
 from hashlib import sha256
 from jinja2 import Environment, PackageLoader, select_autoescape
 from math import floor
 from time import time
 
 from canvashare import canvashare
+from utils import cache, db, drawing_ids, hashing, leaderboard, pagination
+from utils import revocation
+
+
+# Account status by lowercase username, so that verifying a bearer token does
+# not query the database on every request; a status change made by another
+# worker is seen within STATUS_CACHE_TTL seconds
+status_cache = cache.TTLCache(
+    int(os.environ.get('STATUS_CACHE_SIZE', 10000)),
+    float(os.environ.get('STATUS_CACHE_TTL', 30))
+    )
+
+# Member id by lowercase username, so that writes made with a bearer token
+# that predates member ids in tokens do not look up the requester's member id
+# in the database every time
+member_id_cache = cache.TTLCache(
+    int(os.environ.get('MEMBER_ID_CACHE_SIZE', 10000)),
+    float(os.environ.get('MEMBER_ID_CACHE_TTL', 300))
+    )
 
 
 def login():
@@ -36,15 +56,15 @@ def login():
     username = data.username.strip()
     password = data.password
 
-    # Set up database connection wtih environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
     # Get hashed user password to check credentials against and user status
     cursor.execute(
         """
-        SELECT username, password, status
+        SELECT member_id, username, password, status
           FROM cp_user
          WHERE LOWER(username) = %(username)s
          LIMIT 1;
@@ -55,7 +75,7 @@ def login():
     user_data = cursor.fetchone()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     # Return error if user account is not found
     if not user_data:
@@ -68,27 +88,131 @@ def login():
     if user_data['status'] == 'deleted':
         return make_response('Unauthorized', 401)
 
-    # Check requested password against stored hashed and salted password
-    if bcrypt.checkpw(password.encode(), user_data['password'].encode()):
+    # Check requested password against stored hashed and salted password,
+    # returning error if too many passwords are already being checked
+    try:
+        is_correct = hashing.check_password(password, user_data['password'])
+    except hashing.HashingBusyError:
+        return make_response('Server busy', 503, {'Retry-After': '1'})
+
+    if is_correct:
+        # Borrow database connection from pool
+        conn = db.get_conn()
+
+        cursor = conn.cursor()
+
+        # Issue refresh token to let client get new JWT tokens without sending
+        # password again
+        refresh_token = create_refresh_token(cursor, user_data['member_id'])
+
+        conn.commit()
+
+        cursor.close()
+        db.put_conn(conn)
 
         # Generate JWT token if password is correct
-        header = urlsafe_b64encode(b'{"alg": "HS256", "typ": "JWT"}')
-        payload = urlsafe_b64encode(json.dumps({
-            'username': user_data['username'],
-            'exp': floor(time() + (60 * 60))  # in seconds
-            }).encode())
-        secret = os.environ['SECRET_KEY'].encode()
-        message = header + b'.' + payload
-        signature = hmac.new(secret, message, digestmod=sha256).digest()
-        signature = urlsafe_b64encode(signature)
-        token = message + b'.' + signature
-
-        return make_response(token.decode(), 200)
+        return make_response(
+            create_token(user_data['username'], user_data['member_id']), 200,
+            {'X-Refresh-Token': refresh_token})
 
     # Return error otherwise
     return make_response('Unauthorized', 401)
 
 
+def refresh():
+    # Request should contain X-Refresh-Token header:
+    # <refresh token> <str>
+    refresh_token = request.headers.get('X-Refresh-Token')
+
+    if not refresh_token:
+        return make_response('Unauthorized', 401)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor()
+
+    # Use up refresh token if it has not expired and get its user's member id
+    # and current username and status
+    cursor.execute(
+        """
+           DELETE FROM refresh_token
+                 USING cp_user
+                 WHERE token_hash = %(token_hash)s
+                       AND expires > now()
+                       AND refresh_token.member_id = cp_user.member_id
+             RETURNING cp_user.member_id, cp_user.username, cp_user.status;
+        """,
+        {'token_hash': sha256(refresh_token.encode()).hexdigest()}
+        )
+
+    user_data = cursor.fetchone()
+
+    # Return error if refresh token is not found or has expired, or if user
+    # account is deleted
+    if not user_data or user_data[2] == 'deleted':
+        conn.commit()
+
+        cursor.close()
+        db.put_conn(conn)
+
+        return make_response('Unauthorized', 401)
+
+    # Replace used refresh token with a new one
+    refresh_token = create_refresh_token(cursor, user_data[0])
+
+    conn.commit()
+
+    cursor.close()
+    db.put_conn(conn)
+
+    return make_response(create_token(user_data[1], user_data[0]), 200,
+        {'X-Refresh-Token': refresh_token})
+
+
+def create_token(username, member_id):
+    # Generate JWT token for username that expires in 1 hour, including user's
+    # member id so that authenticated writes do not need to look it up, and
+    # the time it was issued so that it can be revoked
+    header = urlsafe_b64encode(b'{"alg": "HS256", "typ": "JWT"}')
+    payload = urlsafe_b64encode(json.dumps({
+        'username': username,
+        'member_id': member_id,
+        'iat': time(),  # in seconds
+        'exp': floor(time() + (60 * 60))  # in seconds
+        }).encode())
+    secret = os.environ['SECRET_KEY'].encode()
+    message = header + b'.' + payload
+    signature = hmac.new(secret, message, digestmod=sha256).digest()
+    signature = urlsafe_b64encode(signature)
+    token = message + b'.' + signature
+
+    return token.decode()
+
+
+def create_refresh_token(cursor, member_id):
+    # Generate random refresh token and store its hash, removing user's expired
+    # refresh tokens
+    refresh_token = secrets.token_urlsafe(32)
+
+    cursor.execute(
+        """
+        DELETE FROM refresh_token
+              WHERE member_id = %(member_id)s
+                    AND expires <= now();
+
+        INSERT INTO refresh_token (token_hash, member_id, expires)
+             VALUES (%(token_hash)s, %(member_id)s,
+                    now() + %(lifetime)s * INTERVAL '1 second');
+        """,
+        {'token_hash': sha256(refresh_token.encode()).hexdigest(),
+        'member_id': member_id,
+        'lifetime': int(os.environ.get('REFRESH_TOKEN_LIFETIME', 2592000))}
+        )
+
+    return refresh_token
+
+
 def create_user():
     # Request should contain:
     # password <str>
@@ -112,66 +236,91 @@ def create_user():
     if not pattern.match(username):
         return make_response('Username contains unacceptable characters', 400)
 
-    # Set up database connection wtih environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
-
-    cursor = conn.cursor()
-
-    # Check if username already exists in database
-    cursor.execute(
-        """
-        SELECT EXISTS (
-                       SELECT 1
-                         FROM cp_user
-                        WHERE LOWER(username) = %(username)s
-                        LIMIT 1
-        );
-        """,
-        {'username': username.lower()}
-        )
-
-    if cursor.fetchone()[0]:
-        cursor.close()
-        conn.close()
-
-        return make_response('Username already exists', 409)
-
     # Return error if password is too short
     if len(password) < 8:
         return make_response('Password too short', 400)
 
-    # Generate hashed password with bcrypt cryptographic hash function and salt
-    password = data['password'].encode()
-    hashed_password = bcrypt.hashpw(password, bcrypt.gensalt())
+    # Generate hashed password with bcrypt cryptographic hash function and
+    # salt, returning error if too many passwords are already being hashed
+    try:
+        hashed_password = hashing.hash_password(password)
+    except hashing.HashingBusyError:
+        return make_response('Server busy', 503, {'Retry-After': '1'})
 
-    # Add user account to database
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor()
+
+    # Add user account to database unless username already exists, relying on
+    # unique index on lowercase username instead of checking first
     cursor.execute(
         """
         INSERT INTO cp_user
                     (username, password)
-             VALUES (%(username)s, %(password)s);
+             VALUES (%(username)s, %(password)s)
+        ON CONFLICT ((LOWER(username))) DO NOTHING
+          RETURNING member_id;
         """,
-        {'username': username, 'password': hashed_password.decode()}
+        {'username': username, 'password': hashed_password}
         )
 
+    if not cursor.fetchone():
+        cursor.close()
+        db.put_conn(conn)
+
+        return make_response('Username already exists', 409)
+
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     return make_response('Success', 201)
 
 
 def read_user(username):
-    # Set up database connection wtih environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
-    # Retrieve user account from database
+    # Retrieve user account and its activity counts and high scores from
+    # database in one query, each served by an index on member_id; high scores
+    # are read from each game's all-time best scores in its rollup table
     cursor.execute(
         """
-        SELECT *
+        SELECT cp_user.*,
+               (SELECT COUNT(*)
+                  FROM shapes_score
+                 WHERE member_id = cp_user.member_id) AS shapes_score_count,
+               COALESCE((SELECT score
+                           FROM shapes_score_rollup
+                          WHERE period = 'all'
+                                AND period_start = '-infinity'
+                                AND member_id = cp_user.member_id), 0)
+                   AS shapes_high_score,
+               (SELECT COUNT(*)
+                  FROM rhythm_score
+                 WHERE member_id = cp_user.member_id) AS rhythm_score_count,
+               COALESCE((SELECT score
+                           FROM rhythm_score_rollup
+                          WHERE period = 'all'
+                                AND period_start = '-infinity'
+                                AND member_id = cp_user.member_id), 0)
+                   AS rhythm_high_score,
+               (SELECT COUNT(*)
+                  FROM drawing
+                 WHERE member_id = cp_user.member_id) AS drawing_count,
+               (SELECT COUNT(*)
+                  FROM drawing_like
+                 WHERE member_id = cp_user.member_id) AS drawing_like_count,
+               (SELECT COUNT(*)
+                  FROM post
+                 WHERE member_id = cp_user.member_id) AS post_count,
+               (SELECT COUNT(*)
+                  FROM comment
+                 WHERE member_id = cp_user.member_id) AS comment_count
           FROM cp_user
          WHERE LOWER(username) = %(username)s;
         """,
@@ -180,11 +329,11 @@ def read_user(username):
 
     user_data = cursor.fetchone()
 
+    cursor.close()
+    db.put_conn(conn)
+
     # Return error if user account is not found
     if not user_data:
-        cursor.close()
-        conn.close()
-
         return make_response('Not found', 404)
 
     # Otherwise, convert user data to dictionary
@@ -192,124 +341,8 @@ def read_user(username):
 
     # Return error if user account is deleted
     if user_data['status'] == 'deleted':
-        cursor.close()
-        conn.close()
-
         return make_response('Not found', 404)
 
-    # Get user's Shapes in Rain score count
-    cursor.execute(
-        """
-        SELECT COUNT(*)
-          FROM shapes_score
-         WHERE member_id = %(member_id)s;
-        """,
-        {'member_id': user_data['member_id']}
-        )
-
-    user_data['shapes_score_count'] = cursor.fetchone()[0]
-
-    # Get user's Shapes in Rain high score
-    cursor.execute(
-        """
-          SELECT score
-            FROM shapes_score
-           WHERE member_id = %(member_id)s
-        ORDER BY score DESC
-           LIMIT 1;
-        """,
-        {'member_id': user_data['member_id']}
-        )
-
-    shapes_high_score = cursor.fetchone()
-
-    if not shapes_high_score:
-        user_data['shapes_high_score'] = 0
-    else:
-        user_data['shapes_high_score'] = shapes_high_score[0]
-
-    # Get user's Rhythm of Life score count
-    cursor.execute(
-        """
-        SELECT COUNT(*)
-          FROM rhythm_score
-         WHERE member_id = %(member_id)s;
-        """,
-        {'member_id': user_data['member_id']}
-        )
-
-    user_data['rhythm_score_count'] = cursor.fetchone()[0]
-
-    # Get user's Rhythm of Life high score
-    cursor.execute(
-        """
-          SELECT score
-            FROM rhythm_score
-           WHERE member_id = %(member_id)s
-        ORDER BY score DESC
-           LIMIT 1;
-        """,
-        {'member_id': user_data['member_id']}
-        )
-
-    rhythm_high_score = cursor.fetchone()
-
-    if not rhythm_high_score:
-        user_data['rhythm_high_score'] = 0
-    else:
-        user_data['rhythm_high_score'] = rhythm_high_score[0]
-
-    # Get user's drawing count
-    cursor.execute(
-        """
-        SELECT COUNT(*)
-          FROM drawing
-         WHERE member_id = %(member_id)s;
-        """,
-        {'member_id': user_data['member_id']}
-        )
-
-    user_data['drawing_count'] = cursor.fetchone()[0]
-
-    # Get user's drawing like count
-    cursor.execute(
-        """
-        SELECT COUNT(*)
-          FROM drawing_like
-         WHERE member_id = %(member_id)s;
-        """,
-        {'member_id': user_data['member_id']}
-        )
-
-    user_data['drawing_like_count'] = cursor.fetchone()[0]
-
-    # Get user's post count
-    cursor.execute(
-        """
-        SELECT COUNT(*)
-          FROM post
-         WHERE member_id = %(member_id)s;
-        """,
-        {'member_id': user_data['member_id']}
-        )
-
-    user_data['post_count'] = cursor.fetchone()[0]
-
-    # Get user's comment count
-    cursor.execute(
-        """
-        SELECT COUNT(*)
-          FROM comment
-         WHERE member_id = %(member_id)s;
-        """,
-        {'member_id': user_data['member_id']}
-        )
-
-    user_data['comment_count'] = cursor.fetchone()[0]
-
-    cursor.close()
-    conn.close()
-
     # Remove admin information from user_data
     user_data.pop('is_admin')
     user_data.pop('is_owner')
@@ -318,13 +351,12 @@ def read_user(username):
     user_data.pop('password')
 
     # Check if user is logged in
-    verification = verify_token()
+    requester, error = authenticate()
 
     # If requester's user token is verified and requester is the user, return
     # complete user data
-    if (verification.status_code == 200 and json.loads(verification.data
-        .decode())['username'].lower() == username.lower()):
-            return jsonify(user_data)
+    if not error and requester.lower() == username.lower():
+        return jsonify(user_data)
 
     # Otherwise, remove private information from user data before sending it to
     # client
@@ -341,8 +373,23 @@ def read_user(username):
     return jsonify(user_data)
 
 
+# Account fields that users can update, with the types each field accepts
+USER_FIELDS = {
+    'about': (str, type(None)),
+    'background_color': str,
+    'email': (str, type(None)),
+    'email_public': bool,
+    'first_name': (str, type(None)),
+    'icon_color': str,
+    'last_name': (str, type(None)),
+    'name_public': bool,
+    'password': str,
+    'username': str
+    }
+
+
 def update_user(requester):
-    # Request should contain:
+    # Request should contain one or more of:
     # about <str>
     # background_color <str>
     # email <str>
@@ -355,19 +402,60 @@ def update_user(requester):
     # username <str>
     data = request.get_json()
 
-    # Return error if request is missing data
-    if (not data or 'about' not in data or 'background_color' not in data or
-        'email' not in data or 'email_public' not in data or
-        'first_name' not in data or 'icon_color' not in data or
-        'last_name' not in data or 'name_public' not in data or
-        'password' not in data or 'username' not in data):
-            return make_response('Request is missing required data', 400)
+    # Get fields to update from request, ignoring blank password, which leaves
+    # password unchanged
+    updates = {}
 
-    username = data['username'].strip()
-    password = data['password']
+    if isinstance(data, dict):
+        for field in USER_FIELDS:
+            # Leave password unchanged if it is blank
+            if field == 'password' and not data.get('password'):
+                continue
 
-    # Set up database connection wtih environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+            if field in data:
+                updates[field] = data[field]
+
+    # Return error if request does not contain any fields to update
+    if not updates:
+        return make_response('Request is missing required data', 400)
+
+    # Return error if a field has the wrong type
+    for field, value in updates.items():
+        if not isinstance(value, USER_FIELDS[field]):
+            return make_response('Invalid value for ' + field, 400)
+
+    for field in ['about', 'email', 'first_name', 'last_name', 'username']:
+        if updates.get(field) is not None:
+            updates[field] = updates[field].strip()
+
+    username = updates.get('username', requester)
+
+    if 'username' in updates:
+        # Return error if username is blank
+        if not username:
+            return make_response('Username cannot be blank', 400)
+
+        # Return error if username contains unacceptable characters
+        if not re.match(r'^[a-zA-Z0-9_-]+$', username):
+            return make_response(
+                'Username contains unacceptable characters', 400
+                )
+
+    # Return error if password is too short
+    if 'password' in updates and len(updates['password']) < 8:
+        return make_response('Password too short', 400)
+
+    # Create updated hashed password if user requested change, before
+    # borrowing a database connection so that none is held while hashing;
+    # return error if too many passwords are already being hashed
+    if 'password' in updates:
+        try:
+            updates['password'] = hashing.hash_password(updates['password'])
+        except hashing.HashingBusyError:
+            return make_response('Server busy', 503, {'Retry-After': '1'})
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor()
 
@@ -388,14 +476,13 @@ def update_user(requester):
 
         if cursor.fetchone()[0]:
             cursor.close()
-            conn.close()
+            db.put_conn(conn)
 
             return make_response('Username already exists', 409)
 
-    # Check if email address already exists in database if it is not null
-    if data['email']:
-        data['email'] = data['email'].strip()
-
+    # Check if email address already exists in database if it is being
+    # updated and is not null
+    if updates.get('email'):
         cursor.execute(
             """
             SELECT EXISTS (
@@ -406,88 +493,84 @@ def update_user(requester):
                             LIMIT 1
             );
             """,
-            {'email': data['email'],
+            {'email': updates['email'],
             'username': requester.lower()}
             )
 
         if cursor.fetchone()[0]:
             cursor.close()
-            conn.close()
+            db.put_conn(conn)
 
             return make_response('Email address already claimed', 409)
 
-    # Retrieve user account from database
-    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+    # Add updated information to user account in database; column names come
+    # from USER_FIELDS, never from the request
+    try:
+        cursor.execute(
+            """
+            UPDATE cp_user
+               SET """ + ', '.join(field + ' = %(' + field + ')s'
+                                   for field in sorted(updates)) + """,
+                   modified = now()
+             WHERE LOWER(username) = %(old_username)s
+         RETURNING member_id;
+            """,
+            dict(updates, old_username=requester.lower())
+            )
 
-    cursor.execute(
-        """
-        SELECT *
-          FROM cp_user
-         WHERE LOWER(username) = %(username)s;
-        """,
-        {'username': requester.lower()}
-        )
+    # Return error if another request claimed the username or email address
+    # after it was checked above, which the unique indexes on them catch
+    except pg.IntegrityError as error:
+        conn.rollback()
+
+        cursor.close()
+        db.put_conn(conn)
 
-    user_data = dict(cursor.fetchone())
+        if error.diag.constraint_name == 'cp_user_email_key':
+            return make_response('Email address already claimed', 409)
 
-    # Create updated hashed password if user requested change
-    if password:
-        password = password.encode()
-        user_data['password'] = bcrypt.hashpw(
-            password, bcrypt.gensalt()).decode()
+        return make_response('Username already exists', 409)
 
-    # Add updated information to user account in database
-    cursor.execute(
-        """
-        UPDATE cp_user
-           SET username = %(username)s, password = %(password)s,
-               first_name = %(first_name)s, last_name = %(last_name)s,
-               name_public = %(name_public)s, email = %(email)s,
-               email_public = %(email_public)s,
-               background_color = %(background_color)s,
-               icon_color = %(icon_color)s, about = %(about)s,
-               modified = to_char
-               (now() at time zone 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"')
-         WHERE LOWER(username) = %(old_username)s;
-        """,
-        {'username': username,
-        'password': user_data['password'],
-        'first_name': data['first_name'].strip(),
-        'last_name': data['last_name'].strip(),
-        'name_public': data['name_public'],
-        'email': data['email'],
-        'email_public': data['email_public'],
-        'background_color': data['background_color'],
-        'icon_color': data['icon_color'],
-        'about': data['about'].strip(),
-        'old_username': requester.lower()}
-        )
+    member_id = cursor.fetchone()[0]
+
+    # Revoke tokens issued for old username if username changed, or issued
+    # with old password if password changed
+    if username.lower() != requester.lower() or 'password' in updates:
+        revocation.revoke(cursor, requester)
+
+    # Remove refresh tokens issued with old password if password changed
+    if 'password' in updates:
+        cursor.execute(
+            """
+            DELETE FROM refresh_token
+                  WHERE member_id = %(member_id)s;
+            """,
+            {'member_id': member_id}
+            )
 
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
-    # Update bearer token and return to requester
-    header = urlsafe_b64encode(b'{"alg": "HS256", "typ": "JWT"}')
-    payload = urlsafe_b64encode(
-        json.dumps({
-            'username': username,
-            'exp': floor(time() + (60 * 60))  # in seconds
-            }).encode()
-        )
-    secret = os.environ['SECRET_KEY'].encode()
-    message = header + b'.' + payload
-    signature = hmac.new(secret, message, digestmod=sha256).digest()
-    signature = urlsafe_b64encode(signature)
-    token = message + b'.' + signature
+    # Remove cached account status so that tokens issued before the change
+    # are rejected, and cached member id for old username if username changed
+    if username.lower() != requester.lower() or 'password' in updates:
+        status_cache.invalidate(requester.lower())
+
+    if username.lower() != requester.lower():
+        member_id_cache.invalidate(requester.lower())
+
+        # Reload leaderboards so that user's scores show new username
+        leaderboard.clear_all()
 
-    return make_response(token.decode(), 200)
+    # Update bearer token and return to requester
+    return make_response(create_token(username, member_id), 200)
 
 
 def delete_user_soft(requester):
-    # Set up database connection wtih environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor()
 
@@ -496,23 +579,38 @@ def delete_user_soft(requester):
         """
         UPDATE cp_user
            SET status = 'deleted'
-         WHERE LOWER(username) = %(username)s;
+         WHERE LOWER(username) = %(username)s
+     RETURNING member_id;
         """,
         {'username': requester.lower()}
         )
 
+    member_id = cursor.fetchone()[0]
+
+    # Revoke requester's tokens
+    revocation.revoke(cursor, requester)
+
+    cursor.execute(
+        """
+        DELETE FROM refresh_token
+              WHERE member_id = %(member_id)s;
+        """,
+        {'member_id': member_id}
+        )
+
     conn.commit()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
+
+    # Remove cached account status so that requester's token is rejected
+    status_cache.invalidate(requester.lower())
+    member_id_cache.invalidate(requester.lower())
 
     return make_response('Success', 200)
 
 
 def read_user_data(requester):
-    # Define ISO string format for timestamp conversion
-    iso_string = '%Y-%m-%dT%X.%fZ'
-
     # Define readable format for timestamp conversion
     readable_string = '%m/%d/%Y, %I:%M %p %Z'
 
@@ -550,8 +648,8 @@ def read_user_data(requester):
         # Create directory for user comments
         comment_dir = os.makedirs(data_dir + '/comments')
 
-        # Set up database connection wtih environment variable
-        conn = pg.connect(os.environ['DB_CONNECTION'])
+        # Borrow database connection from pool
+        conn = db.get_conn()
 
         cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
@@ -591,9 +689,8 @@ def read_user_data(requester):
             font_color = '#000000'
 
         # Convert user account created timestamp to readable timestamp format
-        user_data['created'] = datetime.strptime(
-            user_data['created'], iso_string).replace(
-            tzinfo=timezone.utc).strftime(readable_string)
+        user_data['created'] = user_data['created'].astimezone(
+            timezone.utc).strftime(readable_string)
 
         # Get user's Shapes in Rain game scores, sorted by highest to lowest
         # score
@@ -616,9 +713,8 @@ def read_user_data(requester):
         for score in cursor.fetchall():
             score = dict(score)
 
-            score['created'] = datetime.strptime(
-                score['created'], iso_string).replace(
-                tzinfo=timezone.utc).strftime(readable_string)
+            score['created'] = score['created'].astimezone(
+                timezone.utc).strftime(readable_string)
 
             shapes_scores.append(score)
 
@@ -643,9 +739,8 @@ def read_user_data(requester):
         for score in cursor.fetchall():
             score = dict(score)
 
-            score['created'] = datetime.strptime(
-                score['created'], iso_string).replace(
-                tzinfo=timezone.utc).strftime(readable_string)
+            score['created'] = score['created'].astimezone(
+                timezone.utc).strftime(readable_string)
 
             rhythm_scores.append(score)
 
@@ -653,11 +748,8 @@ def read_user_data(requester):
         cursor.execute(
             """
               SELECT drawing.created, drawing.drawing_id, drawing.title,
-                     drawing.url, drawing.views, cp_user.username,
-                     (SELECT COUNT(*)
-                        FROM drawing_like
-                       WHERE drawing_like.drawing_id = drawing.drawing_id)
-                          AS like_count
+                     drawing.url, drawing.views, drawing.like_count,
+                     cp_user.username
                 FROM drawing, cp_user
                WHERE LOWER(cp_user.username) = %(username)s
                      AND drawing.member_id = cp_user.member_id
@@ -672,6 +764,7 @@ def read_user_data(requester):
         # drawings list
         for drawing in cursor.fetchall():
             drawing = dict(drawing)
+            drawing['drawing_id'] = drawing_ids.to_api(drawing['drawing_id'])
 
             drawing_data = requests.get(drawing['url']).content
 
@@ -683,9 +776,8 @@ def read_user_data(requester):
 
             # Convert each drawing's created timestamp to readable timestamp
             # format
-            drawing['created'] = datetime.strptime(
-                drawing['created'], iso_string).replace(
-                tzinfo=timezone.utc).strftime(readable_string)
+            drawing['created'] = drawing['created'].astimezone(
+                timezone.utc).strftime(readable_string)
 
             # Create HTML file for drawing, encoding in utf-8 to prevent
             # rendering errors for non-ASCII characters
@@ -726,12 +818,14 @@ def read_user_data(requester):
         # format and add drawing like to liked drawings list
         for drawing_like in cursor.fetchall():
             drawing_like = dict(drawing_like)
+            drawing_like['drawing_id'] = drawing_ids.to_api(
+                drawing_like['drawing_id']
+                )
 
             # Convert each drawing like's created timestamp to readable
             # timestamp format
-            drawing_like['created'] = datetime.strptime(
-                drawing_like['created'], iso_string).replace(
-                tzinfo=timezone.utc).strftime(readable_string)
+            drawing_like['created'] = drawing_like['created'].astimezone(
+                timezone.utc).strftime(readable_string)
 
             # Create HTML file for drawing, encoding in utf-8 to prevent
             # rendering errors for non-ASCII characters
@@ -751,14 +845,11 @@ def read_user_data(requester):
         cursor.execute(
             """
               SELECT post.created, post.modified, post.post_id,
-                     post_content.public, cp_user.username,
-                     (SELECT COUNT(*)
-                        FROM comment
-                       WHERE comment.post_id = post.post_id)
-                          AS comment_count
+                     post.comment_count, post_content.public,
+                     cp_user.username
                 FROM post, post_content, cp_user
                WHERE LOWER(cp_user.username) = %(username)s
-                     AND post_content.created = post.modified
+                     AND post_content.version = post.version
                      AND post_content.post_id = post.post_id
                      AND post.member_id = cp_user.member_id
             ORDER BY created DESC;
@@ -773,20 +864,22 @@ def read_user_data(requester):
 
             # Convert each post's created and modified timestamps to readable
             # timestamp format
-            post['created'] = datetime.strptime(
-                post['created'], iso_string).replace(
-                tzinfo=timezone.utc).strftime(readable_string)
+            post['created'] = post['created'].astimezone(
+                timezone.utc).strftime(readable_string)
 
-            post['modified'] = datetime.strptime(
-                post['modified'], iso_string).replace(
-                tzinfo=timezone.utc).strftime(readable_string)
+            post['modified'] = post['modified'].astimezone(
+                timezone.utc).strftime(readable_string)
 
             # Get each post's public and private content versions
             cursor.execute(
                 """
-                SELECT content, created, title
-                  FROM post_content
-                 WHERE post_id = %(post_id)s;
+                  SELECT post_content.content, post_content.created,
+                         post_content.title,
+                         post_content.version = post.version AS is_current
+                    FROM post_content, post
+                   WHERE post_content.post_id = %(post_id)s
+                         AND post_content.post_id = post.post_id
+                ORDER BY post_content.version;
                 """,
                 {'post_id': post['post_id']}
                 )
@@ -798,12 +891,11 @@ def read_user_data(requester):
 
                 # Convert each row's created timestamp to readable timestamp
                 # format
-                row['created'] = datetime.strptime(
-                    row['created'], iso_string).replace(
-                    tzinfo=timezone.utc).strftime(readable_string)
+                row['created'] = row['created'].astimezone(
+                    timezone.utc).strftime(readable_string)
 
                 # Set current post content, public, and title items
-                if row['created'] == post['modified']:
+                if row.pop('is_current'):
                     post['content'] = row['content']
                     post['title'] = row['title']
 
@@ -839,7 +931,7 @@ def read_user_data(requester):
                      AND post_content.public = TRUE
                      AND comment.post_id = post.post_id
                      AND post_content.post_id = post.post_id
-                     AND post_content.created = post.modified
+                     AND post_content.version = post.version
                      AND comment.member_id = cp_user.member_id
             ORDER BY comment.created DESC;
             """,
@@ -853,20 +945,22 @@ def read_user_data(requester):
 
             # Convert each comment's created and modified timestamps to
             # readable timestamp format
-            comment['created'] = datetime.strptime(
-                comment['created'], iso_string).replace(
-                tzinfo=timezone.utc).strftime(readable_string)
+            comment['created'] = comment['created'].astimezone(
+                timezone.utc).strftime(readable_string)
 
-            comment['modified'] = datetime.strptime(
-                comment['modified'], iso_string).replace(
-                tzinfo=timezone.utc).strftime(readable_string)
+            comment['modified'] = comment['modified'].astimezone(
+                timezone.utc).strftime(readable_string)
 
             # Get each comment's content versions
             cursor.execute(
                 """
-                SELECT content, created
-                  FROM comment_content
-                 WHERE comment_id = %(comment_id)s;
+                  SELECT comment_content.content, comment_content.created,
+                         comment_content.version = comment.version
+                             AS is_current
+                    FROM comment_content, comment
+                   WHERE comment_content.comment_id = %(comment_id)s
+                         AND comment_content.comment_id = comment.comment_id
+                ORDER BY comment_content.version;
                 """,
                 {'comment_id': comment['comment_id']}
                 )
@@ -878,12 +972,11 @@ def read_user_data(requester):
 
                 # Convert each row's created timestamp to readable timestamp
                 # format
-                row['created'] = datetime.strptime(
-                    row['created'], iso_string).replace(
-                    tzinfo=timezone.utc).strftime(readable_string)
+                row['created'] = row['created'].astimezone(
+                    timezone.utc).strftime(readable_string)
 
                 # Set current comment content items
-                if row['created'] == comment['modified']:
+                if row.pop('is_current'):
                     comment['content'] = row['content']
 
                 # Add rest of comment versions to history item
@@ -905,7 +998,7 @@ def read_user_data(requester):
             comments.append(comment)
 
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         # Create main HTML file for user data, encoding in utf-8 to prevent
         # rendering errors for non-ASCII characters
@@ -948,8 +1041,8 @@ def read_user_data(requester):
 
 
 def delete_user_hard(requester, username):
-    # Set up database connection wtih environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
 
@@ -980,7 +1073,7 @@ def delete_user_hard(requester, username):
     # Return error if user account is not found
     if not user_data:
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
 
         return make_response('Not found', 404)
 
@@ -990,24 +1083,19 @@ def delete_user_hard(requester, username):
     # Hard-delete user's account if requester is the user or if requester is an
     # admin
     if username.lower() == requester.lower() or requester_data['is_admin']:
-        # Retrieve user's drawings from database
+        # Delete user's drawings on this connection, getting their ids to
+        # remove the drawings from S3 bucket once the connection is returned
+        # to pool
         cursor.execute(
             """
-            SELECT drawing_id
-              FROM drawing
-             WHERE member_id = %(member_id)s;
+            DELETE FROM drawing
+                  WHERE member_id = %(member_id)s
+              RETURNING drawing_id;
             """,
             {'member_id': user_data['member_id']}
             )
 
-        drawing_ids = []
-
-        for row in cursor.fetchall():
-            drawing_ids.append(row[0])
-
-        # Remove each of user's drawings from S3 bucket
-        for drawing_id in drawing_ids:
-            canvashare.delete_drawing(requester, drawing_id)
+        user_drawing_ids = [row[0] for row in cursor.fetchall()]
 
         cursor.execute(
             """
@@ -1017,113 +1105,261 @@ def delete_user_hard(requester, username):
             {'username': username.lower()}
             )
 
+        # Revoke user's tokens
+        revocation.revoke(cursor, username)
+
         conn.commit()
 
         cursor.close()
-        conn.close()
+        db.put_conn(conn)
+
+        # Remove cached account status so that user's token is rejected
+        status_cache.invalidate(username.lower())
+        member_id_cache.invalidate(username.lower())
+
+        # Reload leaderboards so that user's deleted scores are not shown
+        leaderboard.clear_all()
+
+        canvashare.delete_drawing_files(user_drawing_ids)
 
         return make_response('Success', 200)
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
 
     # Return error otherwise
     return make_response('Unauthorized', 401)
 
 
+# Format of bearer token in Authorization header
+TOKEN_PATTERN = re.compile(
+    r'^[a-zA-Z0-9-_]+={0,2}\.[a-zA-Z0-9-_]+={0,2}\.[a-zA-Z0-9-_]+={0,2}$')
+
+
+def read_token():
+    # Verify bearer token at most once per request; later calls during the
+    # same request reuse the verified payload or error
+    if 'token_payload' not in g:
+        g.token_payload, g.token_error = check_token()
+
+    if g.token_error:
+        return None, make_response(*g.token_error)
+
+    return g.token_payload, None
+
+
+def authenticate():
+    # Get username of requester from verified bearer token, or error response
+    # if token is missing or invalid
+    payload, error = read_token()
+
+    if error:
+        return None, error
+
+    return payload['username'], None
+
+
+def read_member_id(cursor, username):
+    # Get member id for username from requester's verified bearer token if it
+    # was issued for username, otherwise from cache or database
+    payload = g.get('token_payload')
+
+    if (payload and payload.get('member_id') and
+        payload['username'].lower() == username.lower()):
+            return payload['member_id']
+
+    member_id = member_id_cache.get(username.lower())
+
+    if member_id is None:
+        cursor.execute(
+            """
+            SELECT member_id
+              FROM cp_user
+             WHERE LOWER(username) = %(username)s;
+            """,
+            {'username': username.lower()}
+            )
+
+        row = cursor.fetchone()
+
+        # Return None if user account is not found
+        if not row:
+            return None
+
+        member_id = row[0]
+
+        member_id_cache.set(username.lower(), member_id)
+
+    return member_id
+
+
 def verify_token():
+    payload, error = read_token()
+
+    if error:
+        return error
+
+    return make_response(json.dumps(payload).encode(), 200)
+
+
+def check_token():
     # Request should contain Authorization header:
     # 'Bearer <token>' <str>
     data = request.headers.get('Authorization')
 
     if not data:
-        return make_response('Unauthorized', 401,
+        return None, ('Unauthorized', 401,
             {'WWW-Authenticate': 'Basic realm="Login required!"'})
 
     token = data.split(' ')[1]
 
     # Check if token in Authorization header is properly formatted
-    pattern = re.compile(
-        r'^[a-zA-Z0-9-_]+={0,2}\.[a-zA-Z0-9-_]+={0,2}\.[a-zA-Z0-9-_]+={0,2}$')
+    if not TOKEN_PATTERN.match(token):
+        return None, ('Unauthorized', 401)
 
-    if not pattern.match(token):
-        return make_response('Unauthorized', 401)
+    header, payload, signature = token.split('.')
+
+    # Check signature against signature generated using secret before doing
+    # any other work, so that forged tokens are rejected cheaply
+    secret = os.environ['SECRET_KEY'].encode()
+    message = (header + '.' + payload).encode()
+    signature_check = hmac.new(secret, message, digestmod=sha256).digest()
 
-    header = token.split('.')[0].encode()
-    payload = json.loads(urlsafe_b64decode(token.split('.')[1]).decode())
+    try:
+        signature = urlsafe_b64decode(signature)
+    except (binascii.Error, ValueError):
+        return None, ('Unauthorized', 401)
+
+    if not hmac.compare_digest(signature, signature_check):
+        return None, ('Unauthorized', 401)
+
+    payload = json.loads(urlsafe_b64decode(payload).decode())
 
     # Check if token is past expiration time
     if payload['exp'] < time():
-        return make_response('Unauthorized', 401)
+        return None, ('Unauthorized', 401)
 
-    # Set up database connection wtih environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    # In stateless mode, trust signed token unless user's tokens may have been
+    # revoked
+    if (os.environ.get('TOKEN_VERIFICATION') == 'stateless' and
+        not revocation.might_be_revoked(payload['username'])):
+            return payload, None
 
-    cursor = conn.cursor()
+    # Get user account status and time user's tokens were last revoked (e.g.,
+    # by a password change) from cache, or from database if not cached
+    user_status = status_cache.get(payload['username'].lower())
 
-    # Verify that user account is active
-    cursor.execute(
-        """
-        SELECT status
-          FROM cp_user
-         WHERE LOWER(username) = %(username)s;
-        """,
-        {'username': payload['username'].lower()}
-        )
+    if user_status is None:
+        # Borrow database connection from pool
+        conn = db.get_conn()
 
-    user_status = cursor.fetchone()
+        cursor = conn.cursor()
 
-    cursor.close()
-    conn.close()
+        cursor.execute(
+            """
+            SELECT cp_user.status, revoked_user.revoked
+              FROM cp_user
+         LEFT JOIN revoked_user
+                   ON revoked_user.username = LOWER(cp_user.username)
+             WHERE LOWER(cp_user.username) = %(username)s;
+            """,
+            {'username': payload['username'].lower()}
+            )
 
-    # Return error if user account is not found
-    if not user_status:
-        return make_response('Unauthorized', 401)
+        row = cursor.fetchone()
+
+        cursor.close()
+        db.put_conn(conn)
+
+        # Return error if user account is not found
+        if not row:
+            return None, ('Unauthorized', 401)
+
+        user_status = (row[0], row[1].timestamp() if row[1] else None)
+
+        status_cache.set(payload['username'].lower(), user_status)
+
+    status, revoked = user_status
 
     # Return error if user account is deleted
-    if user_status[0] == 'deleted':
-        return make_response('Unauthorized', 401)
+    if status == 'deleted':
+        return None, ('Unauthorized', 401)
 
-    signature = urlsafe_b64decode(token.split('.')[2])
+    # Return error if token was issued before user's tokens were revoked;
+    # tokens issued without an issue time were issued one token lifetime
+    # before they expire
+    issued = payload.get('iat', payload['exp'] - revocation.TOKEN_LIFETIME)
 
-    # Generate signature using secret to check against signature from Auth
-    # header
-    secret = os.environ['SECRET_KEY'].encode()
-    message = header + b'.' + urlsafe_b64encode(json.dumps(payload).encode())
-    signature_check = hmac.new(secret, message, digestmod=sha256).digest()
-    if signature != signature_check:
-        return make_response('Unauthorized', 401)
+    if revoked is not None and issued < revoked:
+        return None, ('Unauthorized', 401)
 
-    return make_response(json.dumps(payload).encode(), 200)
+    return payload, None
 
 
 def read_users():
-    # Get number of requested users from query parameters, using default if
-    # null
-    request_start = int(request.args.get('start', 0))
-    request_end = int(request.args.get('end', request_start + 10))
+    # Get requested page of users from query parameters
+    page, error = pagination.read_page(10, id_type='uuid')
+
+    if error:
+        return error
 
-    # Return error if start query parameter is greater than end
-    if request_start > request_end:
-        return make_response('Start param cannot be greater than end', 400)
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
-    # Set up database connection wtih environment variable
-    conn = pg.connect(os.environ['DB_CONNECTION'])
+    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+
+    # Retrieve requested page of user accounts from database
+    cursor.execute(
+        """
+          SELECT created, member_id, username
+            FROM cp_user
+           WHERE status = 'active'
+                 AND (%(after_id)s IS NULL
+                      OR (created, member_id) >
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY created, member_id
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
+        """,
+        page
+        )
+
+    users, next_cursor = pagination.split_page(
+        cursor.fetchall(), page, 'created', 'member_id'
+        )
+
+    usernames = [user['username'] for user in users]
+
+    cursor.close()
+    db.put_conn(conn)
+
+    return pagination.page_response(usernames, page, next_cursor)
+
+
+def read_stats(requester):
+    # Borrow database connection from pool
+    conn = db.get_conn()
 
     cursor = conn.cursor()
 
-    # Retrieve user accounts from database
+    # Check if requester is an admin
     cursor.execute(
         """
-        SELECT username
+        SELECT is_admin
           FROM cp_user
-         WHERE status = 'active';
-        """
+         WHERE LOWER(username) = %(username)s;
+        """,
+        {'username': requester.lower()}
         )
 
-    usernames = [username[0] for username in cursor.fetchall()]
+    row = cursor.fetchone()
 
     cursor.close()
-    conn.close()
+    db.put_conn(conn)
+
+    # Return error if requester is not an admin
+    if not row or not row[0]:
+        return make_response('Unauthorized', 401)
 
-    return jsonify(usernames[request_start:request_end])
+    return jsonify({'db_pool': db.pool_stats(),
+        'hashing': hashing.get_stats()})
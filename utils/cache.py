@@ -0,0 +1,53 @@
+import threading
+
+from collections import OrderedDict
+from time import monotonic
+
+
+class TTLCache(object):
+    # Bounded in-memory cache owned by a single worker process; entries expire
+    # after ttl seconds and the least recently used entry is evicted once the
+    # cache holds max_size entries
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.entries = OrderedDict()  # (value, expiry time) by key
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return default
+
+            # Drop expired entry so that value is read again from its source
+            if entry[1] <= monotonic():
+                del self.entries[key]
+
+                return default
+
+            self.entries.move_to_end(key)
+
+            return entry[0]
+
+    def set(self, key, value):
+        # Do not cache anything if cache is disabled
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (value, monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
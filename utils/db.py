@@ -0,0 +1,292 @@
+import atexit
+import logging
+import os
+import psycopg2 as pg
+import psycopg2.extensions
+import threading
+
+from time import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhaustedError(pg.OperationalError):
+    pass
+
+
+class ConnectionPool(object):
+    # Bounded pool of database connections owned by a single worker process;
+    # connections are health-checked when they have sat idle for a while and
+    # recycled once they reach their maximum lifetime
+    def __init__(self, dsn, size, timeout, max_lifetime, check_interval):
+        self.dsn = dsn
+        self.pid = os.getpid()
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+
+        self.idle = []  # Connections available for checkout (LIFO)
+        self.used = {}  # Checked out connections by id
+        self.opened = {}  # Time each open connection was created by id
+        self.returned = {}  # Time each idle connection was returned by id
+        self.condition = threading.Condition()
+
+        self.stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'exhausted': 0,
+            'opened': 0,
+            'recycled': 0,
+            'failed_checks': 0
+            }
+
+    def getconn(self):
+        deadline = time() + self.timeout
+        conn = None
+
+        with self.condition:
+            self.stats['checkouts'] += 1
+
+            # Wait for a connection to be returned if pool is at capacity,
+            # raising error if none is returned before timeout
+            if not self.idle and len(self.used) >= self.size:
+                self.stats['waits'] += 1
+
+                while not self.idle and len(self.used) >= self.size:
+                    remaining = deadline - time()
+
+                    if remaining <= 0:
+                        self.stats['exhausted'] += 1
+                        logger.warning(
+                            'Database connection pool exhausted (size %s, '
+                            '%s exhaustions)', self.size,
+                            self.stats['exhausted']
+                            )
+                        raise PoolExhaustedError(
+                            'Database connection pool exhausted'
+                            )
+
+                    self.condition.wait(remaining)
+
+            if self.idle:
+                conn = self.idle.pop()
+
+            # Reserve slot in pool until connection is checked or opened
+            slot = object() if conn is None else conn
+            self.used[id(slot)] = slot
+
+        try:
+            if conn is not None:
+                conn = self._check(conn)
+
+            if conn is None:
+                conn = self._open()
+
+        except Exception:
+            with self.condition:
+                self.used.pop(id(slot), None)
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.used.pop(id(slot), None)
+            self.used[id(conn)] = conn
+
+        return conn
+
+    def putconn(self, conn):
+        with self.condition:
+            if id(conn) not in self.used:
+                return False
+
+        # Roll back unfinished transaction so that next borrower starts clean
+        keep = not conn.closed and not self._expired(conn)
+
+        if keep:
+            try:
+                status = conn.get_transaction_status()
+
+                if status == pg.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    keep = False
+                elif status != pg.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+
+            except pg.Error:
+                keep = False
+
+        if not keep:
+            self._close(conn)
+
+        with self.condition:
+            self.used.pop(id(conn), None)
+
+            if keep:
+                self.returned[id(conn)] = time()
+                self.idle.append(conn)
+
+            self.condition.notify()
+
+        return True
+
+    def closeall(self):
+        with self.condition:
+            idle = self.idle
+            self.idle = []
+
+        for conn in idle:
+            self._close(conn)
+
+    def get_stats(self):
+        with self.condition:
+            stats = dict(self.stats)
+            stats['size'] = self.size
+            stats['in_use'] = len(self.used)
+            stats['idle'] = len(self.idle)
+
+        return stats
+
+    def _open(self):
+        conn = pg.connect(self.dsn)
+
+        with self.condition:
+            self.opened[id(conn)] = time()
+            self.stats['opened'] += 1
+
+        return conn
+
+    def _close(self, conn):
+        with self.condition:
+            self.opened.pop(id(conn), None)
+            self.returned.pop(id(conn), None)
+
+        try:
+            conn.close()
+        except pg.Error:
+            pass
+
+    def _expired(self, conn):
+        return time() - self.opened.get(id(conn), 0) > self.max_lifetime
+
+    def _check(self, conn):
+        # Discard connection if it was closed or reached its maximum lifetime
+        if conn.closed or self._expired(conn):
+            with self.condition:
+                self.stats['recycled'] += 1
+
+            self._close(conn)
+
+            return None
+
+        # Ping connection if it has been idle longer than the check interval
+        if time() - self.returned.get(id(conn), 0) > self.check_interval:
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1;')
+                cursor.close()
+                conn.rollback()
+
+            except pg.Error:
+                with self.condition:
+                    self.stats['failed_checks'] += 1
+
+                self._close(conn)
+
+                return None
+
+        return conn
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_borrowed = threading.local()
+
+
+def get_pool():
+    global _pool
+
+    dsn = os.environ['DB_CONNECTION']
+    pool = _pool
+
+    # Create pool on first use in each worker process, or replace it if the
+    # database connection string has changed
+    if pool is None or pool.dsn != dsn or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = _pool
+
+            # Check again in case another thread replaced pool while this
+            # one waited for the lock
+            if pool is None or pool.dsn != dsn or pool.pid != os.getpid():
+                # Connections inherited from a parent process are left
+                # alone since their sockets are shared with the parent
+                if pool is not None and pool.pid == os.getpid():
+                    pool.closeall()
+
+                _pool = ConnectionPool(
+                    dsn,
+                    size=int(os.environ.get('DB_POOL_SIZE', 5)),
+                    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+                    max_lifetime=float(
+                        os.environ.get('DB_POOL_MAX_LIFETIME', 3600)
+                        ),
+                    check_interval=float(
+                        os.environ.get('DB_POOL_CHECK_INTERVAL', 30)
+                        )
+                    )
+
+            pool = _pool
+
+    return pool
+
+
+def get_conn():
+    # Borrow connection from pool and track it for the current thread
+    conn = get_pool().getconn()
+
+    if not hasattr(_borrowed, 'conns'):
+        _borrowed.conns = []
+
+    _borrowed.conns.append(conn)
+
+    return conn
+
+
+def put_conn(conn):
+    # Return connection to pool, closing it instead if pool was replaced while
+    # it was checked out
+    conns = getattr(_borrowed, 'conns', [])
+
+    if conn in conns:
+        conns.remove(conn)
+
+    if _pool is None or not _pool.putconn(conn):
+        if not conn.closed:
+            conn.close()
+
+
+def release_conns():
+    # Return any connections the current thread did not give back, e.g.,
+    # after an unhandled exception in a request handler
+    for conn in list(getattr(_borrowed, 'conns', [])):
+        put_conn(conn)
+
+
+def close_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.closeall()
+
+        _pool = None
+
+
+def pool_stats():
+    if _pool is None or _pool.pid != os.getpid():
+        return {}
+
+    return _pool.get_stats()
+
+
+atexit.register(close_pool)
@@ -0,0 +1,30 @@
+import re
+
+
+# Drawing ids are 64-bit average hashes of the drawing image, sent to clients
+# as 16-character hexadecimal strings and stored in BIGINT columns as the
+# signed (two's complement) value of the same 64 bits
+HEX_PATTERN = re.compile(r'[0-9a-fA-F]{1,16}')
+
+
+def to_db(drawing_id):
+    # Return None if drawing id is not a 64-bit hexadecimal number
+    if not isinstance(drawing_id, str):
+        return None
+
+    if not HEX_PATTERN.fullmatch(drawing_id):
+        return None
+
+    value = int(drawing_id, 16)
+
+    # Convert unsigned value to signed 64-bit integer
+    if value >= 1 << 63:
+        value -= 1 << 64
+
+    return value
+
+
+def to_api(drawing_id):
+    # Convert signed 64-bit integer drawing id to 16-character hexadecimal
+    # string
+    return (drawing_id % (1 << 64)).__format__('016x')
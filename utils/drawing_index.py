@@ -0,0 +1,140 @@
+import threading
+
+from datetime import datetime, timedelta, timezone
+
+
+# BK-tree over drawing ids (64-bit average hashes) keyed by Hamming distance,
+# used to find drawings that look alike without comparing against every
+# drawing; each worker keeps its own tree and catches up on drawings added by
+# other workers before each search
+
+HASH_MASK = (1 << 64) - 1
+
+# Drawings created this long before the last sync are fetched again so that
+# drawings committed late by other workers are not missed
+SYNC_OVERLAP = timedelta(minutes=1)
+
+_root = None  # [drawing_id, {distance: child node}]
+_nodes = set()  # Drawing ids that have a node in the tree
+_live = set()  # Drawing ids that have not been deleted
+_synced = None  # Time of last sync with the database
+_lock = threading.Lock()
+
+
+def distance(first_id, second_id):
+    # Count bits that differ between two drawing hashes
+    return bin((first_id ^ second_id) & HASH_MASK).count('1')
+
+
+def add(drawing_id):
+    global _root
+
+    with _lock:
+        _live.add(drawing_id)
+
+        # Reuse existing node if drawing was deleted and added again
+        if drawing_id in _nodes:
+            return
+
+        _nodes.add(drawing_id)
+
+        if _root is None:
+            _root = [drawing_id, {}]
+            return
+
+        node = _root
+
+        # Descend to the child at the new drawing's distance from each node
+        # until there is no child at that distance
+        while True:
+            node_distance = distance(drawing_id, node[0])
+            child = node[1].get(node_distance)
+
+            if child is None:
+                node[1][node_distance] = [drawing_id, {}]
+                return
+
+            node = child
+
+
+def remove(drawing_id):
+    # Leave node in tree to keep children reachable, but exclude drawing from
+    # search results
+    with _lock:
+        _live.discard(drawing_id)
+
+
+def find_within(drawing_id, max_distance):
+    # Get (distance, drawing id) pairs for drawings within max_distance bits of
+    # drawing id, closest first
+    matches = []
+
+    with _lock:
+        nodes = [_root] if _root is not None else []
+
+        while nodes:
+            node = nodes.pop()
+            node_distance = distance(drawing_id, node[0])
+
+            if node_distance <= max_distance and node[0] in _live:
+                matches.append((node_distance, node[0]))
+
+            # Only children whose distance from this node is within
+            # max_distance of the search distance can contain matches
+            for child_distance, child in node[1].items():
+                if abs(child_distance - node_distance) <= max_distance:
+                    nodes.append(child)
+
+    return sorted(matches)
+
+
+def refresh(cursor):
+    global _synced
+
+    # Add drawings created since last sync, or all drawings on first use
+    synced = datetime.now(timezone.utc)
+
+    cursor.execute(
+        """
+        SELECT drawing_id
+          FROM drawing
+         WHERE %(since)s::TIMESTAMPTZ IS NULL
+               OR created >= %(since)s;
+        """,
+        {'since': _synced - SYNC_OVERLAP if _synced else None}
+        )
+
+    for row in cursor.fetchall():
+        if row[0] not in _live:
+            add(row[0])
+
+    _synced = synced
+
+
+def find_similar(cursor, drawing_id, max_distance):
+    # Get (distance, drawing id) pairs for drawings in the database within
+    # max_distance bits of drawing id, closest first
+    refresh(cursor)
+
+    matches = find_within(drawing_id, max_distance)
+
+    if not matches:
+        return []
+
+    # Drop drawings deleted by other workers
+    cursor.execute(
+        """
+        SELECT drawing_id
+          FROM drawing
+         WHERE drawing_id = ANY(%(drawing_ids)s);
+        """,
+        {'drawing_ids': [match[1] for match in matches]}
+        )
+
+    existing = set(row[0] for row in cursor.fetchall())
+
+    for match in matches:
+        if match[1] not in existing:
+            remove(match[1])
+
+    return [match for match in matches if match[1] in existing]
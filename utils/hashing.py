@@ -0,0 +1,113 @@
+import bcrypt
+import logging
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Password hashing runs on a bounded thread pool in each worker process, so
+# that a burst of logins uses at most BCRYPT_CONCURRENCY threads for bcrypt
+# while the worker's other threads keep serving requests; bcrypt releases the
+# GIL while hashing. A request thread waits while its password is hashed, so
+# once BCRYPT_QUEUE_SIZE jobs are waiting for a free hashing thread, further
+# jobs are rejected instead of tying up more request threads; by default, the
+# queue is sized to leave at least one of the worker's NUM_THREADS request
+# threads free of hashing
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+_stats = {
+    'queued': 0,  # Hashing jobs waiting for a free thread
+    'running': 0,
+    'completed': 0,
+    'rejected': 0  # Jobs rejected because the queue was full
+    }
+
+
+class HashingBusyError(Exception):
+    pass
+
+
+def get_executor():
+    global _executor, _executor_pid
+
+    # Create executor on first use in each worker process, since threads are
+    # not inherited across forks
+    if _executor_pid != os.getpid():
+        with _lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('BCRYPT_CONCURRENCY', 2))
+                    )
+                _executor_pid = os.getpid()
+
+    return _executor
+
+
+def get_queue_size():
+    concurrency = int(os.environ.get('BCRYPT_CONCURRENCY', 2))
+    threads = int(os.environ.get('NUM_THREADS', 4))
+
+    return int(os.environ.get(
+        'BCRYPT_QUEUE_SIZE', max(threads - concurrency - 1, 0)
+        ))
+
+
+def _run(function, *args):
+    max_jobs = int(os.environ.get('BCRYPT_CONCURRENCY', 2)) + get_queue_size()
+
+    with _lock:
+        # Reject job if all hashing threads are busy and too many jobs are
+        # already waiting for a free thread
+        if _stats['queued'] + _stats['running'] >= max_jobs:
+            _stats['rejected'] += 1
+
+            logger.warning(
+                'Password hashing queue full (%s queued, %s running, %s '
+                'rejected)', _stats['queued'], _stats['running'],
+                _stats['rejected']
+                )
+
+            raise HashingBusyError('Password hashing queue full')
+
+        _stats['queued'] += 1
+
+    def job():
+        with _lock:
+            _stats['queued'] -= 1
+            _stats['running'] += 1
+
+        try:
+            return function(*args)
+
+        finally:
+            with _lock:
+                _stats['running'] -= 1
+                _stats['completed'] += 1
+
+    return get_executor().submit(job).result()
+
+
+def hash_password(password):
+    # Generate hashed password with bcrypt cryptographic hash function and salt
+    return _run(bcrypt.hashpw, password.encode(), bcrypt.gensalt()).decode()
+
+
+def check_password(password, hashed_password):
+    # Check password against stored hashed and salted password
+    return _run(bcrypt.checkpw, password.encode(), hashed_password.encode())
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+
+    stats['concurrency'] = int(os.environ.get('BCRYPT_CONCURRENCY', 2))
+    stats['queue_size'] = get_queue_size()
+
+    return stats
@@ -0,0 +1,747 @@
+import bisect
+import os
+import psycopg2 as pg
+import psycopg2.extras
+import threading
+import weakref
+
+from flask import jsonify, make_response, request
+from time import monotonic
+
+from user import user
+from utils import db, pagination
+
+
+# Time windows that leaderboards can be limited to, by window query param,
+# with the date_trunc field that starts each window; each player's best score
+# in each window is kept in the game's rollup table
+PERIODS = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}
+
+# Period of rollup rows that hold each player's all-time best score, which
+# span from -infinity to infinity
+ALL_TIME = 'all'
+
+# Leaderboards created in this worker, so that all can be cleared when a
+# change such as a rename affects scores in every game; held weakly so that
+# leaderboards that are no longer used (e.g., in tests) are not kept alive
+_boards = weakref.WeakSet()
+
+
+class Leaderboard(object):
+    # Highest size scores of a game, highest first, kept in memory by a single
+    # worker process so that the first pages of the game's leaderboard are
+    # served without querying the database; scores added or deleted through
+    # this worker are applied immediately, and the leaderboard is reloaded
+    # from the database after ttl seconds to pick up other workers' changes
+    def __init__(self, table, size=None, ttl=None):
+        self.table = table
+        self.size = size if size is not None else int(
+            os.environ.get('LEADERBOARD_SIZE', 100)
+            )
+        self.ttl = ttl if ttl is not None else float(
+            os.environ.get('LEADERBOARD_TTL', 10)
+            )
+
+        self.keys = []  # (-score, -score_id) of each entry, for bisect
+        self.entries = []  # Score dictionaries, highest first
+        self.complete = False  # Whether entries hold all of the game's scores
+        self.expires = None  # Time to reload entries from the database
+        self.lock = threading.Lock()
+
+        _boards.add(self)
+
+    def is_expired(self):
+        return self.expires is None or self.expires <= monotonic()
+
+    def load(self, cursor):
+        # Do not keep scores in memory if leaderboard is disabled
+        if self.size <= 0 or self.ttl <= 0:
+            return
+
+        # Get highest scores from index on score and score_id
+        cursor.execute(
+            """
+              SELECT game_score.created, game_score.score,
+                     game_score.score_id, cp_user.username
+                FROM """ + self.table + """ AS game_score, cp_user
+               WHERE game_score.member_id = cp_user.member_id
+            ORDER BY game_score.score DESC, game_score.score_id DESC
+               LIMIT %(size)s;
+            """,
+            {'size': self.size}
+            )
+
+        entries = [dict(row) for row in cursor.fetchall()]
+
+        with self.lock:
+            self.entries = entries
+            self.keys = [(-entry['score'], -entry['score_id'])
+                for entry in entries]
+            self.complete = len(entries) < self.size
+            self.expires = monotonic() + self.ttl
+
+    def read_page(self, page):
+        # Get requested page of scores, or None if leaderboard has expired or
+        # does not hold every score on the page
+        after_key = page['after_key']
+        after_id = page['after_id']
+
+        if after_id is not None:
+            try:
+                after = (-int(after_key), -int(after_id))
+            except (TypeError, ValueError):
+                return None
+
+        with self.lock:
+            if self.is_expired():
+                return None
+
+            start = 0
+
+            if after_id is not None:
+                start = bisect.bisect_right(self.keys, after)
+
+            start += page['offset']
+            end = start + page['limit']
+
+            if end > len(self.entries) and not self.complete:
+                return None
+
+            return [dict(entry) for entry in self.entries[start:end]]
+
+    def add(self, score):
+        self.add_all([score])
+
+    def add_all(self, scores):
+        # Add newly created scores that rank among the scores held
+        with self.lock:
+            if self.is_expired():
+                return
+
+            for score in scores:
+                key = (-score['score'], -score['score_id'])
+
+                # Scores below the lowest held score might rank below scores
+                # that are not held
+                if not self.complete:
+                    if not self.keys or key > self.keys[-1]:
+                        continue
+
+                index = bisect.bisect_left(self.keys, key)
+                self.keys.insert(index, key)
+                self.entries.insert(index, dict(score))
+
+                if len(self.entries) > self.size:
+                    self.keys.pop()
+                    self.entries.pop()
+                    self.complete = False
+
+    def remove(self, score_id):
+        with self.lock:
+            for index, entry in enumerate(self.entries):
+                if entry['score_id'] == score_id:
+                    del self.keys[index]
+                    del self.entries[index]
+                    return
+
+    def read_rank(self, cursor, username):
+        # Get user's highest score with its rank (i.e., position on the
+        # leaderboard), or None if user has no scores; rank is counted from the
+        # scores in the database alone, so that it matches the scores read
+        # around it, with an index-only scan of the index on score and
+        # score_id that adds no work or locks to score writes, at the cost of
+        # reading one index entry per higher score
+        cursor.execute(
+            """
+            SELECT best.created, best.score, best.score_id, cp_user.username,
+                   (SELECT COUNT(*)
+                      FROM """ + self.table + """ AS higher
+                     WHERE (higher.score, higher.score_id) >
+                           (best.score, best.score_id)) + 1 AS rank
+              FROM cp_user,
+                   LATERAL (
+                              SELECT created, score, score_id
+                                FROM """ + self.table + """
+                               WHERE member_id = cp_user.member_id
+                            ORDER BY score DESC, score_id DESC
+                               LIMIT 1
+                   ) AS best
+             WHERE LOWER(cp_user.username) = %(username)s;
+            """,
+            {'username': username.lower()}
+            )
+
+        score = cursor.fetchone()
+
+        if not score:
+            return None
+
+        return dict(score)
+
+    def read_around(self, cursor, username, count):
+        # Get user's highest score with up to count scores ranked directly
+        # above and below it, each with its rank, or None if user has no
+        # scores
+        score = self.read_rank(cursor, username)
+
+        if not score:
+            return None
+
+        params = {'score': score['score'],
+            'score_id': score['score_id'],
+            'count': count}
+
+        # Get scores ranked directly above user's score, walking up index on
+        # score and score_id
+        cursor.execute(
+            """
+              SELECT game_score.created, game_score.score,
+                     game_score.score_id, cp_user.username
+                FROM """ + self.table + """ AS game_score, cp_user
+               WHERE (game_score.score, game_score.score_id) >
+                     (%(score)s, %(score_id)s)
+                     AND game_score.member_id = cp_user.member_id
+            ORDER BY game_score.score, game_score.score_id
+               LIMIT %(count)s;
+            """,
+            params
+            )
+
+        above = [dict(row) for row in cursor.fetchall()][::-1]
+
+        # Get scores ranked directly below user's score, walking down index
+        cursor.execute(
+            """
+              SELECT game_score.created, game_score.score,
+                     game_score.score_id, cp_user.username
+                FROM """ + self.table + """ AS game_score, cp_user
+               WHERE (game_score.score, game_score.score_id) <
+                     (%(score)s, %(score_id)s)
+                     AND game_score.member_id = cp_user.member_id
+            ORDER BY game_score.score DESC, game_score.score_id DESC
+               LIMIT %(count)s;
+            """,
+            params
+            )
+
+        below = [dict(row) for row in cursor.fetchall()]
+
+        scores = above + [score] + below
+
+        for index, neighbor in enumerate(scores):
+            neighbor['rank'] = score['rank'] - len(above) + index
+
+        return scores
+
+    def add_to_rollups(self, cursor, score_ids):
+        # Make each player's best new score their best score for the current
+        # day, week and month and for all time if it beats the player's stored
+        # best score for each window
+        cursor.execute(
+            """
+            INSERT INTO """ + self.table + """_rollup
+                        (period, period_start, period_end, member_id,
+                        score_id, score, created)
+                 SELECT DISTINCT ON (period, period_start, member_id)
+                        period, period_start, period_end, member_id,
+                        score_id, score, created
+                   FROM (
+                         SELECT period,
+                                CASE WHEN period = %(all_time)s
+                                     THEN '-infinity'
+                                     ELSE date_trunc(period,
+                                          created AT TIME ZONE 'UTC')
+                                              AT TIME ZONE 'UTC'
+                                END AS period_start,
+                                CASE WHEN period = %(all_time)s
+                                     THEN 'infinity'
+                                     ELSE (date_trunc(period,
+                                          created AT TIME ZONE 'UTC') +
+                                          ('1 ' || period)::INTERVAL)
+                                              AT TIME ZONE 'UTC'
+                                END AS period_end,
+                                member_id, score_id, score, created
+                           FROM """ + self.table + """,
+                                unnest(%(periods)s) AS period
+                          WHERE score_id = ANY(%(score_ids)s)
+                   ) AS windowed
+               ORDER BY period, period_start, member_id, score DESC,
+                        score_id DESC
+            ON CONFLICT (period, period_start, member_id) DO UPDATE
+                    SET score_id = EXCLUDED.score_id,
+                        score = EXCLUDED.score,
+                        created = EXCLUDED.created
+                  WHERE (EXCLUDED.score, EXCLUDED.score_id) >
+                        (""" + self.table + """_rollup.score,
+                        """ + self.table + """_rollup.score_id);
+            """,
+            {'periods': sorted(PERIODS.values()) + [ALL_TIME],
+            'all_time': ALL_TIME,
+            'score_ids': score_ids}
+            )
+
+    def remove_from_rollups(self, cursor, score_id):
+        # Replace deleted score in each window where it is its player's best
+        # score with the player's next best score in that window, reading only
+        # the player's scores, or remove player from window if there is none
+        cursor.execute(
+            """
+            UPDATE """ + self.table + """_rollup AS rollup
+               SET (score_id, score, created) = (
+                      SELECT score_id, score, created
+                        FROM """ + self.table + """
+                       WHERE member_id = rollup.member_id
+                             AND created >= rollup.period_start
+                             AND created < rollup.period_end
+                             AND score_id != %(score_id)s
+                    ORDER BY score DESC, score_id DESC
+                       LIMIT 1
+                   )
+             WHERE score_id = %(score_id)s
+                   AND EXISTS (
+                               SELECT 1
+                                 FROM """ + self.table + """
+                                WHERE member_id = rollup.member_id
+                                      AND created >= rollup.period_start
+                                      AND created < rollup.period_end
+                                      AND score_id != %(score_id)s
+                   );
+
+            DELETE FROM """ + self.table + """_rollup
+                  WHERE score_id = %(score_id)s;
+            """,
+            {'score_id': score_id}
+            )
+
+    def read_best_page(self, cursor, window, page):
+        # Get requested page of players' best scores in the current day, week
+        # or month, or of all time if window is None, from rollup table
+        cursor.execute(
+            """
+              SELECT rollup.created, rollup.score, rollup.score_id,
+                     cp_user.username
+                FROM """ + self.table + """_rollup AS rollup, cp_user
+               WHERE rollup.period = %(period)s
+                     AND rollup.period_start =
+                         CASE WHEN %(period)s = %(all_time)s
+                              THEN '-infinity'
+                              ELSE date_trunc(%(period)s,
+                                   now() AT TIME ZONE 'UTC')
+                                       AT TIME ZONE 'UTC'
+                         END
+                     AND rollup.member_id = cp_user.member_id
+                     AND (%(after_id)s IS NULL
+                          OR (rollup.score, rollup.score_id) <
+                             (%(after_key)s, %(after_id)s))
+            ORDER BY rollup.score DESC, rollup.score_id DESC
+               LIMIT %(limit)s
+              OFFSET %(offset)s;
+            """,
+            dict(page, period=PERIODS[window] if window else ALL_TIME,
+                all_time=ALL_TIME)
+            )
+
+        return [dict(row) for row in cursor.fetchall()]
+
+    def clear(self):
+        # Reload scores from database on next read
+        with self.lock:
+            self.keys = []
+            self.entries = []
+            self.complete = False
+            self.expires = None
+
+
+def clear_all():
+    for board in _boards:
+        board.clear()
+
+
+# Request handlers shared by the games, which differ only in the table their
+# scores are stored in; each game module passes in its own leaderboard
+def create_score(board, requester):
+    # Request should contain:
+    # score <int>
+    data = request.get_json()
+
+    # Return error if request is missing data
+    if not data or 'score' not in data:
+        return make_response('Request must contain score', 400)
+
+    # Return error if score is not an integer, including a boolean, which is a
+    # subclass of int in Python
+    if type(data['score']) is not int:
+        return make_response('Score must be an integer', 400)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor()
+
+    # Add score to database
+    cursor.execute(
+        """
+        INSERT INTO """ + board.table + """
+                    (member_id, score)
+             VALUES (%(member_id)s, %(score)s)
+          RETURNING score_id, created;
+        """,
+        {'member_id': user.read_member_id(cursor, requester),
+        'score': data['score']}
+        )
+
+    score_id, created = cursor.fetchone()
+
+    # Update player's best scores for the current day, week and month and for
+    # all time
+    board.add_to_rollups(cursor, [score_id])
+
+    conn.commit()
+
+    cursor.close()
+    db.put_conn(conn)
+
+    board.add({'created': created,
+        'score': data['score'],
+        'score_id': score_id,
+        'username': requester})
+
+    return make_response(str(score_id), 201)
+
+
+def create_scores(board, requester):
+    # Request should contain:
+    # scores <list of int>
+    data = request.get_json()
+
+    scores = data.get('scores') if isinstance(data, dict) else None
+
+    # Return error if request is missing data
+    if not isinstance(scores, list) or not scores:
+        return make_response('Request must contain scores', 400)
+
+    # Return error if a score is not an integer, including booleans, which
+    # are a subclass of int in Python
+    if not all(type(score) is int for score in scores):
+        return make_response('Scores must be integers', 400)
+
+    # Return error if request contains more scores than can be posted at once
+    if len(scores) > int(os.environ.get('SCORE_BATCH_SIZE', 100)):
+        return make_response('Too many scores', 400)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor()
+
+    member_id = user.read_member_id(cursor, requester)
+
+    # Add all scores to database in one insert, taking score ids in the order
+    # the scores were sent; RETURNING rows come back in no particular order,
+    # so rows are sorted by score id, which is assigned in insert order
+    cursor.execute(
+        """
+          WITH inserted AS (
+               INSERT INTO """ + board.table + """
+                           (member_id, score)
+                    SELECT %(member_id)s, batch.score
+                      FROM unnest(%(scores)s::INT[])
+                           WITH ORDINALITY AS batch(score, position)
+                  ORDER BY batch.position
+                 RETURNING score_id, created, score
+          )
+        SELECT score_id, created, score
+          FROM inserted
+      ORDER BY score_id;
+        """,
+        {'member_id': member_id,
+        'scores': scores}
+        )
+
+    rows = cursor.fetchall()
+
+    # Update player's best scores for the current day, week and month and for
+    # all time once for the whole batch
+    board.add_to_rollups(cursor, [row[0] for row in rows])
+
+    conn.commit()
+
+    cursor.close()
+    db.put_conn(conn)
+
+    board.add_all([{'created': row[1],
+        'score': row[2],
+        'score_id': row[0],
+        'username': requester} for row in rows])
+
+    return make_response(jsonify([row[0] for row in rows]), 201)
+
+
+def read_score(board, score_id):
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+
+    # Retrieve score from database
+    cursor.execute(
+        """
+        SELECT game_score.created, game_score.score, game_score.score_id,
+               cp_user.username
+          FROM """ + board.table + """ AS game_score, cp_user
+         WHERE score_id = %(score_id)s
+               AND game_score.member_id = cp_user.member_id;
+        """,
+        {'score_id': score_id}
+        )
+
+    score = cursor.fetchone()
+
+    cursor.close()
+    db.put_conn(conn)
+
+    # Return error if score not found
+    if not score:
+        return make_response('Not found', 404)
+
+    # Otherwise, convert score to dictionary
+    score = dict(score)
+
+    return jsonify(score)
+
+
+def delete_score(board, requester, score_id):
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+
+    # Get score from database
+    cursor.execute(
+        """
+        SELECT game_score.*, cp_user.username
+          FROM """ + board.table + """ AS game_score, cp_user
+         WHERE score_id = %(score_id)s
+               AND game_score.member_id = cp_user.member_id;
+        """,
+        {'score_id': score_id}
+        )
+
+    score = cursor.fetchone()
+
+    # Return error if score not found
+    if not score:
+        cursor.close()
+        db.put_conn(conn)
+
+        return make_response('Not found', 404)
+
+    # Otherwise, convert score to dictionary
+    score = dict(score)
+
+    # Return error if requester is not the player
+    if requester.lower() != score['username'].lower():
+        cursor.close()
+        db.put_conn(conn)
+
+        return make_response('Unauthorized', 401)
+
+    # Delete score from database
+    cursor.execute(
+        """
+        DELETE FROM """ + board.table + """
+              WHERE score_id = %(score_id)s;
+        """,
+        {'score_id': score_id}
+        )
+
+    # Replace score wherever it was player's best score for a time window
+    board.remove_from_rollups(cursor, score['score_id'])
+
+    conn.commit()
+
+    cursor.close()
+    db.put_conn(conn)
+
+    board.remove(score['score_id'])
+
+    return make_response('Success', 200)
+
+
+def read_scores(board):
+    # Get requested page of scores from query parameters
+    page, error = pagination.read_page(5, 'int')
+
+    if error:
+        return error
+
+    # Get time window to limit leaderboard to and whether to show only each
+    # player's best score from query parameters; a time window always shows
+    # each player's best score in the window
+    window = request.args.get('window')
+    distinct = request.args.get('distinct')
+
+    # Return error if window query parameter is not a known window
+    if window is not None and window not in PERIODS:
+        return make_response(
+            'Window param must be daily, weekly or monthly', 400
+            )
+
+    # Return error if distinct query parameter is not player
+    if distinct is not None and distinct != 'player':
+        return make_response('Distinct param must be player', 400)
+
+    best_only = bool(window or distinct)
+
+    # Serve page from in-memory high scores without querying the database if
+    # they hold every score on the page
+    scores = None if best_only else board.read_page(page)
+
+    if scores is not None:
+        scores, next_cursor = pagination.split_page(
+            scores, page, 'score', 'score_id'
+            )
+
+        return pagination.page_response(scores, page, next_cursor)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+
+    # Get requested page of players' best scores in current time window or of
+    # all time
+    if best_only:
+        scores = board.read_best_page(cursor, window, page)
+
+    # Otherwise, reload high scores if they have expired and try them again
+    elif board.is_expired():
+        board.load(cursor)
+
+        scores = board.read_page(page)
+
+    if scores is None:
+        # Get requested page of game scores, sorted by highest to lowest score
+        cursor.execute(
+            """
+              SELECT game_score.created, game_score.score,
+                     game_score.score_id, cp_user.username
+                FROM """ + board.table + """ AS game_score, cp_user
+               WHERE game_score.member_id = cp_user.member_id
+                     AND (%(after_id)s IS NULL
+                          OR (game_score.score, game_score.score_id) <
+                             (%(after_key)s, %(after_id)s))
+            ORDER BY game_score.score DESC, game_score.score_id DESC
+               LIMIT %(limit)s
+              OFFSET %(offset)s;
+            """,
+            page
+            )
+
+        scores = []
+
+        for row in cursor.fetchall():
+            scores.append(dict(row))
+
+    scores, next_cursor = pagination.split_page(
+        scores, page, 'score', 'score_id'
+        )
+
+    cursor.close()
+    db.put_conn(conn)
+
+    return pagination.page_response(scores, page, next_cursor)
+
+
+def read_scores_for_one_user(board, player_name):
+    # Get requested page of scores from query parameters
+    page, error = pagination.read_page(5, 'int')
+
+    if error:
+        return error
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+
+    # Get requested page of game scores, sorted by highest to lowest score
+    cursor.execute(
+        """
+          SELECT game_score.created, game_score.score, game_score.score_id,
+                 cp_user.username
+            FROM """ + board.table + """ AS game_score, cp_user
+           WHERE LOWER(cp_user.username) = %(username)s
+                 AND game_score.member_id = cp_user.member_id
+                 AND (%(after_id)s IS NULL
+                      OR (game_score.score, game_score.score_id) <
+                         (%(after_key)s, %(after_id)s))
+        ORDER BY game_score.score DESC, game_score.score_id DESC
+           LIMIT %(limit)s
+          OFFSET %(offset)s;
+        """,
+        dict(page, username=player_name.lower())
+        )
+
+    scores = []
+
+    for row in cursor.fetchall():
+        scores.append(dict(row))
+
+    scores, next_cursor = pagination.split_page(
+        scores, page, 'score', 'score_id'
+        )
+
+    cursor.close()
+    db.put_conn(conn)
+
+    return pagination.page_response(scores, page, next_cursor)
+
+
+def read_rank(board, player_name):
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+
+    # Get player's high score and its rank on leaderboard
+    score = board.read_rank(cursor, player_name)
+
+    cursor.close()
+    db.put_conn(conn)
+
+    # Return error if player has no scores
+    if not score:
+        return make_response('Not found', 404)
+
+    return jsonify(score)
+
+
+def read_scores_around(board, player_name):
+    # Get number of scores to include above and below player's high score from
+    # query parameters
+    try:
+        count = int(request.args.get('count', 5))
+    except ValueError:
+        return make_response('Count param must be between 0 and 50', 400)
+
+    # Return error if count query parameter is out of range
+    if count < 0 or count > 50:
+        return make_response('Count param must be between 0 and 50', 400)
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor(cursor_factory=pg.extras.DictCursor)
+
+    # Get player's high score and the scores ranked around it
+    scores = board.read_around(cursor, player_name, count)
+
+    cursor.close()
+    db.put_conn(conn)
+
+    # Return error if player has no scores
+    if scores is None:
+        return make_response('Not found', 404)
+
+    return jsonify(scores)
@@ -0,0 +1,165 @@
+import json
+import re
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from datetime import datetime
+from flask import jsonify, make_response, request
+from uuid import UUID
+
+
+# Format of integer ids in cursors, which are sent as strings
+INT_ID_PATTERN = re.compile(r'-?[0-9]{1,19}')
+
+# Format of hexadecimal drawing ids in cursors
+HEX_ID_PATTERN = re.compile(r'[0-9a-f]{16}')
+
+
+def read_page(default_size, key_type='timestamp', id_type='int'):
+    # Get requested page from query parameters; clients either send start and
+    # end offsets or an opaque cursor (empty for the first page) and optional
+    # limit for keyset pagination; key_type and id_type are the types of the
+    # route's sort key and id, which cursors must match
+    cursor = request.args.get('cursor')
+
+    if cursor is None:
+        # Return error if start or end query parameter is not an integer
+        try:
+            request_start = int(request.args.get('start', 0))
+            request_end = int(
+                request.args.get('end', request_start + default_size)
+                )
+        except ValueError:
+            return None, make_response(
+                'Start and end params must be integers', 400
+                )
+
+        # Return error if start or end query parameter is negative, which
+        # the query's OFFSET and LIMIT do not accept
+        if request_start < 0 or request_end < 0:
+            return None, make_response(
+                'Start and end params cannot be negative', 400
+                )
+
+        # Return error if start query parameter is greater than end
+        if request_start > request_end:
+            return None, make_response(
+                'Start param cannot be greater than end', 400
+                )
+
+        return {'cursor': False,
+            'size': request_end - request_start,
+            'limit': request_end - request_start,
+            'offset': request_start,
+            'after_key': None,
+            'after_id': None}, None
+
+    # Return error if limit query parameter is not an integer
+    try:
+        size = int(request.args.get('limit', default_size))
+    except ValueError:
+        return None, make_response('Limit param must be an integer', 400)
+
+    # Return error if limit query parameter is negative
+    if size < 0:
+        return None, make_response('Limit param cannot be negative', 400)
+
+    after_key = None
+    after_id = None
+
+    # Decode sort key and id of last item on previous page from cursor
+    if cursor:
+        try:
+            after_key, after_id = json.loads(
+                urlsafe_b64decode(cursor.encode()).decode()
+                )
+        except (DecodeError, TypeError, UnicodeDecodeError, ValueError):
+            return None, make_response('Invalid cursor', 400)
+
+        # Return error if cursor holds values of the wrong type, which would
+        # otherwise fail in the route's query
+        if not is_valid_key(after_key, key_type):
+            return None, make_response('Invalid cursor', 400)
+
+        if not is_valid_id(after_id, id_type):
+            return None, make_response('Invalid cursor', 400)
+
+    # Fetch one extra row to find out if there is a next page
+    return {'cursor': True,
+        'size': size,
+        'limit': size + 1,
+        'offset': 0,
+        'after_key': after_key,
+        'after_id': after_id}, None
+
+
+def is_valid_key(value, key_type):
+    # Check that sort key decoded from cursor is an integer or an ISO 8601
+    # timestamp, as written by split_page
+    if key_type == 'int':
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    if not isinstance(value, str):
+        return False
+
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return False
+
+    return True
+
+
+def is_valid_id(value, id_type):
+    # Check that id decoded from cursor is a string holding a 64-bit integer,
+    # a UUID or a hexadecimal drawing id, as written by split_page
+    if not isinstance(value, str):
+        return False
+
+    if id_type == 'uuid':
+        try:
+            UUID(value)
+        except ValueError:
+            return False
+
+        return True
+
+    if id_type == 'hex':
+        return bool(HEX_ID_PATTERN.fullmatch(value))
+
+    return (bool(INT_ID_PATTERN.fullmatch(value)) and
+        -(1 << 63) <= int(value) < 1 << 63)
+
+
+def split_page(rows, page, key, id_key):
+    # Drop extra row fetched for keyset pagination and encode sort key and id
+    # of last row on page as cursor for the next page
+    if not page['cursor'] or len(rows) <= page['size']:
+        return rows, None
+
+    rows = rows[:page['size']]
+
+    if not rows:
+        return rows, None
+
+    after_key = rows[-1][key]
+
+    # Keep timestamps at full precision so that rows created within the same
+    # millisecond are not skipped
+    if isinstance(after_key, datetime):
+        after_key = after_key.isoformat()
+
+    next_cursor = urlsafe_b64encode(
+        json.dumps([after_key, str(rows[-1][id_key])]).encode()
+        ).decode()
+
+    return rows, next_cursor
+
+
+def page_response(items, page, next_cursor):
+    # Send items as a plain list for start/end pagination, or with the cursor
+    # for the next page for keyset pagination
+    if not page['cursor']:
+        return jsonify(items)
+
+    return jsonify({'items': items, 'next_cursor': next_cursor})
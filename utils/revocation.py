@@ -0,0 +1,105 @@
+import os
+import threading
+
+from hashlib import sha256
+from time import time
+
+from utils import db
+
+
+# Bloom filter of usernames whose bearer tokens were revoked within the token
+# lifetime, refreshed from the database every REVOCATION_REFRESH_INTERVAL
+# seconds; a username in the filter may be a false positive, so callers check
+# the account in the database before rejecting its token
+
+TOKEN_LIFETIME = 60 * 60  # Seconds a bearer token is valid after it is issued
+HASH_COUNT = 7  # Bit positions set in filter for each username
+BITS_PER_USERNAME = 10  # Filter bits per revoked username (~1% false hits)
+
+_size = 1024  # Number of bits in filter
+_bits = bytearray(_size // 8)
+_refreshed = None  # Time of last refresh from the database
+_lock = threading.Lock()
+
+
+def _positions(username, size):
+    # Get filter bit positions for username from slices of its hash
+    digest = sha256(username.encode()).digest()
+
+    return [int.from_bytes(digest[i * 4:i * 4 + 4], 'big') % size
+        for i in range(HASH_COUNT)]
+
+
+def _add(username):
+    for position in _positions(username, _size):
+        _bits[position // 8] |= 1 << position % 8
+
+
+def might_be_revoked(username):
+    # Refresh filter if other workers may have revoked tokens since last
+    # refresh
+    interval = float(os.environ.get('REVOCATION_REFRESH_INTERVAL', 30))
+
+    if _refreshed is None or time() - _refreshed >= interval:
+        refresh()
+
+    with _lock:
+        return all(_bits[position // 8] & 1 << position % 8
+            for position in _positions(username.lower(), _size))
+
+
+def revoke(cursor, username):
+    # Record revocation in requester's transaction and add username to this
+    # worker's filter right away; revocation time is taken from this server's
+    # clock, which also sets the issue time of tokens, so that tokens issued
+    # before the revocation are rejected and tokens issued after it are not
+    cursor.execute(
+        """
+        INSERT INTO revoked_user (username, revoked)
+             VALUES (%(username)s, to_timestamp(%(revoked)s))
+        ON CONFLICT (username) DO UPDATE
+                SET revoked = EXCLUDED.revoked;
+
+        DELETE FROM revoked_user
+              WHERE revoked <= now() - %(lifetime)s * INTERVAL '1 second';
+        """,
+        {'username': username.lower(),
+        'revoked': time(),
+        'lifetime': TOKEN_LIFETIME}
+        )
+
+    with _lock:
+        _add(username.lower())
+
+
+def refresh():
+    global _bits, _refreshed, _size
+
+    # Borrow database connection from pool
+    conn = db.get_conn()
+
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        SELECT username
+          FROM revoked_user
+         WHERE revoked > now() - %(lifetime)s * INTERVAL '1 second';
+        """,
+        {'lifetime': TOKEN_LIFETIME}
+        )
+
+    usernames = [row[0] for row in cursor.fetchall()]
+
+    cursor.close()
+    db.put_conn(conn)
+
+    # Rebuild filter sized for current revocations
+    with _lock:
+        _size = max(1024, len(usernames) * BITS_PER_USERNAME)
+        _bits = bytearray((_size + 7) // 8)
+
+        for username in usernames:
+            _add(username)
+
+        _refreshed = time()
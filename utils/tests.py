@@ -9,6 +9,8 @@ import unittest
 from base64 import b64encode
 from server import app
 from testing.common.database import DatabaseFactory
+from user import user
+from utils import db, leaderboard, view_counter
 
 import management
 
@@ -94,9 +96,9 @@ def initialize_test_database(postgresql):
     cursor.execute(
         """
         INSERT INTO post_content
-                    (content, created, post_id, public, title)
+                    (content, created, post_id, public, title, version)
              VALUES (%(content)s, %(created)s, %(post_id)s, %(public)s,
-                    %(title)s);
+                    %(title)s, 2);
         """,
         {'content': post['content'],
         'created': post['modified'],
@@ -108,7 +110,7 @@ def initialize_test_database(postgresql):
     cursor.execute(
         """
         UPDATE post
-           SET modified = %(modified)s
+           SET modified = %(modified)s, version = 2
          WHERE post_id = %(post_id)s;
         """,
         {'modified': post['modified'],
@@ -156,8 +158,8 @@ def initialize_test_database(postgresql):
     cursor.execute(
         """
         INSERT INTO comment_content
-                    (comment_id, content, created)
-             VALUES (%(comment_id)s, %(content)s, %(created)s);
+                    (comment_id, content, created, version)
+             VALUES (%(comment_id)s, %(content)s, %(created)s, 2);
         """,
         {'comment_id': 1,
         'content': comment['content'],
@@ -167,7 +169,7 @@ def initialize_test_database(postgresql):
     cursor.execute(
         """
         UPDATE comment
-           SET modified = %(modified)s
+           SET modified = %(modified)s, version = 2
          WHERE comment_id = %(comment_id)s;
         """,
         {'modified': comment['modified'],
@@ -190,7 +192,7 @@ def initialize_test_database(postgresql):
                           WHERE LOWER(username) = %(username)s),
                         %(title)s, %(url)s);
             """,
-            {'drawing_id': str(i),
+            {'drawing_id': i,
             'username': 'user1',
             'title': drawing['title'],
             'url': drawing['url']}
@@ -209,11 +211,12 @@ def initialize_test_database(postgresql):
                  );
             """,
             {'username': 'user1',
-            'drawing_id': str(i)}
+            'drawing_id': i}
             )
 
-    # Add 10 likes for one drawing to database
-    for id in range(1, 11):
+    # Add likes from the other 9 users for one drawing that user1 already
+    # liked, so that drawing has 10 likes
+    for id in range(2, 11):
         username = 'user' + str(id)
 
         cursor.execute(
@@ -228,7 +231,7 @@ def initialize_test_database(postgresql):
                  );
             """,
             {'username': username.lower(),
-            'drawing_id': str(1)}
+            'drawing_id': 1}
             )
 
     # Add 5 sample Shapes in Rain scores to database
@@ -273,6 +276,22 @@ def initialize_test_database(postgresql):
             'score': rhythm_score['score']}
             )
 
+    # Record each player's best sample scores as their all-time best scores,
+    # which create_score keeps up to date for scores posted through the API
+    for table in ['rhythm_score', 'shapes_score']:
+        cursor.execute(
+            """
+            INSERT INTO """ + table + """_rollup
+                        (period, period_start, period_end, member_id,
+                        score_id, score, created)
+                 SELECT DISTINCT ON (member_id)
+                        'all', '-infinity', 'infinity', member_id, score_id,
+                        score, created
+                   FROM """ + table + """
+               ORDER BY member_id, score DESC, score_id DESC;
+            """
+            )
+
     # Create owner user and 10 homepage posts
     cursor.execute(
         """
@@ -323,9 +342,9 @@ def initialize_test_database(postgresql):
     cursor.execute(
         """
         INSERT INTO post_content
-                    (content, created, post_id, public, title)
+                    (content, created, post_id, public, title, version)
              VALUES (%(content)s, %(created)s, %(post_id)s, %(public)s,
-                    %(title)s);
+                    %(title)s, 2);
         """,
         {'content': post['content'],
         'created': post['modified'],
@@ -337,7 +356,7 @@ def initialize_test_database(postgresql):
     cursor.execute(
         """
         UPDATE post
-           SET modified = %(modified)s
+           SET modified = %(modified)s, version = 2
          WHERE post_id = %(post_id)s;
         """,
         {'modified': post['modified'],
@@ -378,6 +397,12 @@ class CrystalPrismTestCase(unittest.TestCase):
     def tearDown(self):
         self.delete_user()
         self.delete_admin_user()
+        view_counter.flush_views()
+        view_counter.clear_known()
+        user.status_cache.clear()
+        user.member_id_cache.clear()
+        leaderboard.clear_all()
+        db.close_pool()
         self.postgresql.stop()
 
     # Create test user
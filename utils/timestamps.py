@@ -0,0 +1,21 @@
+from datetime import datetime, timezone
+from flask.json import JSONEncoder
+
+
+def format_timestamp(timestamp):
+    # Format timestamp as UTC ISO 8601 string with millisecond precision (e.g.,
+    # "2017-10-06T20:34:20.490Z")
+    timestamp = timestamp.astimezone(timezone.utc)
+
+    return (timestamp.strftime('%Y-%m-%dT%H:%M:%S.') +
+        '{:03d}Z'.format(timestamp.microsecond // 1000))
+
+
+class TimestampJSONEncoder(JSONEncoder):
+    # Send database timestamps to clients in the API's ISO 8601 format rather
+    # than Flask's default HTTP date format
+    def default(self, o):
+        if isinstance(o, datetime):
+            return format_timestamp(o)
+
+        return super().default(o)
@@ -0,0 +1,150 @@
+import atexit
+import logging
+import os
+import psycopg2 as pg
+import psycopg2.extras
+import threading
+
+from utils import cache, db
+
+
+logger = logging.getLogger(__name__)
+
+_pending = {}  # Unflushed view counts by drawing id
+_lock = threading.Lock()
+_wake = threading.Event()  # Set to flush before the interval elapses
+_flusher_pid = None
+
+# Drawing ids this worker has confirmed exist, so that views of a drawing are
+# not checked against the database every time; a drawing deleted by another
+# worker is seen within KNOWN_DRAWING_CACHE_TTL seconds, or at the next flush
+# if it has buffered views
+_known = cache.TTLCache(
+    int(os.environ.get('KNOWN_DRAWING_CACHE_SIZE', 10000)),
+    float(os.environ.get('KNOWN_DRAWING_CACHE_TTL', 60))
+    )
+
+
+def is_known(drawing_id):
+    return _known.get(drawing_id, False)
+
+
+def record_view(drawing_id):
+    _start_flusher()
+
+    # Buffer view in memory for the next batched flush to the database
+    with _lock:
+        _pending[drawing_id] = _pending.get(drawing_id, 0) + 1
+
+        _known.set(drawing_id, True)
+
+        # Flush early if many drawings have views waiting
+        if len(_pending) >= int(os.environ.get('VIEW_BUFFER_SIZE', 1000)):
+            _wake.set()
+
+
+def pending_views(drawing_id):
+    return _pending.get(drawing_id, 0)
+
+
+def forget(drawing_id):
+    # Drop buffered views for a deleted drawing
+    with _lock:
+        _pending.pop(drawing_id, None)
+        _known.invalidate(drawing_id)
+
+
+def clear_known():
+    _known.clear()
+
+
+def flush_views():
+    with _lock:
+        if not _pending:
+            return 0
+
+        # Sort by drawing id so concurrent flushes from different workers
+        # lock rows in the same order
+        views = sorted(_pending.items())
+        _pending.clear()
+
+    conn = None
+
+    try:
+        conn = db.get_conn()
+
+        cursor = conn.cursor()
+
+        # Add buffered views to each drawing's stored views in one statement,
+        # getting ids of drawings that still exist
+        updated_ids = pg.extras.execute_values(
+            cursor,
+            """
+                UPDATE drawing
+                   SET views = drawing.views + flushed.views
+                  FROM (VALUES %s) AS flushed (drawing_id, views)
+                 WHERE drawing.drawing_id = flushed.drawing_id
+             RETURNING drawing.drawing_id;
+            """,
+            views,
+            page_size=len(views),
+            fetch=True
+            )
+
+        conn.commit()
+
+        cursor.close()
+        db.put_conn(conn)
+
+        # Stop treating drawings deleted by other workers as existing
+        updated_ids = set(row[0] for row in updated_ids)
+
+        for drawing_id, count in views:
+            if drawing_id not in updated_ids:
+                _known.invalidate(drawing_id)
+
+    except pg.Error:
+        logger.exception('Failed to flush %s drawing views', len(views))
+
+        if conn is not None:
+            db.put_conn(conn)
+
+        # Put views back in buffer to retry on next flush
+        with _lock:
+            for drawing_id, count in views:
+                _pending[drawing_id] = _pending.get(drawing_id, 0) + count
+
+        return 0
+
+    return len(views)
+
+
+def _flush_periodically():
+    while True:
+        _wake.wait(float(os.environ.get('VIEW_FLUSH_INTERVAL', 10)))
+        _wake.clear()
+
+        flush_views()
+
+
+def _start_flusher():
+    global _flusher_pid
+
+    if _flusher_pid == os.getpid():
+        return
+
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+
+        # Views buffered before a fork belong to the parent process, which
+        # flushes them itself
+        if _flusher_pid is not None:
+            _pending.clear()
+
+        _flusher_pid = os.getpid()
+
+        threading.Thread(target=_flush_periodically, daemon=True).start()
+
+
+atexit.register(flush_views)